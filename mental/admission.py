@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+准入控制与过载保护（ASGI中间件）
+核心功能：
+- 按路由限制并发：超出并发上限的请求进入有界等待队列，队列满时立即返回 503
+- 等待期限：排队超过期限仍未获得名额的请求返回 503，避免无意义地等到60秒超时
+- CoDel 风格的排队时间控制：队列持续非空超过 interval（形成"常驻队列"）时，
+  新请求的等待期限从 queue_timeout 缩短为 target_delay，尽早拒绝而不是让所有人一起变慢；
+  队列一旦清空即恢复正常期限
+- 503 响应携带 Retry-After（按平均处理耗时和当前排队长度估算）
+- 统计：准入数、排队数、拒绝数（队列满 / 等待超时），供 /metrics 与 /health 查看
+说明：流式响应（SSE）在整个响应体发送完毕后才释放名额，并发上限即真实的上游并发上限
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+class AdmissionRejected(Exception):
+    """请求未获准入"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    单个路由的准入闸门
+    :param limit: 最大并发数
+    :param queue_size: 最大排队数
+    :param queue_timeout: 正常情况下的最长排队时间（秒）
+    :param target_delay: 出现常驻队列后的最长排队时间（秒，CoDel的target）
+    :param interval: 队列持续非空多久视为常驻队列（秒，CoDel的interval）
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float = 10.0,
+                 target_delay: float = 0.5, interval: float = 1.0):
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self.target_delay = target_delay
+        self.interval = interval
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._queue_empty_since = time.monotonic()  # 队列最近一次为空的时刻
+        self._avg_service_time = 0.0  # 处理耗时的指数移动平均（用于估算Retry-After）
+
+        # 统计信息
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.total_queue_wait = 0.0
+
+    # ==================== 内部工具 ====================
+    def _standing_queue(self, now: float) -> bool:
+        """队列持续非空超过interval，说明到达速率持续高于处理速率"""
+        return bool(self._waiters) and now - self._queue_empty_since >= self.interval
+
+    def _retry_after(self) -> int:
+        """估算客户端应等待的秒数：排在前面的请求按并发数分批处理所需时间"""
+        batches = (len(self._waiters) + self.in_flight) / self.limit
+        return min(30, max(1, math.ceil(batches * (self._avg_service_time or 1.0))))
+
+    def _discard(self, waiter: asyncio.Future):
+        """移除放弃等待的请求（队列长度有上限，线性删除可接受）"""
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        if not self._waiters:
+            self._queue_empty_since = time.monotonic()
+
+    def _wake_next(self):
+        """把释放出的名额交给队首仍在等待的请求"""
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        if not self._waiters:
+            self._queue_empty_since = time.monotonic()
+
+    # ==================== 对外接口 ====================
+    async def acquire(self) -> float:
+        """获取名额，返回排队耗时（秒）；未获准入时抛出 AdmissionRejected"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if len(self._waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            raise AdmissionRejected("queue_full", self._retry_after())
+
+        now = time.monotonic()
+        if not self._waiters:
+            self._queue_empty_since = now
+        timeout = self.target_delay if self._standing_queue(now) else self.queue_timeout
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 超时的同时恰好拿到名额：照常放行
+                pass
+            else:
+                self._discard(waiter)
+                self.shed_timeout += 1
+                raise AdmissionRejected("queue_timeout", self._retry_after())
+        except asyncio.CancelledError:
+            # 客户端断开：已分配的名额要还回去
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self._discard(waiter)
+            raise
+        waited = time.monotonic() - now
+        self.admitted += 1
+        self.total_queue_wait += waited
+        return waited
+
+    def release(self, service_time: float):
+        """释放名额并记录处理耗时"""
+        self.in_flight -= 1
+        if service_time > 0:
+            self._avg_service_time = service_time if not self._avg_service_time \
+                else 0.9 * self._avg_service_time + 0.1 * service_time
+        self._wake_next()
+
+    def stats(self) -> Dict[str, Any]:
+        waited = self.queued - self.shed_timeout
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_queue_wait_ms": round(self.total_queue_wait / waited * 1000, 1) if waited > 0 else 0.0,
+            "avg_service_time_ms": round(self._avg_service_time * 1000, 1)
+        }
+
+
+class AdmissionController:
+    """
+    准入控制器：按路由路径管理闸门（未配置的路由不受限制）
+    :param routes: {路径: (并发上限, 排队上限)}
+    """
+
+    def __init__(self, routes: Dict[str, Tuple[int, int]], queue_timeout: float = 10.0,
+                 target_delay: float = 0.5, interval: float = 1.0):
+        self.gates: Dict[str, AdmissionGate] = {
+            path: AdmissionGate(limit, queue_size, queue_timeout, target_delay, interval)
+            for path, (limit, queue_size) in routes.items()
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["AdmissionController"]:
+        """根据 ADMISSION_CONFIG 创建控制器（未启用时返回None）"""
+        if not config.get("enabled"):
+            return None
+        return cls(parse_route_limits(config["routes"]), config["queue_timeout"],
+                   config["target_delay"], config["interval"])
+
+    def gate_for(self, path: str) -> Optional[AdmissionGate]:
+        return self.gates.get(path)
+
+    def stats(self) -> Dict[str, Any]:
+        routes = {path: gate.stats() for path, gate in self.gates.items()}
+        return {
+            "admitted": sum(r["admitted"] for r in routes.values()),
+            "queued": sum(r["queued"] for r in routes.values()),
+            "shed": sum(r["shed_queue_full"] + r["shed_timeout"] for r in routes.values()),
+            "routes": routes
+        }
+
+
+def parse_route_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """解析路由限制配置 "/chat=32:64,/chat/stream=64:128"（路径=并发上限:排队上限）"""
+    routes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        path, _, limits = item.partition("=")
+        limit, _, queue_size = limits.partition(":")
+        routes[path.strip()] = (int(limit), int(queue_size or limit))
+    return routes
+
+
+class AdmissionMiddleware:
+    """
+    准入控制ASGI中间件（纯ASGI实现，不缓冲流式响应）
+    用法：app.add_middleware(AdmissionMiddleware, controller=controller)
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        gate = self.controller.gate_for(scope.get("path", "")) if scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await gate.acquire()
+        except AdmissionRejected as rejected:
+            await self._reject(send, rejected)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.monotonic() - start)
+
+    @staticmethod
+    async def _reject(send, rejected: AdmissionRejected):
+        """返回503（格式与全局异常处理器一致）"""
+        message = "请求排队已满" if rejected.reason == "queue_full" else "请求排队超时"
+        body = json.dumps({
+            "error": "服务繁忙，请稍后重试",
+            "status_code": 503,
+            "message": message,
+            "timestamp": datetime.now().isoformat()
+        }, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejected.retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,43 +1,87 @@
 import json
+import hmac
+import functools
+import re
 import ssl
+import asyncio
+import base64
+import time
 import uuid
 from datetime import datetime
 import os
-from typing import Optional, AsyncGenerator, Dict, Any, List
+from typing import Optional, AsyncGenerator, AsyncIterator, Dict, Any, List, Tuple
 from contextlib import asynccontextmanager
 
 import requests
 from fastapi import FastAPI, HTTPException, Query, Path, Depends, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from requests.adapters import HTTPAdapter
 from urllib3.poolmanager import PoolManager
 
 # 假设从配置模块导入服务器配置
-from config import SERVER_CONFIG
+from config import SERVER_CONFIG, VOICE_CONFIG, SESSION_CONFIG, SESSION_JOURNAL_CONFIG, SESSION_TOKEN_CONFIG, ADMISSION_CONFIG, PRIORITY_CONFIG, BULKHEAD_CONFIG, DRAIN_CONFIG, STARTUP_CONFIG, LOG_CONFIG, TTS_CACHE_CONFIG, TTS_LONG_TEXT_CONFIG, TTS_BATCH_CONFIG, TTS_JOB_CONFIG, TTS_PRESYNTH_CONFIG, VOICE_CATALOG_CONFIG, TTS_STREAM_CONFIG
 import logging
+from structured_logging import setup_logging, AccessLogMiddleware
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()]
-)
+# 配置日志（请求线程只入队，格式化与写入由后台线程完成）
+logging_runtime = setup_logging(LOG_CONFIG)
 logger = logging.getLogger("api_server")
 
 # 假设从coze客户端模块导入
-from coze_api_client import CozeAPIClient
+from coze_api_client import CozeAPIClient, FALLBACK_REPLY
 from coze_tts_client import CozeTTSClient  # 新增TTS客户端导入
 
 # 从coze_tts_client获取默认voice_id（使用测试代码中的默认值）
 from coze_tts_client import TEST_VOICE_ID  # 新增导入默认音色ID
+from coze_tts_client import emotion_tag_to_tts  # 情绪标签 -> 语音情感映射
+from coze_tts_client import AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT, VALID_SAMPLE_RATES  # 输出格式与采样率
+
+# 客户端延迟构建（情绪分析器依赖的cozepy导入约0.3秒，推迟到构建时再导入）
+from lazy_clients import LazyClients
+
+# 有界会话存储（LRU + TTL）
+from session_store import create_session_store
+from session_journal import SessionJournal
+from session_token import create_token_codec, SessionClaims, SessionTokenError
+
+# 准入控制（按路由限制并发 + 过载时503）
+from admission import AdmissionController, AdmissionMiddleware
+# 舱壁隔离（聊天/TTS/情绪分析各自独立的有界线程池）
+from bulkhead import create_bulkheads, Bulkhead, BulkheadError
+# 上游错误类型（按类型映射HTTP状态码）
+from upstream_errors import UpstreamError
+# 优雅停机：排空进行中的请求
+from drain import DrainController, DrainMiddleware
+# 上游优先级调度（实时对话优先于批量任务）
+from upstream_scheduler import PriorityMiddleware, create_priority_scheduler, priority_routes, route_costs, user_headers
 
-# 新增：导入情绪分析功能
-from coze_emotiontag import EmotionAnalyzer
+# TTS音频缓存（内存LRU + 磁盘）
+from tts_cache import create_tts_cache, cache_key, content_etag
+# 音频的ETag条件请求与Range范围请求
+from audio_http import audio_response, file_response, negotiate_audio_format
+# 批量TTS的流式zip/multipart输出
+from audio_archive import create_archive_writer
+# 异步TTS任务队列
+from tts_jobs import TTSJobQueue, TTSJob, JobQueueFull
+# 常用短语预合成
+from tts_presynth import PhrasePresynthesizer, load_phrase_manifest
+# 新增：音色目录（本地校验音色与情感）
+from voice_catalog import VoiceCatalog
+# 新增：TTS音频异步直通（aiohttp，可选）
+from tts_stream import create_tts_streamer
+# 语音流水线：流式分句 + 有序并发TTS
+from voice_pipeline import SentenceSplitter, OrderedTTSPipeline, SynthesizedSegment, TTS_MAX_INPUT_BYTES, split_long_text, iter_ordered_synthesis
 
 # 全局应用状态存储
 app_state: Dict[str, Any] = {}
 
+def _create_emotion_analyzer():
+    """构建情绪分析器（延迟导入cozepy）"""
+    from coze_emotiontag import EmotionAnalyzer
+    return EmotionAnalyzer()
+
 # ==================== 应用生命周期管理 ====================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -45,34 +89,90 @@ async def lifespan(app: FastAPI):
     logger.info("正在初始化Coze聊天机器人API服务器...")
     
     try:
-        # 初始化Coze聊天客户端
-        coze_chat_client = CozeAPIClient(debug=SERVER_CONFIG.get("debug", False))
-        
-        # 初始化Coze TTS客户端
-        coze_tts_client = CozeTTSClient(debug=SERVER_CONFIG.get("debug", False))
-        
-        # 新增：初始化情绪分析器
-        emotion_analyzer = EmotionAnalyzer()
+        startup_start = time.monotonic()
+        # 上游客户端（聊天/TTS/情绪分析）延迟构建：构建完成后写入app_state，处理函数通过 _client() 获取
+        clients = LazyClients({
+            "coze_chat_client": lambda: CozeAPIClient(debug=SERVER_CONFIG.get("debug", False)),
+            "coze_tts_client": lambda: CozeTTSClient(debug=SERVER_CONFIG.get("debug", False)),
+            "emotion_analyzer": _create_emotion_analyzer
+        }, app_state)
+        app_state["clients"] = clients
+        if STARTUP_CONFIG["eager_init"]:
+            await clients.wait()  # 三个客户端并行构建，任一失败则启动失败
+        elif STARTUP_CONFIG["warmup"]:
+            clients.warm()
+        app_state["session_store"] = create_session_store(SESSION_CONFIG)  # session_id <-> conversation_id 双向映射（memory/redis可选）
+        app_state["session_token_codec"] = create_token_codec(SESSION_TOKEN_CONFIG)  # 无状态会话令牌（未启用时为None）
+        app_state["bulkheads"] = create_bulkheads(BULKHEAD_CONFIG)  # 聊天/TTS/情绪分析的独立线程池
+        app_state["tts_cache"] = await asyncio.to_thread(create_tts_cache, TTS_CACHE_CONFIG)  # TTS音频缓存（扫描磁盘目录恢复索引）
+        app_state["tts_jobs"] = TTSJobQueue(_run_tts_job, **TTS_JOB_CONFIG)  # 异步TTS任务队列
+        app_state["tts_jobs"].start()
+        app_state["tts_streamer"] = create_tts_streamer(TTS_STREAM_CONFIG)  # 未启用或未安装aiohttp时为None
+        if app_state["tts_streamer"]:
+            await app_state["tts_streamer"].start()
+        if VOICE_CATALOG_CONFIG["enabled"]:
+            # 音色目录：先从快照恢复，再在后台拉取上游音色列表（不阻塞启动）
+            catalog_options = {k: v for k, v in VOICE_CATALOG_CONFIG.items() if k != "enabled"}
+            app_state["voice_catalog"] = VoiceCatalog(_fetch_voice_list, default_voice_id=TEST_VOICE_ID, **catalog_options)
+            await asyncio.to_thread(app_state["voice_catalog"].load_snapshot)
+            app_state["voice_catalog"].start()
+        if TTS_PRESYNTH_CONFIG["enabled"] and app_state["tts_cache"]:
+            # 常用短语在后台预合成并固定在音频缓存中（不阻塞启动）
+            app_state["tts_presynth"] = PhrasePresynthesizer(
+                app_state["tts_cache"],
+                _presynthesize_phrase,
+                lambda: load_phrase_manifest(TTS_PRESYNTH_CONFIG["manifest"], TEST_VOICE_ID, FALLBACK_REPLY,
+                                             VOICE_CONFIG["max_segment_bytes"]),
+                delay=TTS_PRESYNTH_CONFIG["delay"],
+                interval=TTS_PRESYNTH_CONFIG["interval"],
+                concurrency=TTS_PRESYNTH_CONFIG["concurrency"]
+            )
+            app_state["tts_presynth"].start()
         
-        # 保存到应用状态
-        app_state["coze_chat_client"] = coze_chat_client  # 重命名为明确的聊天客户端
-        app_state["coze_tts_client"] = coze_tts_client    # 新增TTS客户端
-        app_state["emotion_analyzer"] = emotion_analyzer   # 新增情绪分析器
-        app_state["session_map"] = {}  # session_id -> 会话信息映射
-        app_state["conv_map"] = {}     # conversation_id -> session_id映射（反向查找）
+        # 内存后端：从快照+日志尾部恢复会话绑定，并挂载write-behind日志
+        if SESSION_JOURNAL_CONFIG["enabled"] and app_state["session_store"].backend_name == "memory":
+            journal_options = {k: v for k, v in SESSION_JOURNAL_CONFIG.items() if k != "enabled"}
+            session_journal = SessionJournal(**journal_options)
+            restore_stats = session_journal.load(app_state["session_store"])
+            session_journal.start(app_state["session_store"])
+            app_state["session_journal"] = session_journal
+            logger.info(f"会话恢复完成: {restore_stats}")
         
-        logger.info("Coze聊天机器人API服务器初始化完成")
-        logger.info(f"当前Bot ID: {coze_chat_client.bot_id}")
+        app_state["startup_ms"] = round((time.monotonic() - startup_start) * 1000, 1)
+        logger.info(f"Coze聊天机器人API服务器初始化完成 - 耗时: {app_state['startup_ms']}ms（客户端: {'已就绪' if clients.ready else '后台构建中'}）")
+        logger.info(f"当前Bot ID: {os.getenv('COZE_BOT_ID')}")
         logger.info(f"默认TTS音色ID: {TEST_VOICE_ID}")  # 打印默认音色ID
-        logger.info(f"情绪分析功能: 已启用")  # 新增日志
         logger.info(f"服务器配置: {SERVER_CONFIG}")
+        logger.info(f"会话存储后端: {app_state['session_store'].backend_name}")
+        if app_state["session_token_codec"]:
+            logger.info(f"会话令牌: 已启用（签发密钥: {app_state['session_token_codec'].signing_kid}, 无状态模式: {SESSION_TOKEN_CONFIG['stateless']}）")
         
         yield
         
-        # 关闭时清理
+        # 关闭时清理：排空进行中的请求 -> 持久化会话 -> 关闭线程池与连接池
         logger.info("正在关闭Coze聊天机器人API服务器...")
+        shutdown_start = time.monotonic()
+        drain_stats = await drain_controller.drain(DRAIN_CONFIG["grace_period"])
+        if app_state.get("tts_presynth"):
+            await app_state["tts_presynth"].stop()
+        if app_state.get("voice_catalog"):
+            await app_state["voice_catalog"].stop()
+        await app_state["tts_jobs"].stop(DRAIN_CONFIG["grace_period"])  # 等待进行中的TTS任务，排队中的标记为失败
+        if app_state.get("tts_streamer"):
+            await app_state["tts_streamer"].close()
+        if app_state.get("session_journal"):
+            app_state["session_journal"].close()  # 写入剩余变更并生成最终快照
+        app_state["session_store"].close()
+        for bulkhead in app_state["bulkheads"].values():
+            bulkhead.shutdown(wait=False)
+        for name in clients.factories:
+            close = getattr(app_state.get(name), "close", None)
+            if close:
+                close()
         app_state.clear()
-        logger.info("Coze聊天机器人API服务器已关闭")
+        logger.info(f"Coze聊天机器人API服务器已关闭 - 排空耗时: {drain_stats['duration_ms']}ms, "
+                    f"放弃请求: {drain_stats['abandoned']}（流式: {drain_stats['abandoned_streams']}）, "
+                    f"停机总耗时: {round((time.monotonic() - shutdown_start) * 1000, 1)}ms")
         
     except Exception as e:
         logger.error(f"初始化失败: {str(e)}", exc_info=True)
@@ -86,6 +186,26 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 上游调度中间件：已准入的请求按通道权重 + 用户公平（DRR）分配上游名额（先注册的中间件位于内层）
+priority_scheduler = create_priority_scheduler(PRIORITY_CONFIG)
+if priority_scheduler:
+    app.add_middleware(PriorityMiddleware, scheduler=priority_scheduler,
+                       routes=priority_routes(PRIORITY_CONFIG), header=PRIORITY_CONFIG["header"],
+                       user_headers=user_headers(PRIORITY_CONFIG), costs=route_costs(PRIORITY_CONFIG),
+                       raise_token=PRIORITY_CONFIG["raise_token"])
+
+# 准入控制中间件：受限路由超出并发上限时排队，排队满/超时返回503 + Retry-After
+admission_controller = AdmissionController.from_config(ADMISSION_CONFIG)
+if admission_controller:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# 排空中间件（最外层）：跟踪进行中的请求；停机排空期间新请求直接返回503 + Connection: close
+drain_controller = DrainController(exempt_paths=("/health", "/livez", "/readyz", "/admin/drain"), retry_after=DRAIN_CONFIG["retry_after"])
+app.add_middleware(DrainMiddleware, controller=drain_controller)
+
+# 访问日志中间件（最外层）：设置请求ID与路由上下文，按路由采样，每个请求一条结构化访问日志
+app.add_middleware(AccessLogMiddleware, runtime=logging_runtime)
+
 # ==================== Pydantic模型（数据校验）====================
 """聊天消息请求（新增conversation_id参数）"""
 class ChatMessageRequest(BaseModel):
@@ -94,6 +214,7 @@ class ChatMessageRequest(BaseModel):
     message: str = Field(..., description="用户消息内容（必填）", min_length=1)
     session_id: Optional[str] = Field(default=None, description="会话ID（可选，默认自动生成）")
     conversation_id: Optional[str] = Field(default=None, description="Coze会话ID（可选，传入则续传该会话）")
+    session_token: Optional[str] = Field(default=None, description="会话令牌（可选，上次响应返回的session_token，携带后无需查会话存储）")
 
 """同步聊天响应"""
 class ChatMessageResponse(BaseModel):
@@ -103,6 +224,7 @@ class ChatMessageResponse(BaseModel):
     message_id: str = Field(..., description="消息唯一ID")
     timestamp: str = Field(..., description="响应时间戳")
     conversation_id: str = Field(..., description="Coze会话ID（用于后续续传）")
+    session_token: Optional[str] = Field(default=None, description="会话令牌（启用SESSION_TOKEN_ENABLED时返回，下次请求带回即可续传）")
 
 """绑定会话ID请求"""
 class BindConversationRequest(BaseModel):
@@ -113,7 +235,7 @@ class BindConversationRequest(BaseModel):
 """文本转语音请求（匹配Coze官方API，使用默认voice_id）"""
 class TextToSpeechRequest(BaseModel):
     """文本转语音请求（匹配Coze官方API）"""
-    input: str = Field(..., description="合成语音的文本（必填，UTF-8编码，≤1024字节）", min_length=1)
+    input: str = Field(..., description="合成语音的文本（必填，UTF-8编码；超过1024字节时按句切分合成，最大TTS_MAX_INPUT_BYTES字节）", min_length=1)
     voice_id: Optional[str] = Field(
         default=TEST_VOICE_ID,  # 使用默认音色ID
         description=f"音色ID（可选，默认使用: {TEST_VOICE_ID}，需通过Coze音色列表API获取可用值）"
@@ -128,6 +250,27 @@ class TextToSpeechRequest(BaseModel):
         le=5.0,
         description="情感强度（可选，1.0~5.0，数值越高情感越强烈，默认4.0）"
     )
+    response_format: Optional[str] = Field(
+        default=None,
+        pattern="^(mp3|ogg_opus|wav|pcm)$",
+        description="输出格式（可选，mp3/ogg_opus/wav/pcm；省略时按Accept请求头协商，默认mp3）"
+    )
+    sample_rate: Optional[int] = Field(
+        default=None,
+        description=f"采样率（可选，Hz，取值：{'/'.join(map(str, VALID_SAMPLE_RATES))}；省略时使用上游默认值）"
+    )
+
+"""批量文本转语音中的单个条目"""
+class TTSBatchItem(TextToSpeechRequest):
+    """批量文本转语音中的单个条目"""
+    id: Optional[str] = Field(default=None, max_length=64, description="条目标识（可选，用于归档中的文件名与结果清单）")
+
+"""批量文本转语音请求"""
+class TTSBatchRequest(BaseModel):
+    """批量文本转语音请求"""
+    items: List[TTSBatchItem] = Field(..., min_length=1, description="待合成的条目列表（最多TTS_BATCH_MAX_ITEMS条）")
+    format: str = Field(default="zip", pattern="^(zip|multipart)$", description="输出格式：zip / multipart（multipart/mixed）")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="同时合成的条目数（可选，不超过TTS_BATCH_MAX_CONCURRENCY）")
 
 """文本转语音响应元数据（可选，用于同步返回场景）"""
 class TextToSpeechResponse(BaseModel):
@@ -138,6 +281,36 @@ class TextToSpeechResponse(BaseModel):
     audio_format: str = Field(default="mp3", description="音频格式（Coze官方默认）")
     timestamp: str = Field(..., description="响应时间戳")
 
+"""语音聊天请求（聊天参数 + TTS参数）"""
+class ChatVoiceRequest(ChatMessageRequest):
+    """语音聊天请求（聊天参数 + TTS参数）"""
+    voice_id: Optional[str] = Field(default=TEST_VOICE_ID, description=f"音色ID（可选，默认使用: {TEST_VOICE_ID}）")
+    emotion: Optional[str] = Field(default=None, description="情感类型（可选，仅多情感音色支持）")
+    emotion_scale: Optional[float] = Field(default=4.0, ge=1.0, le=5.0, description="情感强度（可选，1.0~5.0，默认4.0）")
+
+"""单轮交互请求（聊天 + 情绪分析 + 情绪匹配语音）"""
+class TurnRequest(ChatMessageRequest):
+    """单轮交互请求（聊天 + 情绪分析 + 情绪匹配语音）"""
+    voice_id: Optional[str] = Field(default=TEST_VOICE_ID, description=f"音色ID（可选，默认使用: {TEST_VOICE_ID}，需为多情感音色）")
+    with_audio: bool = Field(default=True, description="是否合成回复语音（默认合成）")
+
+"""单轮交互响应（含各阶段耗时）"""
+class TurnResponse(BaseModel):
+    """单轮交互响应（含各阶段耗时）"""
+    response: str = Field(..., description="机器人完整回复")
+    session_id: str = Field(..., description="会话ID")
+    message_id: str = Field(..., description="消息唯一ID")
+    conversation_id: str = Field(..., description="Coze会话ID（用于后续续传）")
+    emotion_analysis: Optional[str] = Field(None, description="用户消息的情绪分析结果（分析失败时为空）")
+    tts_emotion: Optional[str] = Field(None, description="回复语音使用的情感类型（音色不支持映射出的情感时为空）")
+    tts_emotion_scale: float = Field(..., description="回复语音使用的情感强度")
+    audio_format: str = Field(default="mp3", description="音频格式")
+    audio_base64: Optional[str] = Field(None, description="回复语音（Base64编码，合成失败或未请求时为空）")
+    tts_error: Optional[str] = Field(None, description="语音合成错误信息（如有）")
+    timings_ms: Dict[str, float] = Field(..., description="各阶段耗时（毫秒）：chat/emotion/tts/total")
+    session_token: Optional[str] = Field(default=None, description="会话令牌（启用SESSION_TOKEN_ENABLED时返回，下次请求带回即可续传）")
+    timestamp: str = Field(..., description="响应时间戳")
+
 # -------------------- 新增情绪分析相关Pydantic模型 --------------------
 """情绪分析请求"""
 class EmotionAnalysisRequest(BaseModel):
@@ -157,27 +330,72 @@ class EmotionAnalysisResponse(BaseModel):
     timestamp: str = Field(..., description="响应时间戳")
 
 # ==================== 核心工具函数 ====================
+"""调用会话存储方法（有网络往返的后端在会话舱壁线程中执行，不阻塞事件循环；内存后端直接调用）"""
+async def _session_call(method: str, *args: Any, **kwargs: Any) -> Any:
+    """调用会话存储方法（有网络往返的后端在会话舱壁线程中执行，不阻塞事件循环；内存后端直接调用）"""
+    session_store = app_state["session_store"]
+    func = functools.partial(getattr(session_store, method), *args, **kwargs)
+    if not session_store.blocking:
+        return func()
+    return await _bulkhead("session").run(func)
+
 """更新会话映射（双向绑定）"""
-def _update_session_mapping(session_id: str, user_id: str, conversation_id: str):
+async def _update_session_mapping(session_id: str, user_id: str, conversation_id: Optional[str]):
     """更新会话映射（双向绑定）"""
-    # 移除旧的反向映射（如果该conversation_id已绑定其他session）
-    old_session_id = app_state["conv_map"].get(conversation_id)
-    if old_session_id and old_session_id != session_id:
-        del app_state["session_map"][old_session_id]
-    
-    # 更新正向和反向映射
-    app_state["session_map"][session_id] = {
-        "user_id": user_id,
-        "conversation_id": conversation_id,
-        "last_activity": datetime.now().isoformat()
-    }
-    app_state["conv_map"][conversation_id] = session_id
+    # 会话存储内部原子完成：移除旧的反向映射 + 更新正向和反向映射
+    await _session_call("bind", session_id, user_id, conversation_id)
 
 """通过session_id获取绑定的conversation_id"""
-def _get_conversation_id_by_session(session_id: str) -> Optional[str]:
+async def _get_conversation_id_by_session(session_id: str) -> Optional[str]:
     """通过session_id获取绑定的conversation_id"""
-    session_info = app_state["session_map"].get(session_id)
-    return session_info["conversation_id"] if session_info else None
+    return await _session_call("get_conversation_id", session_id)
+
+"""校验请求携带的会话令牌（未携带返回None；无效令牌返回401）"""
+def _verify_session_token(request: ChatMessageRequest) -> Optional[SessionClaims]:
+    """校验请求携带的会话令牌（未携带返回None；无效令牌或与请求中的session_id/user_id不一致时返回401）"""
+    if not request.session_token:
+        return None
+    codec = app_state.get("session_token_codec")
+    if codec is None:
+        raise HTTPException(status_code=400, detail="服务端未启用会话令牌（SESSION_TOKEN_ENABLED）")
+    try:
+        claims = codec.verify(request.session_token)
+    except SessionTokenError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    if request.session_id and request.session_id != claims.session_id:
+        raise HTTPException(status_code=401, detail="会话令牌与session_id不匹配")
+    if request.user_id and request.user_id != claims.user_id:
+        raise HTTPException(status_code=401, detail="会话令牌与user_id不匹配")
+    return claims
+
+"""记录会话绑定并签发新令牌（无状态模式只签发令牌，不写会话存储；未启用令牌时返回None）"""
+async def _commit_session(session_id: str, user_id: str, conversation_id: Optional[str]) -> Optional[str]:
+    """记录会话绑定并签发新令牌（无状态模式只签发令牌，不写会话存储；未启用令牌时返回None）"""
+    codec = app_state.get("session_token_codec")
+    if codec is None or not SESSION_TOKEN_CONFIG["stateless"]:
+        await _update_session_mapping(session_id, user_id, conversation_id)
+    return codec.issue(session_id, user_id, conversation_id) if codec else None
+
+"""按续传优先级确定本次请求的会话（传入的conversation_id > session_id绑定的conversation_id > 新建时为None）"""
+async def _target_conversation(session_id: str, conversation_id: Optional[str]) -> Optional[str]:
+    """按续传优先级确定本次请求的会话（传入的conversation_id > session_id绑定的conversation_id > 新建时为None）"""
+    return conversation_id or await _get_conversation_id_by_session(session_id)
+
+"""获取指定功能的舱壁（chat / tts / emotion / session）"""
+def _bulkhead(name: str) -> Bulkhead:
+    """获取指定功能的舱壁（chat / tts / emotion / session）"""
+    return app_state["bulkheads"][name]
+
+async def _client(name: str):
+    """获取上游客户端（尚未构建完成时等待构建；构建失败返回None）"""
+    clients = app_state.get("clients")
+    return await clients.get(name) if clients else app_state.get(name)
+
+def _upstream_http_error(label: str, error: UpstreamError) -> HTTPException:
+    """上游错误 -> HTTPException（状态码由错误类型决定，限流时带Retry-After）"""
+    logger.warning(f"{label}上游错误: {error}", extra={"upstream": error.details()})
+    headers = {"Retry-After": str(error.retry_after)} if error.retry_after else None
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
 
 # -------------------- 新增TTS工具函数 --------------------
 """生成唯一的TTS任务ID"""
@@ -185,6 +403,129 @@ def _generate_tts_task_id() -> str:
     """生成唯一的TTS任务ID"""
     return f"tts_task_{uuid.uuid4().hex[:16]}"
 
+"""输出格式对应的 (Content-Type, 文件扩展名)"""
+def _audio_format(response_format: Optional[str]) -> Tuple[str, str]:
+    """输出格式对应的 (Content-Type, 文件扩展名)"""
+    return AUDIO_FORMATS[response_format or DEFAULT_AUDIO_FORMAT]
+
+"""校验长文本的输出格式可分段拼接（每段WAV自带文件头，拼接后不是合法文件）"""
+def _check_segmentable_format(response_format: Optional[str]):
+    """校验长文本的输出格式可分段拼接（每段WAV自带文件头，拼接后不是合法文件）"""
+    if response_format == "wav":
+        raise ValueError(f"超过{TTS_MAX_INPUT_BYTES}字节的长文本不支持wav格式，请使用mp3/ogg_opus/pcm")
+
+"""调用TTS客户端合成一段文本，返回完整音频字节（阻塞调用，需在线程中执行）"""
+def _synthesize_audio_bytes(coze_tts_client: CozeTTSClient, text: str, voice_id: str,
+                            emotion: Optional[str] = None, emotion_scale: Optional[float] = None,
+                            use_cache: bool = True, response_format: Optional[str] = None,
+                            sample_rate: Optional[int] = None) -> bytes:
+    """调用TTS客户端合成一段文本，返回完整音频字节（阻塞调用，需在线程中执行；use_cache=False 时由调用方负责缓存）"""
+    tts_cache = app_state.get("tts_cache") if use_cache else None
+    key = cache_key(text, voice_id, emotion, emotion_scale, response_format, sample_rate) if tts_cache else None
+    if key:
+        cached = tts_cache.get_bytes(key)
+        if cached is not None:
+            return cached
+    audio = b"".join(coze_tts_client.text_to_speech(
+        input=text,
+        voice_id=voice_id,
+        emotion=emotion,
+        emotion_scale=emotion_scale,
+        response_format=response_format,
+        sample_rate=sample_rate
+    ))
+    if key:
+        tts_cache.put(key, audio, _audio_format(response_format)[1])
+    return audio
+
+"""将已切分的文本片段并发合成（在TTS舱壁线程中执行），按片段顺序逐段产出音频"""
+def _iter_text_segments(coze_tts_client: CozeTTSClient, segments: List[str], voice_id: str,
+                        emotion: Optional[str] = None, emotion_scale: Optional[float] = None,
+                        max_concurrency: int = 3, response_format: Optional[str] = None,
+                        sample_rate: Optional[int] = None) -> AsyncIterator[bytes]:
+    """将已切分的文本片段并发合成（在TTS舱壁线程中执行），按片段顺序逐段产出音频"""
+    async def synthesize(segment: str) -> bytes:
+        return await _bulkhead("tts").run(_synthesize_audio_bytes, coze_tts_client, segment, voice_id, emotion, emotion_scale,
+                                          True, response_format, sample_rate)
+    
+    return iter_ordered_synthesis(segments, synthesize, max_concurrency)
+
+"""合成任意长度的文本（不查缓存；超过单次字节限制时分段并发合成后拼接）"""
+async def _synthesize_uncached(coze_tts_client: CozeTTSClient, text: str, voice_id: str,
+                               emotion: Optional[str] = None, emotion_scale: Optional[float] = None,
+                               max_concurrency: int = 3, response_format: Optional[str] = None,
+                               sample_rate: Optional[int] = None) -> bytes:
+    """合成任意长度的文本（不查缓存；超过单次字节限制时分段并发合成后拼接）"""
+    if len(text.encode("utf-8")) > TTS_MAX_INPUT_BYTES:
+        _check_segmentable_format(response_format)
+        segments = split_long_text(text, target_bytes=TTS_LONG_TEXT_CONFIG["segment_bytes"])
+        return b"".join([chunk async for chunk in _iter_text_segments(
+            coze_tts_client, segments, voice_id, emotion, emotion_scale, max_concurrency, response_format, sample_rate)])
+    return await _bulkhead("tts").run(_synthesize_audio_bytes, coze_tts_client, text, voice_id, emotion, emotion_scale, False,
+                                      response_format, sample_rate)
+
+"""合成任意长度的文本（先查音频缓存），返回 (音频字节, 缓存状态 hit-memory/hit-disk/miss)"""
+async def _synthesize_cached(coze_tts_client: CozeTTSClient, text: str, voice_id: str,
+                             emotion: Optional[str] = None, emotion_scale: Optional[float] = None,
+                             max_concurrency: int = 3, response_format: Optional[str] = None,
+                             sample_rate: Optional[int] = None) -> Tuple[bytes, str]:
+    """合成任意长度的文本（先查音频缓存），返回 (音频字节, 缓存状态 hit-memory/hit-disk/miss)"""
+    tts_cache = app_state.get("tts_cache")
+    key = cache_key(text, voice_id, emotion, emotion_scale, response_format, sample_rate) if tts_cache else None
+    if key:
+        cached, cached_path = tts_cache.lookup(key)
+        if cached is not None:
+            return cached, "hit-memory"
+        if cached_path:
+            cached = await asyncio.to_thread(tts_cache.read, key, cached_path)
+            if cached is not None:
+                return cached, "hit-disk"
+    audio = await _synthesize_uncached(coze_tts_client, text, voice_id, emotion, emotion_scale, max_concurrency,
+                                       response_format, sample_rate)
+    if key:
+        await asyncio.to_thread(tts_cache.put, key, audio, _audio_format(response_format)[1])
+    return audio, "miss"
+
+"""执行一个异步TTS任务（由任务队列的后台协程调用）"""
+async def _run_tts_job(job: TTSJob) -> Tuple[bytes, str]:
+    """执行一个异步TTS任务（由任务队列的后台协程调用）"""
+    coze_tts_client = await _client("coze_tts_client")
+    if not coze_tts_client:
+        raise RuntimeError("Coze TTS客户端未初始化，无法调用TTS服务")
+    return await _synthesize_cached(coze_tts_client, job.input, job.voice_id, job.emotion, job.emotion_scale,
+                                    TTS_LONG_TEXT_CONFIG["concurrency"], job.response_format, job.sample_rate)
+
+"""合成一条预合成短语（不查缓存，由预合成器固定到音频缓存中）"""
+async def _presynthesize_phrase(text: str, voice_id: str, emotion: Optional[str] = None,
+                                emotion_scale: Optional[float] = None) -> bytes:
+    """合成一条预合成短语（不查缓存，由预合成器固定到音频缓存中）"""
+    coze_tts_client = await _client("coze_tts_client")
+    if not coze_tts_client:
+        raise RuntimeError("Coze TTS客户端未初始化，无法调用TTS服务")
+    return await _synthesize_uncached(coze_tts_client, text, voice_id, emotion, emotion_scale, TTS_LONG_TEXT_CONFIG["concurrency"])
+
+"""拉取Coze音色列表（由音色目录的后台刷新任务调用）"""
+async def _fetch_voice_list() -> List[Dict[str, Any]]:
+    """拉取Coze音色列表（由音色目录的后台刷新任务调用）"""
+    coze_tts_client = await _client("coze_tts_client")
+    if not coze_tts_client:
+        raise RuntimeError("Coze TTS客户端未初始化，无法拉取音色列表")
+    return await _bulkhead("tts").run(coze_tts_client.list_voices)
+
+"""按音色目录本地校验音色与情感组合（不支持时抛出 VoiceValidationError；未启用音色目录时不校验）"""
+def _check_voice(voice_id: str, emotion: Optional[str] = None):
+    """按音色目录本地校验音色与情感组合（不支持时抛出 VoiceValidationError；未启用音色目录时不校验）"""
+    voice_catalog = app_state.get("voice_catalog")
+    if voice_catalog:
+        voice_catalog.validate(voice_id, emotion)
+
+"""批量条目在归档中的文件名（序号前缀保证唯一）"""
+def _batch_item_name(index: int, item: TTSBatchItem) -> str:
+    """批量条目在归档中的文件名（序号前缀保证唯一）"""
+    if item.id:
+        return f"{index:04d}_{re.sub(r'[^0-9A-Za-z_.-]', '_', item.id)}"
+    return f"{index:04d}"
+
 # ==================== API路由 ====================
 """根路径健康提示"""
 @app.get("/")
@@ -195,26 +536,105 @@ async def root():
         "version": "1.3.0",  # 更新版本号
         "status": "healthy",
         "docs": "/docs",  # Swagger文档地址
-        "features": ["同步聊天", "流式聊天", "会话续传", "会话绑定", "上下文管理", "文本转语音", "情绪分析"]  # 新增情绪分析功能
+        "features": ["同步聊天", "流式聊天", "语音聊天", "单轮交互", "会话续传", "会话绑定", "上下文管理", "文本转语音", "情绪分析"]  # 新增情绪分析功能
     }
 
 """健康检查接口"""
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口（排空期间返回503，便于负载均衡摘除节点）"""
+    if drain_controller.draining:
+        return JSONResponse(status_code=503, content={
+            "status": "draining",
+            "timestamp": datetime.now().isoformat(),
+            "drain": drain_controller.stats()
+        })
+    session_stats = await _session_call("stats") if app_state.get("session_store") else None
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "coze_chat_client_status": "initialized" if app_state.get("coze_chat_client") else "uninitialized",
         "coze_tts_client_status": "initialized" if app_state.get("coze_tts_client") else "uninitialized",
         "emotion_analyzer_status": "initialized" if app_state.get("emotion_analyzer") else "uninitialized",  # 新增情绪分析器状态
-        "active_sessions": len(app_state.get("session_map", {})),
-        "active_conversations": len(app_state.get("conv_map", {})),
+        "active_sessions": session_stats["sessions"] if session_stats else 0,
+        "active_conversations": session_stats["conversations"] if session_stats else 0,
+        "session_store": session_stats,
+        "session_journal": app_state["session_journal"].stats() if app_state.get("session_journal") else None,
+        "admission": admission_controller.stats() if admission_controller else None,
+        "bulkheads": {name: b.stats() for name, b in app_state["bulkheads"].items()} if app_state.get("bulkheads") else None,
+        "drain": drain_controller.stats(),
         "tts_support": "enabled" if app_state.get("coze_tts_client") else "disabled",
         "emotion_analysis_support": "enabled" if app_state.get("emotion_analyzer") else "disabled",  # 新增情绪分析支持状态
         "default_voice_id": TEST_VOICE_ID  # 新增默认音色ID展示
     }
 
+"""存活探针（进程与事件循环正常即返回200，不检查上游客户端）"""
+@app.get("/livez")
+async def livez():
+    """存活探针（进程与事件循环正常即返回200，不检查上游客户端）"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+"""就绪探针（上游客户端全部构建完成且未在排空时返回200，否则503；客户端构建失败时触发重试）"""
+@app.get("/readyz")
+async def readyz():
+    """就绪探针（上游客户端全部构建完成且未在排空时返回200，否则503；客户端构建失败时触发重试）"""
+    clients = app_state.get("clients")
+    if clients and not clients.ready and not drain_controller.draining:
+        clients.warm()  # 构建失败的客户端在下次探测时重试
+    ready = bool(clients and clients.ready and "session_store" in app_state) and not drain_controller.draining
+    content = {
+        "status": "ready" if ready else ("draining" if drain_controller.draining else "starting"),
+        "timestamp": datetime.now().isoformat(),
+        "startup_ms": app_state.get("startup_ms"),
+        "clients": clients.stats()["clients"] if clients else None
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+"""运行指标（准入控制：准入/排队/拒绝计数；上游调度：各通道名额占用与等待时间、按用户排队时间）"""
+@app.get("/metrics")
+async def metrics():
+    """运行指标（准入控制：准入/排队/拒绝计数；上游调度：各通道名额占用与等待时间、按用户排队时间）"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "admission": admission_controller.stats() if admission_controller else None,
+        "priority": priority_scheduler.stats() if priority_scheduler else None,
+        "bulkheads": {name: b.stats() for name, b in app_state["bulkheads"].items()} if app_state.get("bulkheads") else None,
+        "drain": drain_controller.stats(),
+        "logging": logging_runtime.stats(),
+        "tts_cache": app_state["tts_cache"].stats() if app_state.get("tts_cache") else None,
+        "tts_jobs": app_state["tts_jobs"].stats() if app_state.get("tts_jobs") else None,
+        "tts_presynth": app_state["tts_presynth"].stats() if app_state.get("tts_presynth") else None,
+        "voice_catalog": app_state["voice_catalog"].stats() if app_state.get("voice_catalog") else None,
+        "tts_stream": app_state["tts_streamer"].stats() if app_state.get("tts_streamer") else None
+    }
+
+"""
+    开始排空（滚动发布时由部署脚本在停止进程前调用，需携带管理令牌且仅允许本机访问）
+    - 立即停止接受新请求（/health 返回503，负载均衡据此摘除节点）
+    - 等待进行中的请求（含流式回复、TTS音频流）完成，最多等待宽限期
+    - 返回排空耗时与被放弃的请求；之后再发送SIGTERM即可快速停机
+    """
+@app.post("/admin/drain")
+async def admin_drain(request: Request, grace_period: Optional[float] = Query(None, ge=0, le=600, description="宽限期（秒），默认使用DRAIN_GRACE_PERIOD")):
+    """
+    开始排空（滚动发布时由部署脚本在停止进程前调用，需携带管理令牌且仅允许本机访问）
+    - 立即停止接受新请求（/health 返回503，负载均衡据此摘除节点）
+    - 等待进行中的请求（含流式回复、TTS音频流）完成，最多等待宽限期
+    - 返回排空耗时与被放弃的请求；之后再发送SIGTERM即可快速停机
+    """
+    # 来源地址可被本机的代理/回调转发绕过，必须校验令牌
+    admin_token = DRAIN_CONFIG["admin_token"]
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="未配置ADMIN_TOKEN，管理接口已禁用")
+    provided = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(provided.encode("utf-8"), admin_token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+    client_host = request.client.host if request.client else ""
+    if client_host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="排空接口仅允许本机调用")
+    stats = await drain_controller.drain(DRAIN_CONFIG["grace_period"] if grace_period is None else grace_period)
+    return {"status": "drained" if not stats["abandoned"] else "timeout", "drain": stats}
+
 """
     同步聊天接口（支持会话续传）
     - 支持传入 conversation_id 续传已有会话
@@ -231,41 +651,46 @@ async def chat(request: ChatMessageRequest):
     """
     try:
         # 获取客户端实例
-        coze_chat_client = app_state.get("coze_chat_client")
+        coze_chat_client = await _client("coze_chat_client")
         if not coze_chat_client:
             raise HTTPException(status_code=500, detail="Coze聊天客户端未初始化")
         
-        # 1. 处理用户ID和会话ID
-        user_id = request.user_id or f"user_{uuid.uuid4().hex[:8]}"
-        session_id = request.session_id or f"session_{uuid.uuid4().hex[:12]}"
+        # 1. 处理用户ID和会话ID（携带会话令牌时以令牌内容为准）
+        claims = _verify_session_token(request)
+        user_id = claims.user_id if claims else (request.user_id or f"user_{uuid.uuid4().hex[:8]}")
+        session_id = claims.session_id if claims else (request.session_id or f"session_{uuid.uuid4().hex[:12]}")
         message_id = f"msg_{uuid.uuid4().hex[:16]}"
         
-        # 2. 处理会话续传逻辑（优先级：传入的conversation_id > session_id绑定的conversation_id > 新建）
+        # 2. 处理会话续传逻辑（优先级：传入的conversation_id > 令牌中的conversation_id > session_id绑定的conversation_id > 新建）
+        #    会话ID随本次请求传给客户端，不修改共享客户端的当前会话（并发请求互不串话）
         target_conv_id = None
         if request.conversation_id:
-            # 传入了conversation_id，直接绑定
+            # 传入了conversation_id，直接续传
             target_conv_id = request.conversation_id
-            coze_chat_client.set_conversation_id(target_conv_id)
             logger.info(f"同步聊天 - 手动传入会话ID: {target_conv_id[:15]}...")
-        elif session_id in app_state["session_map"]:
+        elif claims:
+            # 令牌已携带绑定关系，无需查询会话存储
+            target_conv_id = claims.conversation_id
+            if target_conv_id:
+                logger.info(f"同步聊天 - 续传令牌会话ID: {target_conv_id[:15]}...")
+        else:
             # 已有session_id绑定的conversation_id，自动续传
-            target_conv_id = _get_conversation_id_by_session(session_id)
+            target_conv_id = await _get_conversation_id_by_session(session_id)
             if target_conv_id:
-                coze_chat_client.set_conversation_id(target_conv_id)
                 logger.info(f"同步聊天 - 续传session绑定会话ID: {target_conv_id[:15]}...")
         
         logger.info(f"同步聊天请求 - session_id: {session_id}, user_id: {user_id}, message: {request.message[:50]}...")
         
-        # 3. 调用Coze客户端（同步模式）
-        response_text = coze_chat_client.send_message_sync(message=request.message)
-        
-        # 4. 获取实际使用的conversation_id（可能是新建或传入的）
-        actual_conv_id = coze_chat_client.get_current_conversation_id()
+        # 3. 调用Coze客户端（同步模式，在聊天舱壁线程中执行，不阻塞事件循环）
+        # 4. 同时返回实际使用的conversation_id（可能是新建或传入的）
+        response_text, actual_conv_id = await _bulkhead("chat").run(
+            coze_chat_client.send_message, request.message, target_conv_id
+        )
         if not actual_conv_id:
             raise Exception("Coze API未返回有效的conversation_id")
         
-        # 5. 更新会话映射（双向绑定）
-        _update_session_mapping(session_id, user_id, actual_conv_id)
+        # 5. 更新会话映射（双向绑定）并签发会话令牌
+        session_token = await _commit_session(session_id, user_id, actual_conv_id)
         
         logger.info(f"同步聊天响应 - session_id: {session_id}, conv_id: {actual_conv_id[:15]}..., response: {response_text[:50]}...")
         
@@ -274,9 +699,17 @@ async def chat(request: ChatMessageRequest):
             session_id=session_id,
             message_id=message_id,
             timestamp=datetime.now().isoformat(),
-            conversation_id=actual_conv_id  # 返回conversation_id，供后续续传
+            conversation_id=actual_conv_id,  # 返回conversation_id，供后续续传
+            session_token=session_token
         )
 
+    except HTTPException:
+        raise
+    except BulkheadError as be:
+        logger.warning(f"同步聊天被舱壁拒绝: {str(be)}")
+        raise HTTPException(status_code=be.status_code, detail=str(be))
+    except UpstreamError as ue:
+        raise _upstream_http_error("同步聊天", ue)
     except ValueError as ve:
         # 捕获无效conversation_id的异常
         logger.error(f"同步聊天参数错误: {str(ve)}")
@@ -300,50 +733,47 @@ async def chat_stream(request: ChatMessageRequest):
     - 响应格式：data: {"type": "chunk"/"complete"/"error", ...}
     """
     try:
-        # 1. 处理ID生成
-        user_id = request.user_id or f"user_{uuid.uuid4().hex[:8]}"
-        session_id = request.session_id or f"session_{uuid.uuid4().hex[:12]}"
+        # 1. 处理ID生成（携带会话令牌时以令牌内容为准）
+        claims = _verify_session_token(request)
+        user_id = claims.user_id if claims else (request.user_id or f"user_{uuid.uuid4().hex[:8]}")
+        session_id = claims.session_id if claims else (request.session_id or f"session_{uuid.uuid4().hex[:12]}")
         message_id = f"msg_{uuid.uuid4().hex[:16]}"
         
-        # 2. 预处理会话续传参数（供生成器使用）
-        target_conv_id = request.conversation_id
-        use_existing_session = session_id in app_state["session_map"]
+        # 2. 预处理会话续传参数（供生成器使用；令牌已携带绑定关系时不查询会话存储）
+        target_conv_id = request.conversation_id or (claims.conversation_id if claims else None)
+        use_existing_session = not claims  # 无令牌时在生成器中查询session_id绑定的conversation_id
         
         logger.info(f"流式聊天请求 - session_id: {session_id}, user_id: {user_id}, conv_id: {target_conv_id[:15] if target_conv_id else '新建'}, message: {request.message[:50]}...")
         
         async def stream_generator():
             """流式响应生成器（异步迭代）"""
             try:
-                coze_chat_client = app_state.get("coze_chat_client")
+                coze_chat_client = await _client("coze_chat_client")
                 if not coze_chat_client:
                     raise Exception("Coze聊天客户端未初始化")
                 
-                # 3. 绑定会话ID（续传逻辑）
+                # 3. 确定续传的会话ID（随本次请求传给客户端，不修改共享客户端的当前会话）
                 actual_conv_id = None
 
                 if target_conv_id:
-                    coze_chat_client.set_conversation_id(target_conv_id)
+                    CozeAPIClient.validate_conversation_id(target_conv_id)
                     actual_conv_id = target_conv_id
                     logger.info(f"流式聊天 - 手动绑定会话ID: {actual_conv_id[:15]}...")
                 elif use_existing_session:
-                    actual_conv_id = _get_conversation_id_by_session(session_id)
+                    actual_conv_id = await _get_conversation_id_by_session(session_id)
                     if actual_conv_id:
-                        coze_chat_client.set_conversation_id(actual_conv_id)
                         logger.info(f"流式聊天 - 续传会话ID: {actual_conv_id[:15]}...")
                 
                 # 4. 初始化会话映射（如果是新会话）
                 if not actual_conv_id:
-                    app_state["session_map"][session_id] = {
-                        "user_id": user_id,
-                        "conversation_id": None,
-                        "last_activity": datetime.now().isoformat()
-                    }
+                    await _commit_session(session_id, user_id, None)
                 
                 chunk_count = 0
                 full_content = ""
                 
-                # 5. 迭代Coze客户端的流式生成器
-                for stream_data in coze_chat_client.send_message_stream(message=request.message):
+                # 5. 在聊天舱壁线程中迭代Coze客户端的流式生成器
+                stream_iter = coze_chat_client.send_message_stream(request.message, conversation_id=actual_conv_id)
+                async for stream_data in _bulkhead("chat").iterate(stream_iter):
                     stream_type = stream_data.get("type")
                     
                     # 内容块：实时返回
@@ -376,8 +806,8 @@ async def chat_stream(request: ChatMessageRequest):
                         if not actual_conv_id:
                             raise Exception("流式响应未返回conversation_id")
                         
-                        # 更新双向会话映射
-                        _update_session_mapping(session_id, user_id, actual_conv_id)
+                        # 更新双向会话映射并签发会话令牌
+                        session_token = await _commit_session(session_id, user_id, actual_conv_id)
                         
                         complete_data = {
                             "type": "complete",
@@ -387,6 +817,7 @@ async def chat_stream(request: ChatMessageRequest):
                                 "total_chunks": chunk_count,
                                 "full_content": full_content,
                                 "conversation_id": actual_conv_id,  # 返回供后续续传
+                                "session_token": session_token,
                                 "timestamp": datetime.now().isoformat()
                             }
                         }
@@ -422,6 +853,20 @@ async def chat_stream(request: ChatMessageRequest):
                     }
                 }
                 yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            except UpstreamError as ue:
+                logger.warning(f"流式聊天上游错误 - session_id: {session_id}, error: {ue}", extra={"upstream": ue.details()})
+                error_data = {
+                    "type": "error",
+                    "data": {
+                        "message": str(ue),
+                        "error_type": ue.kind,
+                        "status_code": ue.status_code,
+                        "session_id": session_id,
+                        "message_id": message_id,
+                        "timestamp": datetime.now().isoformat()
+                    }
+                }
+                yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
             except Exception as gen_error:
                 error_msg = f"流式生成器异常: {str(gen_error)}"
                 logger.error(error_msg, exc_info=True)
@@ -448,6 +893,8 @@ async def chat_stream(request: ChatMessageRequest):
             }
         )
         
+    except HTTPException:
+        raise
     except ValueError as ve:
         logger.error(f"流式聊天参数错误: {str(ve)}")
         raise HTTPException(status_code=400, detail=f"参数错误: {str(ve)}")
@@ -455,6 +902,305 @@ async def chat_stream(request: ChatMessageRequest):
         logger.error(f"流式聊天处理失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"流式聊天失败: {str(e)}")
 
+"""
+    语音聊天接口（SSE格式，边生成回复边合成语音）
+    - 流式回复按句切分（兼容中英文标点），每句完成后立即提交TTS
+    - TTS并发数受 VOICE_CONFIG['tts_concurrency'] 限制，音频按句子顺序返回
+    - 响应格式：data: {"type": "chunk"/"audio"/"complete"/"error", ...}
+      audio事件的 audio_base64 为该句的MP3音频（Base64编码）
+    """
+@app.post("/chat/voice")
+async def chat_voice(request: ChatVoiceRequest):
+    """
+    语音聊天接口（SSE格式，边生成回复边合成语音）
+    - 流式回复按句切分（兼容中英文标点），每句完成后立即提交TTS
+    - TTS并发数受 VOICE_CONFIG['tts_concurrency'] 限制，音频按句子顺序返回
+    - 响应格式：data: {"type": "chunk"/"audio"/"complete"/"error", ...}
+      audio事件的 audio_base64 为该句的MP3音频（Base64编码）
+    """
+    try:
+        coze_chat_client = await _client("coze_chat_client")
+        coze_tts_client = await _client("coze_tts_client")
+        if not coze_chat_client or not coze_tts_client:
+            raise HTTPException(status_code=500, detail="Coze聊天/TTS客户端未初始化，无法调用语音聊天服务")
+        
+        # 1. 处理ID生成与会话续传参数（携带会话令牌时以令牌内容为准，不查询会话存储）
+        claims = _verify_session_token(request)
+        user_id = claims.user_id if claims else (request.user_id or f"user_{uuid.uuid4().hex[:8]}")
+        session_id = claims.session_id if claims else (request.session_id or f"session_{uuid.uuid4().hex[:12]}")
+        message_id = f"msg_{uuid.uuid4().hex[:16]}"
+        target_conv_id = request.conversation_id or (claims.conversation_id if claims else None)
+        
+        logger.info(f"语音聊天请求 - session_id: {session_id}, user_id: {user_id}, voice_id: {request.voice_id[:15]}..., message: {request.message[:50]}...")
+        try:
+            _check_voice(request.voice_id, request.emotion)
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=f"参数错误: {str(ve)}")
+        
+        def sse(event_type: str, data: Dict[str, Any]) -> str:
+            data.update({"session_id": session_id, "message_id": message_id, "timestamp": datetime.now().isoformat()})
+            return f"data: {json.dumps({'type': event_type, 'data': data}, ensure_ascii=False)}\n\n"
+        
+        async def synthesize(text: str) -> bytes:
+            return await _bulkhead("tts").run(
+                _synthesize_audio_bytes, coze_tts_client, text,
+                request.voice_id, request.emotion, request.emotion_scale
+            )
+        
+        async def stream_generator():
+            """语音流响应生成器：文本增量与有序音频段共用一个输出队列"""
+            events: asyncio.Queue = asyncio.Queue()
+            splitter = SentenceSplitter(
+                max_bytes=VOICE_CONFIG["max_segment_bytes"],
+                eager_first=VOICE_CONFIG["eager_first_sentence"]
+            )
+            
+            def on_segment(segment: SynthesizedSegment):
+                if segment.error:
+                    logger.error(f"语音聊天TTS失败 - session_id: {session_id}, segment: {segment.index}, error: {segment.error}")
+                    events.put_nowait(sse("audio_error", {
+                        "segment_index": segment.index,
+                        "text": segment.text,
+                        "message": segment.error
+                    }))
+                    return
+                events.put_nowait(sse("audio", {
+                    "segment_index": segment.index,
+                    "text": segment.text,
+                    "audio_format": "mp3",
+                    "audio_base64": base64.b64encode(segment.audio).decode("ascii")
+                }))
+            
+            pipeline = OrderedTTSPipeline(synthesize, on_segment, max_concurrency=VOICE_CONFIG["tts_concurrency"])
+            
+            async def stream_chat() -> Optional[Dict[str, Any]]:
+                """在聊天舱壁线程中迭代同步流式生成器，分句后提交TTS；返回完成事件数据（聊天出错时为None）"""
+                # 会话ID随本次请求传给客户端，不修改共享客户端的当前会话（并发请求互不串话）
+                actual_conv_id = None
+                if target_conv_id:
+                    CozeAPIClient.validate_conversation_id(target_conv_id)
+                    actual_conv_id = target_conv_id
+                elif not claims:
+                    actual_conv_id = await _get_conversation_id_by_session(session_id)
+                
+                chunk_count = 0
+                full_content = ""
+                stream_iter = coze_chat_client.send_message_stream(request.message, conversation_id=actual_conv_id)
+                async for stream_data in _bulkhead("chat").iterate(stream_iter):
+                    stream_type = stream_data.get("type")
+                    
+                    if stream_type == "chunk":
+                        chunk_count += 1
+                        content = stream_data.get("content", "")
+                        full_content += content
+                        events.put_nowait(sse("chunk", {
+                            "content": content,
+                            "chunk_index": chunk_count,
+                            "conversation_id": stream_data.get("conversation_id")
+                        }))
+                        for sentence in splitter.feed(content):
+                            pipeline.submit(sentence)
+                    
+                    elif stream_type == "complete":
+                        actual_conv_id = stream_data.get("conversation_id")
+                        if not actual_conv_id:
+                            raise Exception("流式响应未返回conversation_id")
+                        session_token = await _commit_session(session_id, user_id, actual_conv_id)
+                        return {
+                            "total_chunks": chunk_count,
+                            "full_content": full_content,
+                            "conversation_id": actual_conv_id,
+                            "session_token": session_token
+                        }
+                    
+                    elif stream_type == "error":
+                        logger.error(f"语音聊天错误 - session_id: {session_id}, error: {stream_data.get('message')}")
+                        events.put_nowait(sse("error", {
+                            "message": stream_data.get("message", "未知错误"),
+                            "conversation_id": stream_data.get("conversation_id")
+                        }))
+                        break
+                return None
+            
+            async def pump_chat():
+                """聊天流结束（完成或出错）后合成剩余文本，等待全部音频段按序输出后再结束"""
+                summary = None
+                try:
+                    summary = await stream_chat()
+                except ValueError as ve:
+                    events.put_nowait(sse("error", {"message": f"会话ID参数错误: {str(ve)}"}))
+                except UpstreamError as ue:
+                    logger.warning(f"语音聊天上游错误 - session_id: {session_id}, error: {ue}", extra={"upstream": ue.details()})
+                    events.put_nowait(sse("error", {"message": str(ue), "error_type": ue.kind, "status_code": ue.status_code}))
+                except Exception as gen_error:
+                    logger.error(f"语音聊天生成器异常: {str(gen_error)}", exc_info=True)
+                    events.put_nowait(sse("error", {"message": f"语音聊天生成器异常: {str(gen_error)}"}))
+                # 客户端断开时任务被取消（CancelledError不在上面捕获），不再提交新的TTS
+                try:
+                    for sentence in splitter.flush():
+                        pipeline.submit(sentence)
+                    await pipeline.join()
+                    if summary:
+                        logger.info(f"语音聊天完成 - session_id: {session_id}, conv_id: {summary['conversation_id'][:15]}..., total_chunks: {summary['total_chunks']}, audio_segments: {pipeline.submitted}")
+                        events.put_nowait(sse("complete", {
+                            "total_chunks": summary["total_chunks"],
+                            "total_segments": pipeline.submitted,
+                            "full_content": summary["full_content"],
+                            "conversation_id": summary["conversation_id"],
+                            "session_token": summary["session_token"]
+                        }))
+                finally:
+                    events.put_nowait(None)  # 结束标记
+            
+            pump_task = asyncio.create_task(pump_chat())
+            try:
+                while True:
+                    event = await events.get()
+                    if event is None:
+                        break
+                    yield event
+            finally:
+                # 客户端断开或流结束：取消未完成的聊天迭代与TTS任务
+                pump_task.cancel()
+                await pipeline.aclose()
+        
+        return StreamingResponse(
+            stream_generator(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+                "Content-Encoding": "identity"
+            }
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"语音聊天处理失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"语音聊天失败: {str(e)}")
+
+"""
+    单轮交互接口（聊天、情绪分析并发执行，再按情绪合成回复语音）
+    - 情绪分析与聊天同时发起，总耗时≈max(聊天, 情绪分析) + TTS
+    - 情绪标签映射为TTS的emotion与emotion_scale（见 coze_tts_client.emotion_tag_to_tts）
+    - 情绪分析或TTS失败不影响文本回复，分别以中性语气/ tts_error 降级
+    """
+@app.post("/turn", response_model=TurnResponse, summary="单轮交互接口（聊天+情绪+语音）")
+async def turn(request: TurnRequest):
+    """
+    单轮交互接口（聊天、情绪分析并发执行，再按情绪合成回复语音）
+    - 情绪分析与聊天同时发起，总耗时≈max(聊天, 情绪分析) + TTS
+    - 情绪标签映射为TTS的emotion与emotion_scale（见 coze_tts_client.emotion_tag_to_tts）
+    - 情绪分析或TTS失败不影响文本回复，分别以中性语气/ tts_error 降级
+    """
+    try:
+        coze_chat_client = await _client("coze_chat_client")
+        coze_tts_client = await _client("coze_tts_client")
+        emotion_analyzer = await _client("emotion_analyzer")
+        if not coze_chat_client or not coze_tts_client or not emotion_analyzer:
+            raise HTTPException(status_code=500, detail="聊天/TTS客户端或情绪分析器未初始化")
+        if request.with_audio:
+            _check_voice(request.voice_id)  # 音色不存在时在发起聊天前返回400
+        
+        claims = _verify_session_token(request)  # 携带会话令牌时以令牌内容为准
+        user_id = claims.user_id if claims else (request.user_id or f"user_{uuid.uuid4().hex[:8]}")
+        session_id = claims.session_id if claims else (request.session_id or f"session_{uuid.uuid4().hex[:12]}")
+        message_id = f"msg_{uuid.uuid4().hex[:16]}"
+        timings: Dict[str, float] = {}
+        turn_start = time.perf_counter()
+        
+        logger.info(f"单轮交互请求 - session_id: {session_id}, user_id: {user_id}, message: {request.message[:50]}...")
+        
+        async def timed(stage: str, bulkhead: str, func, *args):
+            stage_start = time.perf_counter()
+            try:
+                return await _bulkhead(bulkhead).run(func, *args)
+            finally:
+                timings[stage] = round((time.perf_counter() - stage_start) * 1000, 1)
+        
+        # 会话ID随本次请求传给客户端，不修改共享客户端的当前会话（并发请求互不串话）
+        if claims:
+            target_conv_id = request.conversation_id or claims.conversation_id  # 令牌已携带绑定关系，无需查询会话存储
+        else:
+            target_conv_id = await _target_conversation(session_id, request.conversation_id)
+        
+        async def run_emotion() -> Dict[str, Any]:
+            # 情绪分析舱壁拒绝/超时不影响文本回复，按中性语气降级
+            try:
+                return await timed("emotion", "emotion", emotion_analyzer.analyze_emotion, request.message, user_id)
+            except BulkheadError as be:
+                logger.warning(f"单轮交互情绪分析降级 - session_id: {session_id}, error: {str(be)}")
+                return {"success": False, "error": str(be)}
+        
+        # 1. 聊天与情绪分析并发执行
+        (response_text, actual_conv_id), emotion_result = await asyncio.gather(
+            timed("chat", "chat", coze_chat_client.send_message, request.message, target_conv_id),
+            run_emotion()
+        )
+        
+        if not actual_conv_id:
+            raise Exception("Coze API未返回有效的conversation_id")
+        session_token = await _commit_session(session_id, user_id, actual_conv_id)
+        
+        # 2. 情绪标签 -> TTS情感参数（分析失败时为中性）
+        emotion_tag = emotion_result.get("emotion_analysis") if emotion_result.get("success") else None
+        tts_emotion, tts_emotion_scale = emotion_tag_to_tts(emotion_tag)
+        voice_catalog = app_state.get("voice_catalog")
+        if voice_catalog and not voice_catalog.supports(request.voice_id, tts_emotion):
+            tts_emotion = None  # 音色不支持映射出的情感：按音色默认语气合成，避免上游拒绝
+        
+        # 3. 按情绪合成回复语音
+        audio_base64, tts_error = None, None
+        if request.with_audio:
+            try:
+                tts_start = time.perf_counter()
+                try:
+                    # 与 /text-to-speech 相同的缓存与长文本分段（同一回复文本命中同一缓存条目）
+                    audio, _ = await _synthesize_cached(
+                        coze_tts_client, response_text, request.voice_id, tts_emotion, tts_emotion_scale,
+                        TTS_LONG_TEXT_CONFIG["concurrency"], DEFAULT_AUDIO_FORMAT
+                    )
+                finally:
+                    timings["tts"] = round((time.perf_counter() - tts_start) * 1000, 1)
+                audio_base64 = base64.b64encode(audio).decode("ascii")
+            except Exception as tts_exc:
+                tts_error = str(tts_exc)
+                logger.error(f"单轮交互TTS失败 - session_id: {session_id}, error: {tts_error}")
+        
+        timings["total"] = round((time.perf_counter() - turn_start) * 1000, 1)
+        logger.info(f"单轮交互响应 - session_id: {session_id}, emotion: {emotion_tag}, tts_emotion: {tts_emotion}/{tts_emotion_scale}, timings: {timings}")
+        
+        return TurnResponse(
+            response=response_text,
+            session_id=session_id,
+            message_id=message_id,
+            conversation_id=actual_conv_id,
+            emotion_analysis=emotion_tag,
+            tts_emotion=tts_emotion,
+            tts_emotion_scale=tts_emotion_scale,
+            audio_base64=audio_base64,
+            tts_error=tts_error,
+            timings_ms=timings,
+            session_token=session_token,
+            timestamp=datetime.now().isoformat()
+        )
+    
+    except ValueError as ve:
+        logger.error(f"单轮交互参数错误: {str(ve)}")
+        raise HTTPException(status_code=400, detail=f"参数错误: {str(ve)}")
+    except HTTPException:
+        raise
+    except BulkheadError as be:
+        logger.warning(f"单轮交互被舱壁拒绝: {str(be)}")
+        raise HTTPException(status_code=be.status_code, detail=str(be))
+    except UpstreamError as ue:
+        raise _upstream_http_error("单轮交互", ue)
+    except Exception as e:
+        logger.error(f"单轮交互处理失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"单轮交互失败: {str(e)}")
+
 """
     绑定会话ID（手动关联session_id和conversation_id）
     - 用于已有conversation_id时，绑定到指定session_id
@@ -468,19 +1214,20 @@ async def bind_conversation(session_id: str, request: BindConversationRequest):
     - 绑定后，该session_id的后续聊天会自动续传该conversation_id
     """
     try:
-        coze_chat_client = app_state.get("coze_chat_client")
+        coze_chat_client = await _client("coze_chat_client")
         if not coze_chat_client:
             raise HTTPException(status_code=500, detail="Coze聊天客户端未初始化")
         
         conversation_id = request.conversation_id
-        # 校验conversation_id有效性（调用coze_client的校验逻辑）
-        coze_chat_client.set_conversation_id(conversation_id)
+        # 校验conversation_id有效性（调用coze_client的校验逻辑，不修改共享客户端的当前会话）
+        coze_chat_client.validate_conversation_id(conversation_id)
         
         # 获取用户ID（如果session已存在则复用，否则自动生成）
-        user_id = app_state["session_map"].get(session_id, {}).get("user_id") or f"user_{uuid.uuid4().hex[:8]}"
+        existing = await _session_call("get", session_id)
+        user_id = existing.user_id if existing else f"user_{uuid.uuid4().hex[:8]}"
         
         # 更新双向映射
-        _update_session_mapping(session_id, user_id, conversation_id)
+        await _update_session_mapping(session_id, user_id, conversation_id)
         
         logger.info(f"会话绑定成功 - session_id: {session_id}, conversation_id: {conversation_id[:15]}...")
         
@@ -509,20 +1256,14 @@ async def clear_session(session_id: str):
     - 同时清除session_id与conversation_id的绑定关系
     """
     try:
-        coze_chat_client = app_state.get("coze_chat_client")
+        coze_chat_client = await _client("coze_chat_client")
         if not coze_chat_client:
             raise HTTPException(status_code=500, detail="Coze聊天客户端未初始化")
         
-        # 1. 清除客户端会话上下文
-        coze_chat_client.clear_conversation()
-        
-        # 2. 清除双向映射
-        session_info = app_state["session_map"].get(session_id)
+        # 1. 清除双向映射（客户端按请求续传会话，清除绑定即重置上下文）
+        session_info = await _session_call("remove", session_id)
         if session_info:
-            conversation_id = session_info["conversation_id"]
-            if conversation_id in app_state["conv_map"]:
-                del app_state["conv_map"][conversation_id]
-            del app_state["session_map"][session_id]
+            conversation_id = session_info.conversation_id
             logger.info(f"会话清除成功 - session_id: {session_id}, conv_id: {conversation_id[:15] if conversation_id else '无'}")
         else:
             logger.warning(f"会话清除 - session_id: {session_id} 不存在")
@@ -548,9 +1289,10 @@ async def get_session_info(session_id: str):
     - 返回session_id、user_id、conversation_id、最后活动时间
     """
     try:
-        session_info = app_state["session_map"].get(session_id)
-        if not session_info:
+        session_record = await _session_call("get", session_id)
+        if not session_record:
             raise HTTPException(status_code=404, detail=f"会话不存在 - session_id: {session_id}")
+        session_info = session_record.to_dict()
         
         return {
             "session_id": session_id,
@@ -579,11 +1321,12 @@ async def get_session_by_conversation(conversation_id: str):
     - 反向查找：已知conversation_id，获取对应的会话信息
     """
     try:
-        session_id = app_state["conv_map"].get(conversation_id)
-        if not session_id:
+        session_id = await _session_call("get_session_id", conversation_id)
+        session_record = await _session_call("get", session_id) if session_id else None
+        if not session_record:
             raise HTTPException(status_code=404, detail=f"未找到绑定的会话 - conversation_id: {conversation_id}")
         
-        session_info = app_state["session_map"][session_id]
+        session_info = session_record.to_dict()
         return {
             "conversation_id": conversation_id,
             "session_id": session_id,
@@ -599,100 +1342,476 @@ async def get_session_by_conversation(conversation_id: str):
         logger.error(f"查询会话失败 - conv_id: {conversation_id}, error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"查询会话失败: {str(e)}")
 
+async def _query_sessions(user_id: Optional[str], active_since: Optional[datetime],
+                          has_conversation: Optional[bool], cursor: Optional[str], limit: int, descending: bool):
+    """调用会话存储的游标查询（active_since转换为墙上时间戳）"""
+    since_ts = active_since.timestamp() if active_since is not None else None
+    return await _session_call("query", user_id=user_id, active_since=since_ts, has_conversation=has_conversation,
+                               cursor=cursor, limit=limit, descending=descending)
+
+def _session_summary(record) -> Dict[str, Any]:
+    """会话基础信息（不含历史消息）"""
+    info = record.to_dict()
+    return {
+        "session_id": record.session_id,
+        "user_id": info["user_id"],
+        "conversation_id": info["conversation_id"],
+        "last_activity": info["last_activity"]
+    }
+
 """
-    列出当前活跃的会话（分页）
-    - 仅返回基础信息，不包含历史消息
+    列出当前活跃的会话（游标分页）
+    - 按最后活动时间排序（默认最近活动在前），翻页时传入上一页返回的 next_cursor
+    - 支持按 user_id / active_since / has_conversation 过滤，走存储的二级索引，无需全量遍历
+    - 仅返回基础信息，不包含历史消息；offset 参数仅为兼容保留（代价随偏移量线性增长）
     """
 @app.get("/sessions")
-async def list_sessions(limit: int = Query(10, ge=1, le=50), offset: int = Query(0, ge=0)):
+async def list_sessions(
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    user_id: Optional[str] = Query(None, description="仅返回该用户的会话"),
+    active_since: Optional[datetime] = Query(None, description="仅返回该时间之后有活动的会话（ISO 8601）"),
+    has_conversation: Optional[bool] = Query(None, description="是否已绑定Coze对话"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="按最后活动时间排序方向"),
+    offset: int = Query(0, ge=0, description="兼容参数：跳过的条数（建议改用cursor）")
+):
     """
-    列出当前活跃的会话（分页）
-    - 仅返回基础信息，不包含历史消息
+    列出当前活跃的会话（游标分页）
+    - 按最后活动时间排序（默认最近活动在前），翻页时传入上一页返回的 next_cursor
+    - 支持按 user_id / active_since / has_conversation 过滤，走存储的二级索引，无需全量遍历
+    - 仅返回基础信息，不包含历史消息；offset 参数仅为兼容保留（代价随偏移量线性增长）
     """
     try:
-        session_list = list(app_state["session_map"].items())[offset:offset+limit]
+        descending = order == "desc"
+        records, next_cursor = [], None
+        exhausted = False
+        if offset and not cursor:
+            # 兼容offset：先跳过offset条得到对应游标
+            _, cursor = await _query_sessions(user_id, active_since, has_conversation, None, offset, descending)
+            exhausted = cursor is None
+        if not exhausted:
+            records, next_cursor = await _query_sessions(user_id, active_since, has_conversation,
+                                                         cursor, limit, descending)
         return {
-            "total": len(app_state["session_map"]),
+            "total": await _session_call("__len__"),
             "limit": limit,
-            "offset": offset,
-            "sessions": [
-                {
-                    "session_id": sid,
-                    "user_id": info["user_id"],
-                    "conversation_id": info["conversation_id"],
-                    "last_activity": info["last_activity"]
-                } for sid, info in session_list
-            ],
+            "offset": offset,  # 兼容旧版响应字段
+            "order": order,
+            "next_cursor": next_cursor,
+            "sessions": [_session_summary(record) for record in records],
             "timestamp": datetime.now().isoformat()
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"列出会话失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"列出会话失败: {str(e)}")
 
+"""
+    导出会话列表（NDJSON流式）
+    - 每行一个JSON会话对象，服务端按批次游标遍历，内存占用与总会话数无关
+    - 过滤参数与 /sessions 相同
+    """
+@app.get("/sessions/export")
+async def export_sessions(
+    user_id: Optional[str] = Query(None, description="仅导出该用户的会话"),
+    active_since: Optional[datetime] = Query(None, description="仅导出该时间之后有活动的会话（ISO 8601）"),
+    has_conversation: Optional[bool] = Query(None, description="是否已绑定Coze对话"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="按最后活动时间排序方向")
+):
+    """
+    导出会话列表（NDJSON流式）
+    - 每行一个JSON会话对象，服务端按批次游标遍历，内存占用与总会话数无关
+    - 过滤参数与 /sessions 相同
+    """
+    descending = order == "desc"
+    batch_size = 1000
+
+    async def generate_lines():
+        cursor = None
+        exported = 0
+        try:
+            while True:
+                records, cursor = await _query_sessions(user_id, active_since, has_conversation,
+                                                        cursor, batch_size, descending)
+                if records:
+                    exported += len(records)
+                    yield "".join(json.dumps(_session_summary(r), ensure_ascii=False) + "\n" for r in records)
+                if cursor is None:
+                    break
+            logger.info(f"会话导出完成 - 条数: {exported}")
+        except Exception as e:
+            logger.error(f"会话导出失败: {str(e)}", exc_info=True)
+            yield json.dumps({"error": f"会话导出失败: {str(e)}"}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        generate_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=sessions.ndjson"}
+    )
+
 # -------------------- 新增文本转语音API路由 --------------------
 """
-    调用Coze官方文本转语音API，流式返回MP3音频
-    - 文本限制：UTF-8编码≤1024字节，支持中英文
+    音色列表（从内存中的音色目录返回，不请求上游）
+    - emotion：只返回支持该情感的音色；language_code：按语言筛选
+    - 目录在启动时从快照恢复，并在后台定期从Coze刷新
+    """
+@app.get("/voices", summary="音色列表（含各音色支持的情感）")
+async def list_voices(
+    emotion: Optional[str] = Query(None, description="只返回支持该情感的音色（如 happy）"),
+    language_code: Optional[str] = Query(None, description="语言代码（如 zh）")
+):
+    """
+    音色列表（从内存中的音色目录返回，不请求上游）
+    - emotion：只返回支持该情感的音色；language_code：按语言筛选
+    - 目录在启动时从快照恢复，并在后台定期从Coze刷新
+    """
+    voice_catalog = app_state.get("voice_catalog")
+    if not voice_catalog:
+        raise HTTPException(status_code=404, detail="音色目录未启用（VOICE_CATALOG_ENABLED=false）")
+    if not voice_catalog.loaded:
+        raise HTTPException(status_code=503, detail="音色目录尚未加载，请稍后重试", headers={"Retry-After": "5"})
+    voices = voice_catalog.list(emotion, language_code)
+    return {
+        "default_voice_id": TEST_VOICE_ID,
+        "total": len(voices),
+        "source": voice_catalog.source,
+        "updated_at": voice_catalog.updated_at,
+        "voices": [voice.to_dict() for voice in voices]
+    }
+
+"""
+    调用Coze官方文本转语音API，流式返回音频
+    - 文本限制：单次上游请求≤1024字节；更长的文本（≤TTS_MAX_INPUT_BYTES）按句切分后并发合成，按顺序流式返回
     - 情感配置：仅多情感音色支持emotion参数，需参考Coze音色列表
-    - 响应格式：MP3音频流，前端可直接播放或下载
+    - 响应格式：默认MP3；请求体 response_format 或 Accept 请求头可选 ogg_opus/wav/pcm，sample_rate 可降低采样率以减小体积
+    - 异步模式（mode=async）：立即返回202与task_id，通过 GET /text-to-speech/{task_id} 轮询或 callback_url 回调获取结果
     """
 @app.post("/text-to-speech", summary="文本转语音接口（Coze官方集成）")
-async def text_to_speech(request: TextToSpeechRequest):
+async def text_to_speech(
+    request: TextToSpeechRequest,
+    http_request: Request,
+    mode: str = Query("sync", pattern="^(sync|async)$", description="sync：流式返回音频；async：立即返回任务ID，后台合成"),
+    callback_url: Optional[str] = Query(None, max_length=2048, description="异步模式下任务完成后POST任务状态的地址（http/https）")
+):
     """
-    调用Coze官方文本转语音API，流式返回MP3音频
-    - 文本限制：UTF-8编码≤1024字节，支持中英文
+    调用Coze官方文本转语音API，流式返回音频
+    - 文本限制：单次上游请求≤1024字节；更长的文本（≤TTS_MAX_INPUT_BYTES）按句切分后并发合成，按顺序流式返回
     - 情感配置：仅多情感音色支持emotion参数，需参考Coze音色列表
-    - 响应格式：MP3音频流，前端可直接播放或下载
+    - 响应格式：默认MP3；请求体 response_format 或 Accept 请求头可选 ogg_opus/wav/pcm，sample_rate 可降低采样率以减小体积
+    - 异步模式（mode=async）：立即返回202与task_id，通过 GET /text-to-speech/{task_id} 轮询或 callback_url 回调获取结果
     """
     try:
         # 1. 校验Coze TTS客户端
-        coze_tts_client = app_state.get("coze_tts_client")
+        coze_tts_client = await _client("coze_tts_client")
         if not coze_tts_client:
             raise HTTPException(status_code=500, detail="Coze TTS客户端未初始化，无法调用TTS服务")
         
         # 2. 校验文本字节长度（UTF-8编码）
         input_bytes = request.input.encode('utf-8')
-        if len(input_bytes) > 1024:
+        max_input_bytes = TTS_LONG_TEXT_CONFIG["max_input_bytes"]
+        if len(input_bytes) > max_input_bytes:
             raise HTTPException(
                 status_code=400,
-                detail=f"输入文本过长：UTF-8编码后{len(input_bytes)}字节，最大支持1024字节"
+                detail=f"输入文本过长：UTF-8编码后{len(input_bytes)}字节，最大支持{max_input_bytes}字节"
             )
         
+        # 输出格式：请求体优先，其次按Accept协商
+        response_format = request.response_format or negotiate_audio_format(http_request.headers.get("accept"), DEFAULT_AUDIO_FORMAT)
+        sample_rate = request.sample_rate
+        if sample_rate is not None and sample_rate not in VALID_SAMPLE_RATES:
+            raise HTTPException(status_code=400, detail=f"无效的采样率：{sample_rate}，支持：{', '.join(map(str, VALID_SAMPLE_RATES))}")
+        if len(input_bytes) > TTS_MAX_INPUT_BYTES:
+            _check_segmentable_format(response_format)
+        _check_voice(request.voice_id, request.emotion)  # 音色不存在或不支持该情感时直接返回400，不请求上游
+        media_type, extension = _audio_format(response_format)
+        
         # 3. 生成任务ID
         task_id = _generate_tts_task_id()
-        logger.info(f"TTS请求 - task_id: {task_id}, voice_id: {request.voice_id[:15]}..., text_length: {len(input_bytes)}字节")
-        
-        # 4. 调用Coze TTS客户端的text_to_speech方法（流式获取音频）
-        audio_stream = coze_tts_client.text_to_speech(
-            input=request.input,
-            voice_id=request.voice_id,  # 使用请求中的voice_id（默认已设置为TEST_VOICE_ID）
-            emotion=request.emotion,
-            emotion_scale=request.emotion_scale
-        )
+        logger.info(f"TTS请求 - task_id: {task_id}, voice_id: {request.voice_id[:15]}..., text_length: {len(input_bytes)}字节, format: {response_format}")
         
-        # 5. 构建流式响应（返回MP3音频）
-        return StreamingResponse(
-            audio_stream,
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": f"attachment; filename=\"tts_{task_id}.mp3\"",
-                "X-Task-Id": task_id,
-                "X-Voice-Id": request.voice_id,
-                "X-Text-Length": str(len(input_bytes)),
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive"
-            }
-        )
+        # 异步模式：提交到任务队列后立即返回
+        if mode == "async":
+            if callback_url:
+                # 白名单与地址校验（解析DNS，放到线程中执行）；不允许时抛出 CallbackRejected（ValueError，返回400）
+                await asyncio.to_thread(app_state["tts_jobs"].check_callback, callback_url)
+            tts_cache = app_state.get("tts_cache")
+            job = app_state["tts_jobs"].submit(TTSJob(
+                task_id=task_id,
+                input=request.input,
+                voice_id=request.voice_id,
+                emotion=request.emotion,
+                emotion_scale=request.emotion_scale,
+                response_format=response_format,
+                sample_rate=sample_rate,
+                cache_key=cache_key(request.input, request.voice_id, request.emotion, request.emotion_scale,
+                                    response_format, sample_rate) if tts_cache else None,
+                callback_url=callback_url
+            ))
+            return JSONResponse(status_code=202, content={**job.to_dict(), "status_url": f"/text-to-speech/{task_id}"},
+                                headers={"Location": f"/text-to-speech/{task_id}", "X-Task-Id": task_id})
+        
+        headers = {
+            "Content-Disposition": f"attachment; filename=\"tts_{task_id}.{extension}\"",
+            "X-Task-Id": task_id,
+            "X-Voice-Id": request.voice_id,
+            "X-Text-Length": str(len(input_bytes)),
+            "X-Audio-Format": response_format,
+            "Vary": "Accept",
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive"
+        }
+        
+        # 4. 查找音频缓存：内存命中直接返回字节，磁盘命中打开文件后按句柄发送（不经过上游与生成器；
+        #    文件在打开前被淘汰删除时按未命中继续合成）
+        tts_cache = app_state.get("tts_cache")
+        key = cache_key(request.input, request.voice_id, request.emotion, request.emotion_scale,
+                        response_format, sample_rate) if tts_cache else None
+        if key:
+            headers["X-Audio-Url"] = f"/audio/{key}"  # 可重复获取的地址（支持ETag与Range，未命中时在合成完成后可用）
+            cached, cached_path = tts_cache.lookup(key)
+            if cached is not None:
+                return Response(content=cached, media_type=media_type, headers={**headers, "X-Cache": "hit-memory"})
+            cached_file = await asyncio.to_thread(tts_cache.open, key, cached_path) if cached_path else None
+            if cached_file is not None:
+                return file_response(cached_file, media_type, {**headers, "X-Cache": "hit-disk"},
+                                     background=BackgroundTask(tts_cache.promote, key, cached_path))
+        
+        upstream_stream = None
+        if len(input_bytes) > TTS_MAX_INPUT_BYTES:
+            # 5. 长文本：按句切分为≤1024字节的片段，并发合成，按顺序逐段流式返回（单个片段同样走音频缓存）
+            segments = split_long_text(request.input, target_bytes=TTS_LONG_TEXT_CONFIG["segment_bytes"])
+            headers["X-Segments"] = str(len(segments))
+            logger.info(f"TTS长文本切分 - task_id: {task_id}, segments: {len(segments)}")
+            audio_chunks = _iter_text_segments(coze_tts_client, segments, request.voice_id, request.emotion,
+                                               request.emotion_scale, TTS_LONG_TEXT_CONFIG["concurrency"],
+                                               response_format, sample_rate)
+        elif app_state.get("tts_streamer"):
+            # 5. 异步直通：在事件循环中转发上游音频（首块立即发出，之后自适应合并小块，不经过线程池）
+            upstream_stream = app_state["tts_streamer"].open(
+                coze_tts_client, request.input, request.voice_id, request.emotion, request.emotion_scale,
+                response_format, sample_rate
+            )
+            audio_chunks = upstream_stream.__aiter__()
+        else:
+            # 5. 调用Coze TTS客户端的text_to_speech方法（流式获取音频，在TTS舱壁线程中迭代）
+            audio_chunks = _bulkhead("tts").iterate(coze_tts_client.text_to_speech(
+                input=request.input,
+                voice_id=request.voice_id,  # 使用请求中的voice_id（默认已设置为TEST_VOICE_ID）
+                emotion=request.emotion,
+                emotion_scale=request.emotion_scale,
+                response_format=response_format,
+                sample_rate=sample_rate
+            ))
+        # 先取第一段音频：参数错误、上游失败、舱壁拒绝在返回响应头之前即可转换为对应状态码
+        try:
+            first_chunk = await audio_chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = b""
+        if upstream_stream is not None and upstream_stream.first_byte_ms is not None:
+            headers["Server-Timing"] = f"upstream-ttfb;dur={upstream_stream.first_byte_ms}"
+        
+        async def audio_stream():
+            parts = [first_chunk]
+            yield first_chunk
+            async for chunk in audio_chunks:
+                parts.append(chunk)
+                yield chunk
+            if upstream_stream is not None:
+                logger.info(f"TTS直通完成 - task_id: {task_id}, bytes: {upstream_stream.bytes}, writes: {upstream_stream.writes}, "
+                            f"first_byte_ms: {upstream_stream.first_byte_ms}, bytes_per_second: {upstream_stream.bytes_per_second}")
+            # 完整合成后写入缓存（客户端中途断开时不写入）
+            if key:
+                await asyncio.to_thread(tts_cache.put, key, b"".join(parts), extension)
+        
+        # 6. 构建流式响应（返回音频）
+        return StreamingResponse(audio_stream(), media_type=media_type, headers={**headers, "X-Cache": "miss"})
     
     except ValueError as ve:
         logger.error(f"TTS参数错误 - task_id: {task_id if 'task_id' in locals() else 'unknown'}, error: {str(ve)}")
         raise HTTPException(status_code=400, detail=f"参数错误：{str(ve)}")
     except HTTPException:
         raise
+    except JobQueueFull as qf:
+        logger.warning(f"TTS任务被拒绝 - task_id: {task_id if 'task_id' in locals() else 'unknown'}, error: {str(qf)}")
+        raise HTTPException(status_code=qf.status_code, detail=str(qf), headers={"Retry-After": "5"})
+    except BulkheadError as be:
+        logger.warning(f"TTS被舱壁拒绝 - task_id: {task_id if 'task_id' in locals() else 'unknown'}, error: {str(be)}")
+        raise HTTPException(status_code=be.status_code, detail=str(be))
+    except UpstreamError as ue:
+        raise _upstream_http_error("TTS", ue)
     except Exception as e:
         logger.error(f"TTS处理失败 - task_id: {task_id if 'task_id' in locals() else 'unknown'}, error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"文本转语音失败：{str(e)}")
 
+"""查询异步TTS任务状态"""
+@app.get("/text-to-speech/{task_id}", summary="查询异步TTS任务")
+async def get_tts_job(task_id: str = Path(..., description="POST /text-to-speech?mode=async 返回的任务ID")):
+    """查询异步TTS任务状态"""
+    job = app_state["tts_jobs"].get(task_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"TTS任务不存在或已过期：{task_id}")
+    return job.to_dict(app_state["tts_jobs"].audio_url(task_id))
+
+"""下载异步TTS任务生成的音频"""
+@app.get("/text-to-speech/{task_id}/audio", summary="下载异步TTS任务音频")
+async def get_tts_job_audio(request: Request, task_id: str = Path(..., description="POST /text-to-speech?mode=async 返回的任务ID")):
+    """下载异步TTS任务生成的音频"""
+    job = app_state["tts_jobs"].get(task_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"TTS任务不存在或已过期：{task_id}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"TTS任务尚未完成（状态: {job.status}）")
+    media_type, extension = _audio_format(job.response_format)
+    headers = {"Content-Disposition": f"attachment; filename=\"tts_{task_id}.{extension}\"", "X-Task-Id": task_id}
+    audio = job.audio
+    if audio is not None:
+        return audio_response(request.headers, content_etag(audio), data=audio, media_type=media_type, headers=headers)
+    # 任务记录中的音频因保留总量上限已释放，从音频缓存读取
+    response = await _cached_audio_response(request, job.cache_key, headers) if job.cache_key else None
+    if response is None:
+        raise HTTPException(status_code=410, detail="TTS任务音频已超出保留容量且已从缓存淘汰，请重新提交任务")
+    return response
+
+# 缓存文件扩展名 -> Content-Type
+_EXT_MEDIA_TYPES: Dict[str, str] = {extension: media_type for media_type, extension in AUDIO_FORMATS.values()}
+
+"""按缓存键返回已缓存的音频（支持ETag与Range；条目不存在时返回None）"""
+async def _cached_audio_response(request: Request, key: str, headers: Dict[str, str]) -> Optional[Response]:
+    """按缓存键返回已缓存的音频（支持ETag与Range；Content-Type按条目的格式；条目不存在时返回None）"""
+    tts_cache = app_state.get("tts_cache")
+    if not tts_cache:
+        return None
+    cached, cached_path = tts_cache.lookup(key)
+    media_type = _EXT_MEDIA_TYPES.get(tts_cache.ext(key), "application/octet-stream")
+    if cached is not None:
+        etag = tts_cache.etag(key)
+        return audio_response(request.headers, etag, data=cached, media_type=media_type, headers=headers) if etag else None
+    if cached_path:
+        etag = await asyncio.to_thread(tts_cache.etag, key)
+        cached_file = await asyncio.to_thread(tts_cache.open, key, cached_path) if etag else None
+        if cached_file is not None:
+            return audio_response(request.headers, etag, file=cached_file, media_type=media_type, headers=headers,
+                                  background=BackgroundTask(tts_cache.promote, key, cached_path))
+    return None
+
+"""
+    获取已缓存的TTS音频（内容寻址，地址见 /text-to-speech 响应头 X-Audio-Url）
+    - 强ETag由音频内容生成，If-None-Match 匹配时返回304
+    - 支持 Range 范围请求（206），便于播放器拖动与断点续传
+    - 响应可被浏览器与CDN缓存（Cache-Control: public, max-age=TTS_CACHE_HTTP_MAX_AGE）
+    """
+@app.api_route("/audio/{key}", methods=["GET", "HEAD"], summary="获取已缓存的TTS音频（支持ETag与Range）")
+async def get_cached_audio(request: Request, key: str = Path(..., pattern="^[0-9a-f]{64}$", description="音频缓存键")):
+    """
+    获取已缓存的TTS音频（内容寻址，地址见 /text-to-speech 响应头 X-Audio-Url）
+    - 强ETag由音频内容生成，If-None-Match 匹配时返回304
+    - 支持 Range 范围请求（206），便于播放器拖动与断点续传
+    - 响应可被浏览器与CDN缓存（Cache-Control: public, max-age=TTS_CACHE_HTTP_MAX_AGE）
+    """
+    tts_cache = app_state.get("tts_cache")
+    extension = tts_cache.ext(key) if tts_cache else DEFAULT_AUDIO_FORMAT
+    headers = {
+        "Cache-Control": f"public, max-age={TTS_CACHE_CONFIG['http_max_age']}",
+        "Content-Disposition": f"inline; filename=\"tts_{key[:16]}.{extension}\""
+    }
+    response = await _cached_audio_response(request, key, headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="音频不存在或已从缓存中淘汰")
+    return response
+
+"""
+    批量文本转语音
+    - 条目按 concurrency 并发合成（先查音频缓存），每完成一条立即写入响应
+    - 输出 zip 或 multipart/mixed，最后附带 manifest.json 结果清单
+    - 单条失败不中断批量，失败条目写入 <文件名>.error.json 并记入清单
+    """
+@app.post("/text-to-speech/batch", summary="批量文本转语音接口")
+async def text_to_speech_batch(request: TTSBatchRequest):
+    """
+    批量文本转语音
+    - 条目按 concurrency 并发合成（先查音频缓存），每完成一条立即写入响应
+    - 输出 zip 或 multipart/mixed，最后附带 manifest.json 结果清单
+    - 单条失败不中断批量，失败条目写入 <文件名>.error.json 并记入清单
+    """
+    coze_tts_client = await _client("coze_tts_client")
+    if not coze_tts_client:
+        raise HTTPException(status_code=500, detail="Coze TTS客户端未初始化，无法调用TTS服务")
+    items = request.items
+    if len(items) > TTS_BATCH_CONFIG["max_items"]:
+        raise HTTPException(status_code=400, detail=f"条目过多：{len(items)}条，最多支持{TTS_BATCH_CONFIG['max_items']}条")
+    
+    concurrency = min(request.concurrency or TTS_BATCH_CONFIG["concurrency"], TTS_BATCH_CONFIG["max_concurrency"], len(items))
+    batch_id = _generate_tts_task_id()
+    max_input_bytes = TTS_LONG_TEXT_CONFIG["max_input_bytes"]
+    writer = create_archive_writer(request.format)
+    logger.info(f"批量TTS请求 - batch_id: {batch_id}, items: {len(items)}, concurrency: {concurrency}, format: {request.format}")
+    
+    async def run_item(index: int, item: TTSBatchItem) -> Tuple[Optional[bytes], Dict[str, Any]]:
+        response_format = item.response_format or DEFAULT_AUDIO_FORMAT
+        entry = {"index": index, "id": item.id, "format": response_format,
+                 "file": f"{_batch_item_name(index, item)}.{_audio_format(response_format)[1]}"}
+        start = time.perf_counter()
+        try:
+            input_size = len(item.input.encode("utf-8"))
+            if input_size > max_input_bytes:
+                raise ValueError(f"输入文本过长：UTF-8编码后{input_size}字节，最大支持{max_input_bytes}字节")
+            _check_voice(item.voice_id, item.emotion)
+            audio, cache_state = await _synthesize_cached(
+                coze_tts_client, item.input, item.voice_id, item.emotion, item.emotion_scale, TTS_LONG_TEXT_CONFIG["concurrency"],
+                response_format, item.sample_rate)
+            entry.update(status="ok", cache=cache_state, bytes=len(audio))
+            return audio, entry
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status_code = getattr(e, "status_code", 400 if isinstance(e, ValueError) else 500)
+            entry.update(status="error", status_code=status_code,
+                         error_type=getattr(e, "kind", type(e).__name__), error=str(e))
+            entry["file"] = f"{_batch_item_name(index, item)}.error.json"
+            logger.warning(f"批量TTS条目失败 - batch_id: {batch_id}, index: {index}, error: {str(e)}")
+            return None, entry
+        finally:
+            entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    
+    async def archive_stream():
+        # 结果队列有界：客户端读取慢时暂停合成，避免已完成的音频堆积在内存中
+        results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+        pending = iter(enumerate(items))
+        
+        async def worker():
+            for index, item in pending:
+                await results.put(await run_item(index, item))
+        
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        manifest = []
+        try:
+            for _ in range(len(items)):
+                audio, entry = await results.get()
+                manifest.append(entry)
+                if audio is not None:
+                    yield writer.add(entry["file"], audio, _audio_format(entry["format"])[0], headers={"X-Item-Index": str(entry["index"]), "X-Cache": entry["cache"]})
+                else:
+                    yield writer.add(entry["file"], json.dumps(entry, ensure_ascii=False).encode("utf-8"), "application/json",
+                                     headers={"X-Item-Index": str(entry["index"])})
+            
+            manifest.sort(key=lambda entry: entry["index"])
+            failed = sum(1 for entry in manifest if entry["status"] != "ok")
+            summary = {"batch_id": batch_id, "total": len(items), "succeeded": len(items) - failed, "failed": failed, "items": manifest}
+            yield writer.add("manifest.json", json.dumps(summary, ensure_ascii=False, indent=2).encode("utf-8"), "application/json")
+            yield writer.finish()
+            logger.info(f"批量TTS完成 - batch_id: {batch_id}, succeeded: {len(items) - failed}, failed: {failed}")
+        finally:
+            # 客户端断开时取消剩余条目
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    headers = {"X-Batch-Id": batch_id, "X-Batch-Items": str(len(items)), "Cache-Control": "no-cache"}
+    if request.format == "zip":
+        headers["Content-Disposition"] = f"attachment; filename=\"{batch_id}.zip\""
+    return StreamingResponse(archive_stream(), media_type=writer.media_type, headers=headers)
+
 # -------------------- 新增情绪分析API路由 --------------------
 """
     情绪分析接口
@@ -708,7 +1827,7 @@ async def emotion_analysis(request: EmotionAnalysisRequest):
     """
     try:
         # 1. 校验情绪分析器
-        emotion_analyzer = app_state.get("emotion_analyzer")
+        emotion_analyzer = await _client("emotion_analyzer")
         if not emotion_analyzer:
             raise HTTPException(status_code=500, detail="情绪分析器未初始化，无法调用情绪分析服务")
         
@@ -717,8 +1836,8 @@ async def emotion_analysis(request: EmotionAnalysisRequest):
         
         logger.info(f"情绪分析请求 - user_id: {user_id}, text: {request.text[:50]}...")
         
-        # 3. 调用情绪分析器
-        result = emotion_analyzer.analyze_emotion(request.text, user_id)
+        # 3. 调用情绪分析器（在情绪分析舱壁线程中执行）
+        result = await _bulkhead("emotion").run(emotion_analyzer.analyze_emotion, request.text, user_id)
         
         logger.info(f"情绪分析响应 - user_id: {user_id}, success: {result['success']}")
         
@@ -738,6 +1857,9 @@ async def emotion_analysis(request: EmotionAnalysisRequest):
         raise HTTPException(status_code=400, detail=f"参数错误: {str(ve)}")
     except HTTPException:
         raise
+    except BulkheadError as be:
+        logger.warning(f"情绪分析被舱壁拒绝: {str(be)}")
+        raise HTTPException(status_code=be.status_code, detail=str(be))
     except Exception as e:
         logger.error(f"情绪分析处理失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"情绪分析失败: {str(e)}")
@@ -786,5 +1908,6 @@ if __name__ == "__main__":
         port=SERVER_CONFIG.get("port", 6001),
         reload=SERVER_CONFIG.get("debug", False),
         log_level=SERVER_CONFIG.get("log_level", "info"),
-        access_log=True
+        access_log=False,  # 访问日志由 AccessLogMiddleware 异步输出
+        timeout_graceful_shutdown=int(DRAIN_CONFIG["grace_period"])  # 停机时等待进行中连接的宽限期，超时强制取消（计入被放弃的请求）
     )
\ No newline at end of file
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+音频的HTTP条件请求与范围请求
+核心功能：
+- 强ETag：由音频内容的SHA-256生成（见 tts_cache.content_etag），内容不变则ETag不变
+- If-None-Match 命中时返回 304（不发送音频）
+- Range 请求返回 206 + Content-Range；起始位置超出内容长度时返回 416；语法无效或多段范围忽略Range，按完整内容返回 200
+- 内存中的音频直接切片返回；磁盘文件在命中时已打开，按句柄分块发送（文件随后被缓存淘汰删除也不影响本次响应）
+- Accept 协商：按 q 值从客户端可接受的音频类型中选择输出格式（mp3 / ogg_opus / wav / pcm）
+"""
+
+import os
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.datastructures import Headers
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+# Accept 中的媒体类型 -> TTS输出格式
+ACCEPT_AUDIO_FORMATS: Dict[str, str] = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "ogg_opus",
+    "audio/opus": "ogg_opus",
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/pcm": "pcm",
+    "audio/l16": "pcm",
+}
+
+
+def negotiate_audio_format(accept: Optional[str], default: str = "mp3") -> str:
+    """
+    按 Accept 请求头选择音频输出格式
+    - 取 q 值最高的可支持类型（q 值相同时取先出现的）；audio/* 与 */* 使用默认格式
+    - 没有可支持的类型时返回默认格式（不返回406，兼容只发送 application/json 的调用方）
+    """
+    if not accept:
+        return default
+    best, best_q = default, -1.0
+    for part in accept.split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        media_type = media_type.lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        fmt = ACCEPT_AUDIO_FORMATS.get(media_type) or (default if media_type in ("audio/*", "*/*") else None)
+        if fmt and q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否匹配（弱比较：忽略 W/ 前缀；* 匹配任意）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def parse_single_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段字节范围，返回闭区间 (start, end)
+    - 非 bytes 单位、多段范围或语法无效（如 bytes=5-3、bytes=abc）返回None（按RFC 9110忽略Range，返回完整内容）
+    - 语法有效但无法满足（起始位置超出内容长度、后缀长度为0）时抛出 ValueError
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, separator, end_text = spec.strip().partition("-")
+    if not separator or (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+    if not start_text:
+        # 后缀范围：最后N个字节
+        if not end_text:
+            return None
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError(f"范围无法满足: {range_header}")
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end_text and end < start:
+        return None
+    if start >= size:
+        raise ValueError(f"范围超出内容长度: {range_header}")
+    return start, min(end, size - 1)
+
+
+def _iter_file(file: BinaryIO, start: int, length: int) -> Iterator[bytes]:
+    """从已打开的文件读取 [start, start+length) 区间（在线程池中迭代）"""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def file_response(file: BinaryIO, media_type: str, headers: Optional[Dict[str, str]] = None,
+                  byte_range: Optional[Tuple[int, int]] = None,
+                  background: Optional[BackgroundTask] = None) -> Response:
+    """
+    按已打开的文件句柄发送音频（byte_range 为闭区间，None表示完整内容）
+    句柄在发送完成（或响应未发送正文，如HEAD）后关闭
+    """
+    size = os.fstat(file.fileno()).st_size
+    start, end = byte_range or (0, size - 1)
+    headers = {**(headers or {}), "Content-Length": str(end - start + 1)}
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    tasks = BackgroundTasks()
+    tasks.add_task(file.close)
+    if background is not None:
+        tasks.add_task(background)
+    return StreamingResponse(_iter_file(file, start, end - start + 1), status_code=status_code,
+                             media_type=media_type, headers=headers, background=tasks)
+
+
+def audio_response(request_headers: Headers, etag: str, data: Optional[bytes] = None, file: Optional[BinaryIO] = None,
+                   media_type: str = "audio/mpeg", headers: Optional[Dict[str, str]] = None,
+                   background: Optional[BackgroundTask] = None) -> Response:
+    """
+    按条件请求/范围请求构建音频响应（data 与 file 二选一；file 为已打开的文件句柄，响应结束后关闭）
+    :param request_headers: 请求头
+    :param etag: 强ETag（带引号）
+    """
+    headers = {**(headers or {}), "ETag": etag, "Accept-Ranges": "bytes"}
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        if file is not None:
+            file.close()
+        return Response(status_code=304, headers=headers)
+    size = os.fstat(file.fileno()).st_size if file is not None else len(data)
+
+    byte_range = None
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_single_range(range_header, size)
+        except ValueError:
+            if file is not None:
+                file.close()
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if file is not None:
+        return file_response(file, media_type, headers, byte_range, background)
+    if byte_range:
+        start, end = byte_range
+        return Response(content=data[start:end + 1], status_code=206, media_type=media_type, background=background,
+                        headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"})
+    return Response(content=data, media_type=media_type, headers=headers, background=background)
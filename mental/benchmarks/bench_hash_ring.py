@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+一致性哈希环基准测试：节点加入/离开时的会话迁移比例 + 负载均匀度 + 查找吞吐
+对比对象：
+- 取模哈希（hash(key) % N）：节点数变化时几乎所有会话都会换节点
+- HashRing（虚拟节点）：理想情况下只迁移约 1/N 的会话
+用法：python benchmarks/bench_hash_ring.py [会话数，默认100000] [节点数，默认4]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_affinity import HashRing, _hash64
+
+
+def _nodes(count: int):
+    return [f"http://10.0.0.{i + 1}:6001" for i in range(count)]
+
+
+def _assign_modulo(keys, nodes):
+    return {key: nodes[_hash64(key) % len(nodes)] for key in keys}
+
+
+def _assign_ring(keys, ring):
+    return {key: ring.get_node(key) for key in keys}
+
+
+def _moved(before, after) -> float:
+    return sum(1 for key in before if before[key] != after[key]) / len(before)
+
+
+def _spread(assignment, nodes) -> str:
+    """负载分布：各节点会话数的 最大/平均 与变异系数"""
+    counts = [0] * len(nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    for node in assignment.values():
+        counts[index[node]] += 1
+    mean = statistics.mean(counts)
+    return f"max/avg={max(counts) / mean:.3f}, cv={statistics.pstdev(counts) / mean:.3f}"
+
+
+def main():
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    node_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    keys = [f"s:session_{i:012x}" for i in range(key_count)]
+    nodes = _nodes(node_count)
+    grown = _nodes(node_count + 1)
+    shrunk = nodes[:-1]
+
+    print(f"会话数: {key_count}, 节点数: {node_count}")
+    print(f"理想迁移比例 - 加入1个节点: {1 / (node_count + 1):.1%}, 离开1个节点: {1 / node_count:.1%}")
+    print()
+
+    before = _assign_modulo(keys, nodes)
+    print(f"[取模哈希] 加入节点迁移: {_moved(before, _assign_modulo(keys, grown)):.1%}, "
+          f"离开节点迁移: {_moved(before, _assign_modulo(keys, shrunk)):.1%}, 分布: {_spread(before, nodes)}")
+
+    for vnodes in (1, 16, 160, 640):
+        ring = HashRing(nodes, vnodes)
+        before = _assign_ring(keys, ring)
+        ring.add_node(grown[-1])
+        joined = _moved(before, _assign_ring(keys, ring))
+        ring.remove_node(grown[-1])
+        ring.remove_node(nodes[-1])
+        left = _moved(before, _assign_ring(keys, ring))
+        print(f"[HashRing vnodes={vnodes:<4}] 加入节点迁移: {joined:.1%}, 离开节点迁移: {left:.1%}, "
+              f"分布: {_spread(before, nodes)}")
+
+    ring = HashRing(nodes, 160)
+    start = time.perf_counter()
+    for key in keys:
+        ring.get_node(key)
+    elapsed = time.perf_counter() - start
+    print()
+    print(f"查找吞吐（vnodes=160）: {key_count / elapsed:,.0f} 次/秒（{elapsed / key_count * 1e6:.2f} µs/次）")
+
+
+if __name__ == "__main__":
+    main()
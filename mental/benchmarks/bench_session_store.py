@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+会话存储基准测试：单会话内存占用 + 读写吞吐
+对比对象：
+- 原实现：session_map（dict of dict，ISO字符串时间）+ conv_map
+- SessionStore：__slots__ 记录 + monotonic时间戳 + LRU/TTL
+用法：python benchmarks/bench_session_store.py [会话数，默认100000]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionStore
+
+
+def _ids(count: int):
+    """预先生成ID，避免把ID字符串本身的内存计入存储开销"""
+    return [(f"session_{i:012x}", f"user_{i % 50000:08x}", f"7{i:018d}") for i in range(count)]
+
+
+def bench_dict_baseline(ids):
+    """原实现：dict of dict"""
+    session_map, conv_map = {}, {}
+    for session_id, user_id, conv_id in ids:
+        session_map[session_id] = {
+            "user_id": user_id,
+            "conversation_id": conv_id,
+            "last_activity": datetime.now().isoformat()
+        }
+        conv_map[conv_id] = session_id
+    return session_map, conv_map
+
+
+def bench_session_store(ids):
+    """SessionStore（容量设为会话数，避免淘汰干扰测量）"""
+    store = SessionStore(max_sessions=len(ids), idle_ttl=3600)
+    for session_id, user_id, conv_id in ids:
+        store.bind(session_id, user_id, conv_id)
+    return store
+
+
+def measure(name: str, func, ids):
+    """测量内存增量与写入耗时"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    keep = func(ids)
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total_bytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{name:<24} 总内存: {total_bytes / 1024 / 1024:8.2f} MB  "
+          f"单会话: {total_bytes / len(ids):7.1f} B  写入: {len(ids) / elapsed:10.0f} ops/s")
+    return keep
+
+
+def bench_lookup(store: SessionStore, ids):
+    """读取吞吐：正向 + 反向查找"""
+    start = time.perf_counter()
+    for session_id, _, conv_id in ids:
+        store.get_conversation_id(session_id)
+        store.get_session_id(conv_id)
+    elapsed = time.perf_counter() - start
+    print(f"{'SessionStore 查找':<24} {len(ids) * 2 / elapsed:10.0f} ops/s（正向+反向）")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    ids = _ids(count)
+    print(f"会话数: {count}")
+    measure("dict of dict（原实现）", bench_dict_baseline, ids)
+    store = measure("SessionStore", bench_session_store, ids)
+    bench_lookup(store, ids)
+
+    # LRU淘汰：容量为会话数的一半，写满后存储大小保持不变
+    bounded = SessionStore(max_sessions=count // 2, idle_ttl=3600)
+    for session_id, user_id, conv_id in ids:
+        bounded.bind(session_id, user_id, conv_id)
+    print(f"LRU上限 {count // 2}: 当前会话数 {len(bounded)}，淘汰 {bounded.evicted_lru}")
+
+
+if __name__ == "__main__":
+    main()
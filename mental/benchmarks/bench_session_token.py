@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+会话令牌基准测试：令牌校验 vs 会话存储查询的单次耗时
+对比对象：
+- SessionTokenCodec.verify：HMAC-SHA256 校验 + JSON解码（纯CPU）
+- SessionStore.get_conversation_id：进程内存储查询（仅单进程有效）
+- RedisSessionStore.get_conversation_id：共享存储查询（需设置 BENCH_REDIS_URL，否则跳过）
+用法：python benchmarks/bench_session_token.py [次数，默认100000]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionStore
+from session_token import SessionTokenCodec
+
+
+def _timeit(label: str, func, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed / len(args_list) * 1e6:8.2f} µs/次  ({len(args_list) / elapsed:,.0f} 次/秒)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    ids = [(f"session_{i:012x}", f"user_{i % 5000:08x}", f"7{i:018d}") for i in range(count)]
+
+    codec = SessionTokenCodec([("k2", "new-secret-" + "x" * 32), ("k1", "old-secret-" + "y" * 32)])
+    old_codec = SessionTokenCodec([("k1", "old-secret-" + "y" * 32)])
+    tokens = [(codec.issue(*item),) for item in ids]
+    old_tokens = [(old_codec.issue(*item),) for item in ids[:count // 10]]
+    print(f"次数: {count}, 令牌长度: {len(tokens[0][0])} 字节")
+
+    _timeit("签发令牌 issue", codec.issue, ids)
+    _timeit("校验令牌 verify（当前密钥）", codec.verify, tokens)
+    _timeit("校验令牌 verify（轮换前的旧密钥）", codec.verify, old_tokens)
+
+    store = SessionStore(max_sessions=count, idle_ttl=3600)
+    for session_id, user_id, conv_id in ids:
+        store.bind(session_id, user_id, conv_id)
+    _timeit("内存存储 get_conversation_id", store.get_conversation_id, [(item[0],) for item in ids])
+
+    redis_url = os.getenv("BENCH_REDIS_URL")
+    if redis_url:
+        from session_store_redis import RedisSessionStore
+        redis_store = RedisSessionStore(redis_url=redis_url, key_prefix="bench_session_token:")
+        sample = ids[:min(count, 10000)]
+        for session_id, user_id, conv_id in sample:
+            redis_store.bind(session_id, user_id, conv_id)
+        _timeit("Redis存储 get_conversation_id", redis_store.get_conversation_id, [(item[0],) for item in sample])
+        redis_store.close()
+    else:
+        print("Redis存储：未设置 BENCH_REDIS_URL，跳过（单次查询至少一个网络往返，通常 100µs 以上）")
+
+
+if __name__ == "__main__":
+    main()
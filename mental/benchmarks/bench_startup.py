@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试：从启动进程到 /livez、/readyz 返回200的时间
+对比对象：
+- 延迟构建（默认）：服务先开始监听，上游客户端在后台并行构建
+- 启动时构建（STARTUP_EAGER_INIT=true）：三个客户端并行构建完成后才开始监听
+同时列出 api_server 导入耗时最高的模块（python -X importtime），便于发现新增的重型导入
+用法：python benchmarks/bench_startup.py [轮数，默认3]
+"""
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ok(url: str, start: float, timeout: float = 30.0) -> float:
+    """轮询直到返回200，返回距进程启动的秒数"""
+    while time.perf_counter() - start < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"等待超时：{url}")
+
+
+def measure_startup(eager: bool):
+    port = _free_port()
+    env = dict(os.environ, STARTUP_EAGER_INIT="true" if eager else "false", SESSION_JOURNAL_ENABLED="false")
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        live = _wait_ok(f"http://127.0.0.1:{port}/livez", start)
+        ready = _wait_ok(f"http://127.0.0.1:{port}/readyz", start)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return live, ready
+
+
+def top_imports(limit: int = 8):
+    """api_server 导入耗时最高的模块（累计耗时，微秒）"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api_server"],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match and len(match.group(3)) <= 3:  # 只看顶层及第一层依赖
+            rows.append((int(match.group(2)), match.group(4)))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("api_server 导入耗时（累计）最高的模块：")
+    for cumulative, module in top_imports():
+        print(f"  {module:<32} {cumulative / 1000:8.1f} ms")
+
+    for label, eager in (("延迟构建（默认）", False), ("启动时并行构建", True)):
+        results = [measure_startup(eager) for _ in range(rounds)]
+        live = statistics.median(r[0] for r in results)
+        ready = statistics.median(r[1] for r in results)
+        print(f"{label:<20} /livez: {live * 1000:7.0f} ms   /readyz: {ready * 1000:7.0f} ms   （{rounds}轮中位数）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+舱壁隔离（bulkhead）：聊天 / TTS / 情绪分析各用一个独立的有界线程池执行阻塞的上游调用
+核心功能：
+- 每个舱壁有自己的线程数、排队上限和超时：某个上游变慢只会占满自己的线程池，不会拖垮其他功能
+- 排队已满立即拒绝（BulkheadFull → 503），等待结果超时（BulkheadTimeout → 504）
+- iterate() 把同步流式生成器（聊天流、TTS音频流）逐项放到舱壁线程中迭代，事件循环不被阻塞；
+  消费方提前结束（客户端断开、单项超时、aclose）时在舱壁线程中关闭生成器，及时释放上游连接
+- 统计：运行中/排队中请求数、饱和度、拒绝与超时次数，供 /health 与 /metrics 查看
+说明：超时只让调用方不再等待，线程中的上游请求会继续执行到结束（仍占用名额），饱和度如实反映上游状况
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+
+class BulkheadError(Exception):
+    """舱壁拒绝或超时（status_code 为建议返回的HTTP状态码）"""
+    status_code = 503
+
+    def __init__(self, name: str, message: str):
+        super().__init__(message)
+        self.name = name
+
+
+class BulkheadFull(BulkheadError):
+    """舱壁线程与排队均已占满"""
+    status_code = 503
+
+
+class BulkheadTimeout(BulkheadError):
+    """等待舱壁执行结果超时"""
+    status_code = 504
+
+
+_SENTINEL = object()
+
+
+def _close_iterator(in_flight: Optional[Future], iterator: Iterator[Any]):
+    """等待进行中的 next 返回后关闭生成器（生成器正在执行时不能关闭），触发其 finally 释放上游响应"""
+    if in_flight is not None:
+        wait([in_flight])
+    close = getattr(iterator, "close", None)
+    if close:
+        close()
+
+
+class Bulkhead:
+    """
+    有界线程池舱壁
+    :param name: 名称（chat / tts / emotion）
+    :param max_workers: 线程数（即该功能同时进行的上游请求上限）
+    :param queue_limit: 线程全忙时最多排队的任务数
+    :param timeout: 单次调用（流式迭代时为单项）等待结果的超时时间（秒）
+    """
+
+    def __init__(self, name: str, max_workers: int, queue_limit: int, timeout: float):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.queue_limit = max(0, queue_limit)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"bulkhead-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0  # 已提交未完成的任务数（运行中 + 排队中）
+
+        # 统计信息
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _on_done(self, _future: Future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def _submit(self, func: Callable, args: tuple, admit: bool) -> Future:
+        """提交任务；admit=False 时跳过排队上限检查（已开始的流式迭代不应在中途被拒绝）"""
+        with self._lock:
+            if admit and self._pending >= self.max_workers + self.queue_limit:
+                self.rejected += 1
+                raise BulkheadFull(self.name, f"{self.name}服务繁忙（线程与排队已满），请稍后重试")
+            self._pending += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            raise BulkheadFull(self.name, f"{self.name}服务正在关闭")
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def _wait(self, future: Future, timeout: Optional[float]) -> Any:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise BulkheadTimeout(self.name, f"{self.name}服务响应超时（{timeout or self.timeout}秒）")
+
+    async def run(self, func: Callable, *args: Any, timeout: Optional[float] = None, admit: bool = True) -> Any:
+        """在舱壁线程中执行阻塞函数并等待结果"""
+        return await self._wait(self._submit(func, args, admit), timeout)
+
+    async def iterate(self, iterator: Iterator[Any], item_timeout: Optional[float] = None) -> AsyncIterator[Any]:
+        """
+        在舱壁线程中逐项迭代同步生成器（仅第一项受排队上限约束，超时按单项计算）
+        未迭代完就结束时（消费方断开/aclose、单项超时或出错）在舱壁线程中关闭生成器：
+        进行中的 next 已返回时等待关闭完成，否则关闭排在它之后执行，不阻塞调用方
+        """
+        in_flight: Optional[Future] = None
+        exhausted = False
+        try:
+            while True:
+                in_flight = self._submit(next, (iterator, _SENTINEL), in_flight is None)
+                item = await self._wait(in_flight, item_timeout)
+                if item is _SENTINEL:
+                    exhausted = True
+                    return
+                yield item
+        finally:
+            if not exhausted:
+                try:
+                    closing = self._submit(_close_iterator, (in_flight, iterator), False)
+                except BulkheadError:
+                    closing = None  # 舱壁已关闭：生成器随垃圾回收关闭
+                if closing is not None and (in_flight is None or in_flight.done()):
+                    try:
+                        await asyncio.wrap_future(closing)
+                    except Exception:
+                        pass  # 关闭时的异常不覆盖原始结束原因
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+        running = min(pending, self.max_workers)
+        return {
+            "max_workers": self.max_workers,
+            "queue_limit": self.queue_limit,
+            "running": running,
+            "queued": pending - running,
+            "saturation": round(pending / (self.max_workers + self.queue_limit), 3),
+            "saturated": pending >= self.max_workers + self.queue_limit,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts
+        }
+
+    def shutdown(self, wait: bool = False):
+        """关闭线程池（不再接受新任务）"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def create_bulkheads(config: Dict[str, Dict[str, Any]]) -> Dict[str, Bulkhead]:
+    """根据 BULKHEAD_CONFIG 创建各功能的舱壁"""
+    return {
+        name: Bulkhead(name, options["max_workers"], options["queue_limit"], options["timeout"])
+        for name, options in config.items()
+    }
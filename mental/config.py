@@ -31,5 +31,204 @@ SERVER_CONFIG = {
     'max_request_size': 10 * 1024 * 1024,  # 最大请求大小（10MB）
 }
 
+# 语音流水线配置（/chat/voice：边生成回复边合成语音）
+VOICE_CONFIG = {
+    'tts_concurrency': int(os.getenv('VOICE_TTS_CONCURRENCY', 3)),  # 单个回复同时进行的TTS请求数上限
+    'max_segment_bytes': int(os.getenv('VOICE_MAX_SEGMENT_BYTES', 1024)),  # 单句最大字节数（Coze TTS限制1024）
+    'eager_first_sentence': os.getenv('VOICE_EAGER_FIRST', 'true').lower() == 'true',  # 首句在逗号处提前切分，缩短首段音频延迟
+}
+
+# 会话存储配置（memory：有界内存存储，LRU淘汰 + 空闲TTL过期；redis：多worker/多节点共享）
+SESSION_CONFIG = {
+    'backend': os.getenv('SESSION_BACKEND', 'memory'),  # 会话存储后端：memory / redis（多worker部署必须使用redis）
+    'max_sessions': int(os.getenv('SESSION_MAX_SESSIONS', 100000)),  # 最大会话数，超出按LRU淘汰
+    'idle_ttl': float(os.getenv('SESSION_IDLE_TTL', 7 * 24 * 3600)),  # 空闲过期时间（秒，默认7天，<=0不过期）
+    'wheel_tick': float(os.getenv('SESSION_WHEEL_TICK', 10)),  # 时间轮单槽时长（秒），即过期检查精度
+    'wheel_slots': int(os.getenv('SESSION_WHEEL_SLOTS', 512)),  # 时间轮槽数
+    'redis_url': os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'),  # redis后端连接地址
+    'redis_key_prefix': os.getenv('SESSION_REDIS_PREFIX', 'health_agent:session:'),  # redis键前缀
+    'redis_local_cache_size': int(os.getenv('SESSION_REDIS_LOCAL_CACHE', 1024)),  # 本地读缓存容量（0关闭）
+    'redis_local_cache_ttl': float(os.getenv('SESSION_REDIS_LOCAL_CACHE_TTL', 2.0)),  # 本地读缓存有效期（秒）
+}
+
+# 会话日志配置（仅memory后端：write-behind日志 + 定期快照，重启后恢复会话绑定）
+SESSION_JOURNAL_CONFIG = {
+    'enabled': os.getenv('SESSION_JOURNAL_ENABLED', 'true').lower() == 'true',  # 是否启用会话日志
+    'journal_dir': os.getenv('SESSION_JOURNAL_DIR', str(BASE_DIR / 'data' / 'sessions')),  # 日志与快照目录
+    'flush_interval': float(os.getenv('SESSION_JOURNAL_FLUSH_INTERVAL', 0.05)),  # 批量写入间隔（秒）
+    'fsync_interval': float(os.getenv('SESSION_JOURNAL_FSYNC_INTERVAL', 1.0)),  # fsync最小间隔（秒）
+    'snapshot_interval': float(os.getenv('SESSION_SNAPSHOT_INTERVAL', 300)),  # 定期快照间隔（秒）
+    'snapshot_max_ops': int(os.getenv('SESSION_SNAPSHOT_MAX_OPS', 50000)),  # 变更数超过该值时提前快照
+}
+
+# 无状态会话令牌配置（/chat、/chat/stream 返回签名令牌，客户端带回即可续传，无需查会话存储）
+SESSION_TOKEN_CONFIG = {
+    'enabled': os.getenv('SESSION_TOKEN_ENABLED', 'false').lower() == 'true',  # 是否签发/接受会话令牌
+    'keys': os.getenv('SESSION_TOKEN_KEYS', ''),  # 签名密钥 "kid1:secret1,kid2:secret2"，第一把签发，全部可校验（轮换时把新密钥放在最前）
+    'ttl': float(os.getenv('SESSION_TOKEN_TTL', 7 * 24 * 3600)),  # 令牌有效期（秒，默认7天）
+    'stateless': os.getenv('SESSION_TOKEN_STATELESS', 'false').lower() == 'true',  # true时聊天接口不再写会话存储，完全依赖令牌
+}
+
+# 准入控制配置（按路由限制并发，超载时返回503 + Retry-After）
+ADMISSION_CONFIG = {
+    'enabled': os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true',  # 是否启用准入控制
+    # 受限路由 "路径=并发上限:排队上限"，逗号分隔（未列出的路由不受限制）
+    'routes': os.getenv('ADMISSION_ROUTE_LIMITS',
+                        '/chat=32:64,/chat/stream=64:128,/chat/voice=16:32,/turn=16:32,'
+                        '/text-to-speech=16:64,/text-to-speech/batch=2:4,/emotion-analysis=16:64'),
+    'queue_timeout': float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10)),  # 正常情况下的最长排队时间（秒）
+    'target_delay': float(os.getenv('ADMISSION_TARGET_DELAY', 0.5)),  # 出现常驻队列后的最长排队时间（秒）
+    'interval': float(os.getenv('ADMISSION_INTERVAL', 1.0)),  # 队列持续非空多久视为常驻队列（秒）
+}
+
+# 上游优先级调度配置（实时对话优先于批量情绪分析/TTS）
+PRIORITY_CONFIG = {
+    'enabled': os.getenv('PRIORITY_ENABLED', 'true').lower() == 'true',  # 是否启用优先级调度
+    'upstream_slots': int(os.getenv('PRIORITY_UPSTREAM_SLOTS', 48)),  # 同时进行的上游请求总数
+    'weights': os.getenv('PRIORITY_WEIGHTS', 'interactive_stream=8,interactive_sync=4,batch=1'),  # 各通道权重
+    'starvation_timeout': float(os.getenv('PRIORITY_STARVATION_TIMEOUT', 5.0)),  # 队首等待超过该秒数时优先分配（防饥饿）
+    'batch_max_share': float(os.getenv('PRIORITY_BATCH_MAX_SHARE', 0.5)),  # 批量通道最多占用的名额比例
+    'header': os.getenv('PRIORITY_HEADER', 'X-Priority'),  # 显式指定通道的请求头（interactive_stream/interactive_sync/batch），只能降低路由默认通道
+    'raise_token': os.getenv('PRIORITY_RAISE_TOKEN', ''),  # 提升通道所需的令牌（请求头 X-Priority-Token 携带；为空则不允许提升）
+    # 路由默认通道（未列出的路由不参与调度）
+    'routes': os.getenv('PRIORITY_ROUTES',
+                        '/chat/stream=interactive_stream,/chat/voice=interactive_stream,'
+                        '/chat=interactive_sync,/turn=interactive_sync,'
+                        '/emotion-analysis=batch,/text-to-speech=batch,/text-to-speech/batch=batch'),
+    # 按用户公平调度：通道内按用户差额轮转（DRR），单个用户的大量并发只影响自己的排队时间
+    'user_headers': os.getenv('FAIR_USER_HEADERS', 'X-Tenant-Id,X-User-Id'),  # 识别用户/租户的请求头（都没有时使用请求体user_id，再退化为客户端IP）
+    'user_max_concurrency': int(os.getenv('FAIR_USER_MAX_CONCURRENCY', 4)),  # 单个用户同时占用的上游名额上限（0不限）
+    'user_max_queue': int(os.getenv('FAIR_USER_MAX_QUEUE', 16)),  # 单个用户最大排队数，超出返回429（0不限）
+    'route_costs': os.getenv('FAIR_ROUTE_COSTS', '/chat/voice=3,/turn=2'),  # 路由成本（DRR按成本扣减额度，未列出为1）
+}
+
+# 舱壁隔离配置（聊天/TTS/情绪分析各自独立的有界线程池，某个上游变慢不会拖垮其他功能）
+BULKHEAD_CONFIG = {
+    'chat': {
+        'max_workers': int(os.getenv('BULKHEAD_CHAT_WORKERS', 32)),  # 线程数（同时进行的聊天上游请求上限）
+        'queue_limit': int(os.getenv('BULKHEAD_CHAT_QUEUE', 64)),  # 线程全忙时的排队上限，超出返回503
+        'timeout': float(os.getenv('BULKHEAD_CHAT_TIMEOUT', 60)),  # 等待结果超时（秒，流式为单个片段），超时返回504
+    },
+    'tts': {
+        'max_workers': int(os.getenv('BULKHEAD_TTS_WORKERS', 16)),
+        'queue_limit': int(os.getenv('BULKHEAD_TTS_QUEUE', 64)),
+        'timeout': float(os.getenv('BULKHEAD_TTS_TIMEOUT', 30)),
+    },
+    'emotion': {
+        'max_workers': int(os.getenv('BULKHEAD_EMOTION_WORKERS', 8)),
+        'queue_limit': int(os.getenv('BULKHEAD_EMOTION_QUEUE', 32)),
+        'timeout': float(os.getenv('BULKHEAD_EMOTION_TIMEOUT', 30)),
+    },
+    # 会话存储（Redis后端的网络往返与绑定事务重试在此执行，不阻塞事件循环；内存后端直接调用，不经过舱壁）
+    'session': {
+        'max_workers': int(os.getenv('BULKHEAD_SESSION_WORKERS', 16)),
+        'queue_limit': int(os.getenv('BULKHEAD_SESSION_QUEUE', 256)),
+        'timeout': float(os.getenv('BULKHEAD_SESSION_TIMEOUT', 5)),
+    },
+}
+
+# 优雅停机配置（停机时先排空进行中的请求/流式回复，再持久化会话并关闭连接池）
+DRAIN_CONFIG = {
+    'grace_period': float(os.getenv('DRAIN_GRACE_PERIOD', 30)),  # 等待进行中请求完成的宽限期（秒），超时的请求被放弃并记录日志
+    'retry_after': int(os.getenv('DRAIN_RETRY_AFTER', 5)),  # 排空期间拒绝新请求时返回的Retry-After（秒）
+    'admin_token': os.getenv('ADMIN_TOKEN', ''),  # 管理接口（/admin/*）令牌，请求头 X-Admin-Token 携带；为空则管理接口禁用
+}
+
+# 启动配置（客户端延迟构建：服务先开始监听，上游客户端在后台并行构建）
+STARTUP_CONFIG = {
+    'eager_init': os.getenv('STARTUP_EAGER_INIT', 'false').lower() == 'true',  # 启动时等待全部客户端构建完成（并行构建）再开始接收请求
+    'warmup': os.getenv('STARTUP_WARMUP', 'true').lower() == 'true',  # 启动后立即在后台预热客户端；关闭则在首次使用时才构建
+}
+
+# 日志配置（队列异步写入 + 结构化JSON + 按路由采样 + 文件轮转）
+LOG_CONFIG = {
+    'level': os.getenv('LOG_LEVEL', 'INFO').upper(),  # 日志级别
+    'format': os.getenv('LOG_FORMAT', 'json'),  # json：单行JSON；text：原有文本格式
+    'file': os.getenv('LOG_FILE', str(BASE_DIR / 'logs' / 'api_server.log')),  # 日志文件（为空则只输出到stdout）
+    'max_bytes': int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024)),  # 按大小轮转：单个文件上限（字节）
+    'rotate_when': os.getenv('LOG_ROTATE_WHEN', ''),  # 按时间轮转（如 midnight / H），设置后不再按大小轮转
+    'backup_count': int(os.getenv('LOG_BACKUP_COUNT', 10)),  # 保留的历史文件数
+    'queue_size': int(os.getenv('LOG_QUEUE_SIZE', 10000)),  # 内存队列上限，写入跟不上时丢弃新日志（不阻塞请求）
+    'sample_rates': os.getenv('LOG_SAMPLE_RATES', '/health=0,/livez=0,/readyz=0,/metrics=0'),  # 按路由采样成功请求的日志（路径=保留比例）
+    'sample_default': float(os.getenv('LOG_SAMPLE_DEFAULT', 1.0)),  # 未列出路由的采样率；WARNING及以上、状态码>=400的访问日志始终保留
+}
+
+# TTS音频缓存配置（内容寻址：相同文本/音色/情感的音频只向上游合成一次）
+TTS_CACHE_CONFIG = {
+    'enabled': os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true',  # 是否启用TTS音频缓存
+    'memory_max_bytes': int(os.getenv('TTS_CACHE_MEMORY_BYTES', 64 * 1024 * 1024)),  # 内存层总大小（字节）
+    'memory_max_item_bytes': int(os.getenv('TTS_CACHE_MEMORY_ITEM_BYTES', 1024 * 1024)),  # 可进入内存层的单条音频上限（字节）
+    'disk_dir': os.getenv('TTS_CACHE_DIR', str(BASE_DIR / 'data' / 'tts_cache')),  # 磁盘层目录（为空则只用内存层）
+    'disk_max_bytes': int(os.getenv('TTS_CACHE_DISK_BYTES', 2 * 1024 * 1024 * 1024)),  # 磁盘层总大小（字节），超出按LRU淘汰
+    'max_item_bytes': int(os.getenv('TTS_CACHE_MAX_ITEM_BYTES', 8 * 1024 * 1024)),  # 可缓存的单条音频上限（字节）
+    'http_max_age': int(os.getenv('TTS_CACHE_HTTP_MAX_AGE', 86400)),  # GET /audio/{key} 响应的 Cache-Control max-age（秒）
+}
+
+# 长文本TTS配置（/text-to-speech 超过单次1024字节限制时按句切分、并发合成、按顺序流式返回）
+TTS_LONG_TEXT_CONFIG = {
+    'max_input_bytes': int(os.getenv('TTS_MAX_INPUT_BYTES', 16384)),  # 单个请求允许的最大文本字节数（UTF-8）
+    'segment_bytes': int(os.getenv('TTS_SEGMENT_BYTES', 300)),  # 相邻短句合并后的目标片段大小（字节，≤1024）
+    'concurrency': int(os.getenv('TTS_SEGMENT_CONCURRENCY', 3)),  # 单个请求同时进行的片段合成数上限
+}
+
+# 批量TTS配置（/text-to-speech/batch：批量预生成音频，结果以zip或multipart流式返回）
+TTS_BATCH_CONFIG = {
+    'max_items': int(os.getenv('TTS_BATCH_MAX_ITEMS', 500)),  # 单个批量请求的最大条目数
+    'concurrency': int(os.getenv('TTS_BATCH_CONCURRENCY', 4)),  # 默认同时合成的条目数
+    'max_concurrency': int(os.getenv('TTS_BATCH_MAX_CONCURRENCY', 8)),  # 请求可指定的并发数上限
+}
+
+# 异步TTS任务配置（POST /text-to-speech?mode=async：立即返回task_id，后台合成，轮询或回调获取结果）
+TTS_JOB_CONFIG = {
+    'workers': int(os.getenv('TTS_JOB_WORKERS', 4)),  # 后台合成协程数（同时进行的任务数）
+    'queue_size': int(os.getenv('TTS_JOB_QUEUE_SIZE', 1000)),  # 最多排队的任务数，超出返回503
+    'result_ttl': float(os.getenv('TTS_JOB_RESULT_TTL', 3600)),  # 任务完成后结果保留时间（秒）
+    'callback_timeout': float(os.getenv('TTS_JOB_CALLBACK_TIMEOUT', 5)),  # 回调请求超时（秒）
+    # 回调主机白名单（逗号分隔，.example.com 匹配所有子域名；为空不限主机，但始终拒绝解析到内网/回环/链路本地地址的主机）
+    'callback_allowed_hosts': os.getenv('TTS_JOB_CALLBACK_ALLOWED_HOSTS', ''),
+    'max_result_bytes': int(os.getenv('TTS_JOB_MAX_RESULT_BYTES', 256 * 1024 * 1024)),  # 任务记录中保留的音频总字节数上限，超出时释放最早完成的任务的音频
+    'max_finished_jobs': int(os.getenv('TTS_JOB_MAX_FINISHED', 10000)),  # 保留的已完成任务记录数上限，超出时删除最早完成的
+}
+
+# TTS预合成配置（启动后在后台合成问候语、打卡提示、兜底回复等固定短语，并固定在音频缓存中）
+TTS_PRESYNTH_CONFIG = {
+    'enabled': os.getenv('TTS_PRESYNTH_ENABLED', 'true').lower() == 'true',  # 是否启用预合成（需启用TTS音频缓存）
+    'manifest': os.getenv('TTS_PRESYNTH_MANIFEST', str(BASE_DIR / 'tts_phrases.json')),  # 短语清单（JSON）
+    'delay': float(os.getenv('TTS_PRESYNTH_DELAY', 5)),  # 启动后延迟多少秒开始第一轮（秒）
+    'interval': float(os.getenv('TTS_PRESYNTH_INTERVAL', 6 * 3600)),  # 重新读取清单并补齐缺失条目的间隔（秒，<=0只执行一次）
+    'concurrency': int(os.getenv('TTS_PRESYNTH_CONCURRENCY', 2)),  # 同时合成的条目数
+}
+
+# 音色目录配置（启动后拉取Coze音色列表并定期刷新，本地校验 voice_id 与 emotion）
+VOICE_CATALOG_CONFIG = {
+    'enabled': os.getenv('VOICE_CATALOG_ENABLED', 'true').lower() == 'true',  # 是否启用音色目录
+    'refresh_interval': float(os.getenv('VOICE_CATALOG_REFRESH_INTERVAL', 3600)),  # 刷新间隔（秒，<=0只在启动时拉取）
+    'retry_interval': float(os.getenv('VOICE_CATALOG_RETRY_INTERVAL', 60)),  # 拉取失败后的重试间隔（秒）
+    'validate': os.getenv('VOICE_CATALOG_VALIDATE', 'true').lower() == 'true',  # 是否在本地拦截不存在的音色与不支持的情感
+    'cache_file': os.getenv('VOICE_CATALOG_FILE', str(BASE_DIR / 'data' / 'voice_catalog.json')),  # 目录快照（为空则不持久化）
+}
+
+# TTS音频异步直通配置（/text-to-speech 用 aiohttp 直接转发上游音频；未安装aiohttp时回退到同步客户端）
+TTS_STREAM_CONFIG = {
+    'enabled': os.getenv('TTS_ASYNC_STREAM_ENABLED', 'true').lower() == 'true',  # 是否启用异步直通
+    'max_streams': int(os.getenv('TTS_STREAM_MAX_STREAMS', 16)),  # 同时进行的上游音频流上限（与TTS舱壁线程数一致）
+    'min_chunk': int(os.getenv('TTS_STREAM_MIN_CHUNK', 16 * 1024)),  # 首块之后的初始发送块大小（字节，之后逐次翻倍）
+    'max_chunk': int(os.getenv('TTS_STREAM_MAX_CHUNK', 128 * 1024)),  # 发送块大小上限（字节）
+    'flush_interval': float(os.getenv('TTS_STREAM_FLUSH_INTERVAL', 0.05)),  # 缓冲最长等待时间（秒）
+    'connect_timeout': float(os.getenv('TTS_STREAM_CONNECT_TIMEOUT', 5)),  # 建立连接超时（秒）
+    'read_timeout': float(os.getenv('TTS_STREAM_READ_TIMEOUT', 30)),  # 两次读取之间的超时（秒）
+}
+
+# 会话亲和配置（多节点部署，可选前置代理：python session_affinity.py）
+AFFINITY_CONFIG = {
+    'nodes': [n.strip().rstrip('/') for n in os.getenv('AFFINITY_NODES', '').split(',') if n.strip()],  # 后端节点列表，逗号分隔
+    'vnodes': int(os.getenv('AFFINITY_VNODES', 160)),  # 每个节点的虚拟节点数
+    'fail_threshold': int(os.getenv('AFFINITY_FAIL_THRESHOLD', 3)),  # 连续失败多少次后摘除节点
+    'eject_seconds': float(os.getenv('AFFINITY_EJECT_SECONDS', 30)),  # 节点摘除时长（秒）
+    'health_interval': float(os.getenv('AFFINITY_HEALTH_INTERVAL', 5)),  # 健康探测间隔（秒）
+    'proxy_host': os.getenv('AFFINITY_PROXY_HOST', '0.0.0.0'),  # 代理监听地址
+    'proxy_port': int(os.getenv('AFFINITY_PROXY_PORT', 6000)),  # 代理监听端口
+}
+
 # 创建日志目录（必要目录）
 os.makedirs(BASE_DIR / 'logs', exist_ok=True)
\ No newline at end of file
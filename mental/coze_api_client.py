@@ -4,19 +4,21 @@
 最终稳定版：同步聊天正常 + 流式聊天正常 + 上下文关联正常
 修复：流式SSE格式解析错误、事件匹配错误、数据结构解析错误
 新增：set_conversation_id() 函数，支持手动传入会话ID续传会话
+并发：send_message() / send_message_stream(conversation_id=...) 按请求传入会话ID，不读写客户端共享的 conversation_id
 """
 
 import os
 import json
 import time
-import traceback
 import requests
 import ssl
+import logging
 from dotenv import load_dotenv
-from typing import Optional, Dict, Iterator, Any
+from typing import Optional, Dict, Iterator, Any, Tuple
 from contextlib import contextmanager
 from urllib3.poolmanager import PoolManager
 from urllib3.exceptions import InsecureRequestWarning
+from upstream_errors import classify_request_error, check_coze_result, UpstreamBadResponse, UpstreamTimeout
 
 # 禁用不安全请求警告（开发环境）
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
@@ -24,6 +26,14 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger("coze_api_client")
+
+# 无法解析助手回复时的兜底回复（TTS预合成清单会预先合成这句话）
+FALLBACK_REPLY = "你好呀～ 很高兴能成为你的心理陪伴伙伴～ 不管你现在是什么心情，有什么想聊的，都可以告诉我，我会一直在这里倾听和陪伴你～"
+
+# send_message_stream 未传入conversation_id时使用并更新客户端当前会话（单用户用法）
+_CURRENT = object()
+
 # 自定义SSL适配器：修复SSL上下文参数错误，兼容Python 3.7+
 class TLSAdapter(requests.adapters.HTTPAdapter):
     def __init__(self):
@@ -89,42 +99,18 @@ class CozeAPIClient:
         }
 
     @contextmanager
-    def _handle_request_errors(self, operation: str, url: str = "", params: dict = None, data: dict = None):
-        """增强版错误处理：打印完整请求信息+响应信息+异常堆栈"""
+    def _handle_request_errors(self, operation: str, url: str = ""):
+        """把 requests 异常转换为类型化的上游错误（超时/限流/鉴权/5xx/响应无效），原始异常通过异常链保留"""
         try:
             yield
         except requests.exceptions.RequestException as e:
-            error_msg = f"\n❌ {operation}失败！"
-            error_msg += f"\n请求URL: {url}"
-            if params:
-                error_msg += f"\n请求参数: {json.dumps(params, ensure_ascii=False)}"
-            if data:
-                error_msg += f"\n请求体: {json.dumps(data, ensure_ascii=False)}"
-            error_msg += f"\n错误类型: {type(e).__name__}"
-            error_msg += f"\n错误描述: {str(e)}"
-            
-            if hasattr(e, 'response') and e.response is not None:
-                error_msg += f"\n响应状态码: {e.response.status_code}"
-                try:
-                    resp_json = e.response.json()
-                    error_msg += f"\nAPI响应: {json.dumps(resp_json, ensure_ascii=False, indent=2)}"
-                except:
-                    error_msg += f"\nAPI响应（原始文本）: {e.response.text[:500]}"
-            
-            error_msg += f"\n异常堆栈:\n{traceback.format_exc()}"
-            raise Exception(error_msg)
-        except Exception as e:
-            error_msg = f"\n❌ {operation}失败！"
-            error_msg += f"\n错误类型: {type(e).__name__}"
-            error_msg += f"\n错误描述: {str(e)}"
-            error_msg += f"\n异常堆栈:\n{traceback.format_exc()}"
-            raise Exception(error_msg)
-
-    def _build_chat_url(self) -> str:
-        """构建聊天API URL（自动附加conversation_id，关联上下文）"""
+            raise classify_request_error(operation, e, url) from e
+
+    def _build_chat_url(self, conversation_id: Optional[str]) -> str:
+        """构建聊天API URL（附加conversation_id，关联上下文；为空则新建会话）"""
         url = f"{self.base_url}/chat"
-        if self.conversation_id:
-            url += f"?conversation_id={self.conversation_id}"
+        if conversation_id:
+            url += f"?conversation_id={conversation_id}"
         return url
 
     def _get_raw_chat_messages(self, chat_id: str, conversation_id: str) -> list[Dict[str, Any]]:
@@ -141,8 +127,7 @@ class CozeAPIClient:
 
         with self._handle_request_errors(
             operation="查询对话消息",
-            url=messages_url,
-            params=params
+            url=messages_url
         ):
             response = self.session.get(
                 url=messages_url,
@@ -154,8 +139,7 @@ class CozeAPIClient:
             response.raise_for_status()
             result = response.json()
 
-            if result.get('code') != 0:
-                raise Exception(f"获取消息失败：code={result['code']}, msg={result['msg']}")
+            check_coze_result("查询对话消息", result, messages_url)
             
             messages = result.get('data', [])
             if self.debug and len(messages) > 0:
@@ -185,7 +169,7 @@ class CozeAPIClient:
                 print(f"[调试] 未找到type=answer的消息，等待{self.poll_interval}秒后重试...")
             time.sleep(self.poll_interval)
         
-        raise Exception(f"超时（{self.sync_timeout}秒）未获取到最终回复，chat_id={chat_id}")
+        raise UpstreamTimeout("获取回复", f"{self.sync_timeout}秒内未获取到最终回复（chat_id={chat_id}）")
 
     def _parse_verbose_content(self, content: str) -> str:
         """解析verbose类型消息的JSON内容，兼容插件结构"""
@@ -217,7 +201,8 @@ class CozeAPIClient:
         """提取助手最终回复（优先type=answer，兼容verbose）"""
         try:
             return self._poll_chat_messages(chat_id, conversation_id)
-        except Exception as e:
+        except (UpstreamTimeout, UpstreamBadResponse) as e:
+            # 鉴权/限流/5xx等错误直接抛出，不再额外请求上游
             if self.debug:
                 print(f"[调试] 轮询type=answer失败：{str(e)}，尝试解析verbose消息")
         
@@ -230,10 +215,22 @@ class CozeAPIClient:
                         print(f"[调试] 解析verbose消息：{parsed_content[:50]}...")
                     return parsed_content
         
-        return "你好呀～ 很高兴能成为你的心理陪伴伙伴～ 不管你现在是什么心情，有什么想聊的，都可以告诉我，我会一直在这里倾听和陪伴你～"
+        return FALLBACK_REPLY
 
     def send_message_sync(self, message: str) -> str:
-        """同步聊天（最终稳定版）"""
+        """同步聊天（最终稳定版）：续传并更新客户端当前会话（多用户共享客户端时请使用 send_message）"""
+        reply, self.conversation_id = self.send_message(message, self.conversation_id)
+        return reply
+
+    def send_message(self, message: str, conversation_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        同步聊天（按请求传入会话，不读写客户端状态，可在多个线程中并发调用）
+        参数：conversation_id - 续传的会话ID（为空则新建会话）
+        返回：(回复文本, 实际使用的conversation_id)
+        """
+        if conversation_id:
+            self.validate_conversation_id(conversation_id)
+        chat_url = self._build_chat_url(conversation_id)
         data = {
             "bot_id": self.bot_id,
             "user_id": self.user_id,
@@ -246,11 +243,10 @@ class CozeAPIClient:
 
         with self._handle_request_errors(
             operation="创建Chat",
-            url=self._build_chat_url(),
-            data=data
+            url=chat_url
         ):
             response = self.session.post(
-                url=self._build_chat_url(),
+                url=chat_url,
                 headers=self._get_headers(),
                 json=data,
                 timeout=30,
@@ -259,28 +255,34 @@ class CozeAPIClient:
             response.raise_for_status()
             result = response.json()
 
-            if result.get('code') != 0:
-                raise Exception(f"创建Chat失败：code={result['code']}, msg={result['msg']}")
+            check_coze_result("创建Chat", result, chat_url)
             chat_id = result['data'].get('id')
             conversation_id = result['data'].get('conversation_id')
 
             if not chat_id or not conversation_id:
-                raise Exception(f"创建Chat失败：返回数据不完整（chat_id={chat_id}, conversation_id={conversation_id}）")
+                raise UpstreamBadResponse("创建Chat", f"返回数据不完整（chat_id={chat_id}, conversation_id={conversation_id}）")
 
             if self.debug:
                 print(f"[调试] 创建Chat成功：chat_id={chat_id}, conversation_id={conversation_id}")
 
             reply = self._get_chat_messages(chat_id, conversation_id)
-            self.conversation_id = conversation_id
 
-            return reply
+            return reply, conversation_id
 
-    def send_message_stream(self, message: str) -> Iterator[Dict[str, str]]:
+    def send_message_stream(self, message: str, conversation_id: Optional[str] = _CURRENT) -> Iterator[Dict[str, str]]:
         """
         流式聊天（修复版）：正确解析Coze官方SSE格式
         官方SSE格式：event: 事件类型\n data: 消息数据\n\n
         核心修复：分离event和data解析、修正事件匹配逻辑、正确获取content
+        参数：conversation_id - 续传的会话ID（为空则新建会话）；传入时不读写客户端状态，
+              每个事件携带实际使用的conversation_id；不传则续传并更新客户端当前会话
         """
+        use_current = conversation_id is _CURRENT
+        if use_current:
+            conversation_id = self.conversation_id
+        elif conversation_id:
+            self.validate_conversation_id(conversation_id)
+        chat_url = self._build_chat_url(conversation_id)
         data = {
             "bot_id": self.bot_id,
             "user_id": self.user_id,
@@ -293,11 +295,10 @@ class CozeAPIClient:
 
         with self._handle_request_errors(
             operation="流式创建Chat",
-            url=self._build_chat_url(),
-            data=data
+            url=chat_url
         ):
             response = self.session.post(
-                url=self._build_chat_url(),
+                url=chat_url,
                 headers=self._get_headers(),
                 json=data,
                 stream=True,
@@ -340,9 +341,11 @@ class CozeAPIClient:
                             # 4. 处理会话创建事件：更新conversation_id（上下文关联）
                             if current_event == 'conversation.chat.created':
                                 current_chat_id = msg.get('id')
-                                self.conversation_id = msg.get('conversation_id', self.conversation_id)
+                                conversation_id = msg.get('conversation_id', conversation_id)
+                                if use_current:
+                                    self.conversation_id = conversation_id
                                 if self.debug:
-                                    print(f"[调试] 流式会话创建：chat_id={current_chat_id}, conversation_id={self.conversation_id}")
+                                    print(f"[调试] 流式会话创建：chat_id={current_chat_id}, conversation_id={conversation_id}")
                             
                             # 5. 处理增量回复事件（核心：只取助手的text类型answer）
                             elif current_event == 'conversation.message.delta':
@@ -358,7 +361,7 @@ class CozeAPIClient:
                                             "type": "chunk",
                                             "content": content,
                                             "chat_id": current_chat_id,
-                                            "conversation_id": self.conversation_id
+                                            "conversation_id": conversation_id
                                         }
                     except Exception as e:
                         error_msg = f"[调试] 流式解析异常：{str(e)}"
@@ -368,7 +371,7 @@ class CozeAPIClient:
                             "type": "error",
                             "message": error_msg,
                             "chat_id": current_chat_id,
-                            "conversation_id": self.conversation_id
+                            "conversation_id": conversation_id
                         }
                         continue
 
@@ -377,28 +380,36 @@ class CozeAPIClient:
                 "type": "complete",
                 "full_content": full_content,
                 "chat_id": current_chat_id,
-                "conversation_id": self.conversation_id,
+                "conversation_id": conversation_id,
                 "is_success": len(full_content) > 0
             }
 
+    def close(self):
+        """关闭连接池（服务停机时调用）"""
+        self.session.close()
+
     def clear_conversation(self):
         """清除当前会话（重置上下文）"""
         self.conversation_id = None
-        print(f"🗑️  会话已清除，后续消息将创建新会话")
+        logger.debug("会话已清除，后续消息将创建新会话")
 
     def get_current_conversation_id(self) -> Optional[str]:
         """获取当前会话ID"""
         return self.conversation_id
 
+    @staticmethod
+    def validate_conversation_id(conversation_id: str):
+        """校验会话ID有效性（避免空值或非法格式，无效时抛出 ValueError）"""
+        if not conversation_id or not isinstance(conversation_id, str) or len(conversation_id) < 10:
+            raise ValueError("❌ 无效的conversation_id：必须是长度≥10的字符串（从Coze API获取）")
+
     def set_conversation_id(self, conversation_id: str):
         """
         手动设置会话ID（新增函数）：支持续传已有会话
         参数：conversation_id - Coze官方返回的会话ID（长度通常>10）
         作用：传入后，后续聊天会自动关联该会话的上下文
         """
-        # 校验会话ID有效性（避免空值或非法格式）
-        if not conversation_id or not isinstance(conversation_id, str) or len(conversation_id) < 10:
-            raise ValueError("❌ 无效的conversation_id：必须是长度≥10的字符串（从Coze API获取）")
+        self.validate_conversation_id(conversation_id)
         self.conversation_id = conversation_id
         if self.debug:
             print(f"[调试] 已手动关联会话ID：{conversation_id[:15]}...")
@@ -6,8 +6,11 @@
 import os
 import time
 import re
+import logging
 from cozepy import Coze, TokenAuth, Message, ChatStatus, COZE_CN_BASE_URL
 
+logger = logging.getLogger("emotion_analyzer")
+
 
 class EmotionAnalyzer:
     """情绪分析器类"""
@@ -63,7 +66,7 @@ class EmotionAnalyzer:
             dict: 包含分析结果和详细信息的字典
         """
         try:
-            print(f"正在分析文本情绪: {text}")
+            logger.debug("正在分析文本情绪: %s", text)
             
             # 调用Coze API
             chat_poll = self.coze.chat.create_and_poll(
@@ -92,7 +95,7 @@ class EmotionAnalyzer:
                 'token_usage': getattr(chat_poll.chat.usage, 'token_count', None) if chat_poll.chat.status == ChatStatus.COMPLETED else None
             }
             
-            print("情绪分析完成!")
+            logger.debug("情绪分析完成: %s", emotion_tag)
             return result
             
         except Exception as e:
@@ -105,7 +108,7 @@ class EmotionAnalyzer:
                 'status': None,
                 'token_usage': None
             }
-            print(f"情绪分析失败: {e}")
+            logger.warning("情绪分析失败: %s", e)
             return error_result
 
 
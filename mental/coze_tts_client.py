@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Coze 文本转语音独立客户端（严格匹配官方 API 文档）
-核心功能：将文本转为 MP3 音频文件（同步返回）
+核心功能：将文本转为音频（同步流式返回，默认 MP3，可选 ogg_opus / wav / pcm 及采样率）
 接口规范参考：https://www.coze.cn/open/docs/developer_guides/text_to_speech
 基础信息：
 - 请求方式：POST
@@ -12,18 +12,22 @@ Coze 文本转语音独立客户端（严格匹配官方 API 文档）
 - voice_id：必填，音频音色 ID（需通过「查看音色列表 API」获取可用值）
 - emotion：可选，情感类型（仅多情感音色支持，枚举值：happy/sad/angry/surprised/fear/hate/excited/coldness/neutral）
 - emotion_scale：可选，情感强度（1.0~5.0，数值越高情感越强烈，默认值：4.0）
+- response_format：可选，输出格式（mp3 / ogg_opus / wav / pcm，默认 mp3）
+- sample_rate：可选，采样率（Hz，省略时使用上游默认值）；上游无码率参数，体积通过格式与采样率控制
+查看音色列表：GET https://api.coze.cn/v1/audio/voices（分页，见 list_voices）
 """
 
 import os
+import re
 import json
-import traceback
 import requests
 import ssl
 from dotenv import load_dotenv
-from typing import Optional, Dict, Iterator, Literal
+from typing import Any, Optional, Dict, Iterator, List, Literal, Tuple
 from contextlib import contextmanager
 from urllib3.poolmanager import PoolManager
 from urllib3.exceptions import InsecureRequestWarning
+from upstream_errors import classify_request_error, check_coze_result
 
 # 禁用不安全请求警告（开发环境）
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
@@ -33,7 +37,91 @@ load_dotenv()
 
 # 定义情感类型枚举（严格按官方文档）
 EmotionType = Literal["happy", "sad", "angry", "surprised", "fear", "hate", "excited", "coldness", "neutral"]
-TEST_VOICE_ID = "7426725529681657907"  # 多情感音色 ID（需通过查看音色列表 API 获取）
+TEST_VOICE_ID = os.getenv("TTS_DEFAULT_VOICE_ID", "7426725529681657907")  # 默认多情感音色 ID（可用值见 GET /voices）
+VALID_EMOTIONS: tuple = ("happy", "sad", "angry", "surprised", "fear", "hate", "excited", "coldness", "neutral")
+
+# 输出格式 -> (Content-Type, 文件扩展名)
+AUDIO_FORMATS: Dict[str, Tuple[str, str]] = {
+    "mp3": ("audio/mpeg", "mp3"),
+    "ogg_opus": ("audio/ogg", "ogg"),
+    "wav": ("audio/wav", "wav"),
+    "pcm": ("audio/pcm", "pcm"),
+}
+DEFAULT_AUDIO_FORMAT = "mp3"
+VALID_SAMPLE_RATES: tuple = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+# 情绪标签关键词 -> 用户情绪（情绪分析返回的是自由文本标签，中英文均可能出现）
+EMOTION_TAG_KEYWORDS: Dict[str, tuple] = {
+    "happy": ("开心", "快乐", "高兴", "愉快", "喜悦", "满足", "幸福", "积极", "happy", "joy", "glad", "positive"),
+    "excited": ("兴奋", "激动", "期待", "excited", "thrilled"),
+    "surprised": ("惊讶", "意外", "震惊", "surprise"),
+    "sad": ("悲伤", "难过", "伤心", "失落", "沮丧", "孤独", "抑郁", "低落", "sad", "lonely", "depress", "upset"),
+    "angry": ("愤怒", "生气", "恼火", "烦躁", "angry", "anger", "mad", "annoyed"),
+    "fear": ("恐惧", "害怕", "焦虑", "担心", "紧张", "不安", "fear", "afraid", "anxious", "anxiety", "worried", "nervous"),
+    "hate": ("厌恶", "讨厌", "憎恨", "hate", "disgust"),
+    "coldness": ("冷漠", "麻木", "cold", "indifferent"),
+    "neutral": ("平静", "中性", "一般", "neutral", "calm"),
+}
+
+# 用户情绪 -> 回复语音的情感与强度（陪伴场景：负面高唤醒情绪用平稳语气回应，避免激化）
+EMOTION_REPLY_STYLE: Dict[str, tuple] = {
+    "happy": ("happy", 4.0),
+    "excited": ("excited", 3.5),
+    "surprised": ("surprised", 3.0),
+    "sad": ("sad", 2.0),
+    "angry": ("neutral", 3.0),
+    "fear": ("neutral", 2.0),
+    "hate": ("neutral", 3.0),
+    "coldness": ("neutral", 3.0),
+    "neutral": ("neutral", 3.0),
+}
+
+# 情绪关键词前的否定词（"不开心"、"没那么高兴"、"not happy"、"unhappy"），可夹带程度副词
+EMOTION_NEGATION_PATTERN = re.compile(
+    r"(?:并不|毫不|不是|不|没有|没|未|\bnot|n't|\bnever|\bno|\bun)\s*"
+    r"(?:太|很|怎么|那么|特别|非常|so|very|really|too|that)?\s*$"
+)
+
+# 被否定的用户情绪 -> 实际情绪（"不开心"即难过；其余被否定的情绪按中性处理）
+NEGATED_EMOTIONS: Dict[str, str] = {
+    "happy": "sad",
+}
+
+# 程度副词对情感强度的修正
+EMOTION_INTENSITY_KEYWORDS: tuple = (
+    (("非常", "极其", "特别", "很", "十分", "强烈", "very", "extremely", "really"), 1.0),
+    (("有点", "稍微", "轻微", "略", "slightly", "a bit", "mild"), -1.0),
+)
+
+
+def emotion_tag_to_tts(emotion_tag: Optional[str]) -> Tuple[EmotionType, float]:
+    """
+    将情绪分析标签映射为回复语音的 emotion 与 emotion_scale
+    :param emotion_tag: 情绪分析返回的标签文本（如"开心"、"有点焦虑"、"sad"）
+    :return: (TTS情感类型, 情感强度1.0~5.0)；无法识别时返回 ("neutral", 3.0)
+    """
+    if not emotion_tag:
+        return "neutral", 3.0
+    tag = emotion_tag.strip().lower()
+    # 取在标签中出现位置最靠前的情绪关键词（同一位置取最长的关键词，如"不安"优先于否定词+"安"）
+    matched, matched_pos, matched_len = "neutral", len(tag) + 1, 0
+    for emotion, keywords in EMOTION_TAG_KEYWORDS.items():
+        for keyword in keywords:
+            pos = tag.find(keyword)
+            if pos >= 0 and (pos < matched_pos or (pos == matched_pos and len(keyword) > matched_len)):
+                matched, matched_pos, matched_len = emotion, pos, len(keyword)
+    if matched_pos <= len(tag):
+        # 关键词前有否定词时按否定后的情绪处理，否定短语中的程度副词不参与强度修正
+        negation = EMOTION_NEGATION_PATTERN.search(tag[:matched_pos])
+        if negation:
+            matched = NEGATED_EMOTIONS.get(matched, "neutral")
+            tag = tag[:negation.start()] + tag[matched_pos:]
+    emotion, scale = EMOTION_REPLY_STYLE[matched]
+    for keywords, delta in EMOTION_INTENSITY_KEYWORDS:
+        if any(keyword in tag for keyword in keywords):
+            scale += delta
+            break
+    return emotion, min(5.0, max(1.0, scale))
 
 # ==================== 自定义 SSL 适配器（兼容 Python 3.7+）====================
 class TLSAdapter(requests.adapters.HTTPAdapter):
@@ -66,6 +154,7 @@ class CozeTTSClient:
         # 核心配置（严格按官方文档）
         self.api_token = os.getenv('COZE_API_TOKEN')
         self.tts_url = "https://api.coze.cn/v1/audio/speech"  # 官方正确请求地址
+        self.voices_url = "https://api.coze.cn/v1/audio/voices"  # 查看音色列表
         self.debug = debug  # 调试模式
         self.timeout = 30  # 请求超时时间（秒）
 
@@ -86,50 +175,25 @@ class CozeTTSClient:
         }
 
     @contextmanager
-    def _handle_request_errors(self, operation: str, url: str = "", data: dict = None):
-        """统一错误处理：打印请求详情+异常堆栈（方便排查权限/参数问题）"""
+    def _handle_request_errors(self, operation: str, url: str = ""):
+        """把 requests 异常转换为类型化的上游错误（超时/限流/鉴权/5xx/响应无效），原始异常通过异常链保留"""
         try:
             yield
         except requests.exceptions.RequestException as e:
-            error_msg = f"\n❌ {operation}失败！"
-            error_msg += f"\n请求URL: {url}"
-            error_msg += f"\n请求头: {json.dumps(self._get_headers(), ensure_ascii=False)}"
-            if data:
-                error_msg += f"\n请求体: {json.dumps(data, ensure_ascii=False)}"
-            error_msg += f"\n错误类型: {type(e).__name__}"
-            error_msg += f"\n错误描述: {str(e)}"
-            
-            if hasattr(e, 'response') and e.response is not None:
-                error_msg += f"\n响应状态码: {e.response.status_code}"
-                try:
-                    resp_json = e.response.json()
-                    error_msg += f"\nAPI响应（官方错误信息）: {json.dumps(resp_json, ensure_ascii=False, indent=2)}"
-                except:
-                    error_msg += f"\nAPI响应（原始文本）: {e.response.text[:500]}"
-            
-            error_msg += f"\n异常堆栈:\n{traceback.format_exc()}"
-            raise Exception(error_msg)
-        except Exception as e:
-            error_msg = f"\n❌ {operation}失败！"
-            error_msg += f"\n错误类型: {type(e).__name__}"
-            error_msg += f"\n错误描述: {str(e)}"
-            error_msg += f"\n异常堆栈:\n{traceback.format_exc()}"
-            raise Exception(error_msg)
+            raise classify_request_error(operation, e, url) from e
 
-    def text_to_speech(
+    def build_speech_request(
         self,
-        input: str,  # 字段名按官方要求：input（而非input_text）
+        input: str,
         voice_id: str,
         emotion: Optional[EmotionType] = None,
-        emotion_scale: Optional[float] = None
-    ) -> Iterator[bytes]:
+        emotion_scale: Optional[float] = None,
+        response_format: Optional[str] = None,
+        sample_rate: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
-        文本转语音核心方法（同步流式返回音频，匹配官方 API）
-        :param input: 待转换文本（必填，UTF-8 编码，≤1024 字节）
-        :param voice_id: 音色 ID（必填，需通过「查看音色列表 API」获取可用值，开通 createSpeech 权限）
-        :param emotion: 情感类型（可选，仅多情感音色支持，枚举值见类注释）
-        :param emotion_scale: 情感强度（可选，1.0~5.0，默认4.0，数值越高情感越强烈）
-        :return: 音频字节流迭代器（MP3格式，官方默认输出格式）
+        校验参数并构造官方要求的TTS请求体（同步与异步两种调用方式共用；参数说明见 text_to_speech）
+        :return: 请求体字典
         """
         # 1. 校验必填参数：input（文本）
         if not input or not isinstance(input, str) or len(input.strip()) == 0:
@@ -154,9 +218,8 @@ class CozeTTSClient:
         # 4. 校验可选参数：emotion（严格匹配官方枚举值）
         if emotion is not None:
             emotion = emotion.strip().lower()
-            valid_emotions: list[EmotionType] = ["happy", "sad", "angry", "surprised", "fear", "hate", "excited", "coldness", "neutral"]
-            if emotion not in valid_emotions:
-                raise ValueError(f"❌ 无效的情感类型：{emotion}，支持的枚举值：{', '.join(valid_emotions)}")
+            if emotion not in VALID_EMOTIONS:
+                raise ValueError(f"❌ 无效的情感类型：{emotion}，支持的枚举值：{', '.join(VALID_EMOTIONS)}")
             request_data["emotion"] = emotion
         
         # 5. 校验可选参数：emotion_scale（官方范围 1.0~5.0，默认4.0）
@@ -169,6 +232,38 @@ class CozeTTSClient:
             if emotion_scale < 1.0 or emotion_scale > 5.0:
                 raise ValueError("❌ 情感强度需在 1.0~5.0 之间（数值越高情感越强烈，官方限制）")
             request_data["emotion_scale"] = emotion_scale
+
+        # 6. 校验可选参数：response_format / sample_rate（仅在指定时传给上游）
+        if response_format is not None:
+            if response_format not in AUDIO_FORMATS:
+                raise ValueError(f"❌ 无效的输出格式：{response_format}，支持：{', '.join(AUDIO_FORMATS)}")
+            request_data["response_format"] = response_format
+        if sample_rate is not None:
+            if sample_rate not in VALID_SAMPLE_RATES:
+                raise ValueError(f"❌ 无效的采样率：{sample_rate}，支持：{', '.join(map(str, VALID_SAMPLE_RATES))}")
+            request_data["sample_rate"] = int(sample_rate)
+        return request_data
+
+    def text_to_speech(
+        self,
+        input: str,  # 字段名按官方要求：input（而非input_text）
+        voice_id: str,
+        emotion: Optional[EmotionType] = None,
+        emotion_scale: Optional[float] = None,
+        response_format: Optional[str] = None,
+        sample_rate: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        文本转语音核心方法（同步流式返回音频，匹配官方 API；异步直通见 tts_stream.AsyncTTSStreamer）
+        :param input: 待转换文本（必填，UTF-8 编码，≤1024 字节）
+        :param voice_id: 音色 ID（必填，需通过「查看音色列表 API」获取可用值，开通 createSpeech 权限）
+        :param emotion: 情感类型（可选，仅多情感音色支持，枚举值见类注释）
+        :param emotion_scale: 情感强度（可选，1.0~5.0，默认4.0，数值越高情感越强烈）
+        :param response_format: 输出格式（可选，mp3 / ogg_opus / wav / pcm，默认 mp3）
+        :param sample_rate: 采样率（可选，取值见 VALID_SAMPLE_RATES，默认由上游决定）
+        :return: 音频字节流迭代器（默认MP3格式）
+        """
+        request_data = self.build_speech_request(input, voice_id, emotion, emotion_scale, response_format, sample_rate)
         
         # 调试日志（打印官方要求的完整请求信息）
         if self.debug:
@@ -177,11 +272,10 @@ class CozeTTSClient:
             print(f"  Headers: {json.dumps(self._get_headers(), ensure_ascii=False)}")
             print(f"  Body: {json.dumps(request_data, ensure_ascii=False)}")
         
-        # 6. 调用 Coze 官方 TTS API（流式获取音频，避免内存占用）
+        # 7. 调用 Coze 官方 TTS API（流式获取音频，避免内存占用）
         with self._handle_request_errors(
             operation="文本转语音（官方API）",
-            url=self.tts_url,
-            data=request_data
+            url=self.tts_url
         ):
             response = self.session.post(
                 url=self.tts_url,
@@ -193,7 +287,7 @@ class CozeTTSClient:
             )
             response.raise_for_status()  # 抛出 HTTP 错误（4xx/5xx，如权限不足、参数错误等）
             
-            # 7. 流式返回音频字节（官方返回的是 MP3 二进制流）
+            # 8. 流式返回音频字节（默认为 MP3 二进制流）
             for chunk in response.iter_content(chunk_size=1024):
                 if chunk:
                     yield chunk
@@ -202,9 +296,38 @@ class CozeTTSClient:
                 content_length = response.headers.get('Content-Length', '未知')
                 content_type = response.headers.get('Content-Type', '未知')
                 print(f"[调试] TTS 音频流返回完成：")
-                print(f"  音频格式：{content_type}（官方默认 MP3）")
+                print(f"  音频格式：{content_type}（请求格式：{response_format or DEFAULT_AUDIO_FORMAT}）")
                 print(f"  音频大小：{content_length} 字节")
 
+    def list_voices(self, page_size: int = 100, max_pages: int = 50) -> List[Dict[str, Any]]:
+        """
+        查看音色列表（分页拉取系统音色与自定义音色）
+        :param page_size: 每页音色数
+        :param max_pages: 最多拉取的页数（防止上游 has_more 异常时无限翻页）
+        :return: 音色字典列表（voice_id、name、language_code、support_emotions 等，字段以官方返回为准）
+        """
+        voices: List[Dict[str, Any]] = []
+        for page_num in range(1, max_pages + 1):
+            with self._handle_request_errors(operation="查看音色列表", url=self.voices_url):
+                response = self.session.get(
+                    url=self.voices_url,
+                    headers=self._get_headers(),
+                    params={"page_num": page_num, "page_size": page_size},
+                    timeout=self.timeout,
+                    verify=False
+                )
+                response.raise_for_status()
+                result = response.json()
+            check_coze_result("查看音色列表", result, self.voices_url)
+            data = result.get("data") or {}
+            page = data.get("voice_list") or []
+            voices.extend(page)
+            if not page or not data.get("has_more"):
+                break
+        if self.debug:
+            print(f"[调试] 音色列表拉取完成：{len(voices)} 个音色")
+        return voices
+
     def save_to_file(
         self,
         input: str,
@@ -230,6 +353,10 @@ class CozeTTSClient:
         except Exception as e:
             print(f"❌ 保存文件失败：{str(e)}")
 
+    def close(self):
+        """关闭连接池（服务停机时调用）"""
+        self.session.close()
+
 # ==================== 测试代码（按官方 API 优化，可直接运行）====================
 def main():
     """测试文本转语音功能（匹配官方 API 要求）"""
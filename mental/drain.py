@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+优雅停机：排空进行中的请求（尤其是流式回复）后再释放资源
+核心功能：
+- DrainMiddleware 记录所有进行中的请求，并识别流式响应（SSE / 音频流 / NDJSON）
+- 进入排空阶段后：新请求直接返回 503 + Connection: close（健康检查等豁免路径除外，由其自行报告draining）
+- drain(grace_period)：等待进行中的请求全部完成，最多等待宽限期；返回排空耗时与被放弃的请求
+- 被服务器强制取消的请求（如 uvicorn 的 timeout_graceful_shutdown 到期）同样计入被放弃的请求
+触发方式：
+- 服务关闭时（lifespan shutdown）自动执行
+- 滚动发布时可由部署脚本在停止进程前调用 POST /admin/drain（需管理令牌 ADMIN_TOKEN，仅限本机），先让负载均衡摘除该节点
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("drain")
+
+# 视为流式响应的Content-Type前缀
+STREAM_CONTENT_TYPES = (b"text/event-stream", b"audio/", b"application/x-ndjson")
+
+
+class _InFlight:
+    """进行中的请求"""
+    __slots__ = ("path", "started_at", "streaming")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started_at = time.monotonic()
+        self.streaming = False
+
+
+class DrainController:
+    """
+    请求排空控制器
+    :param exempt_paths: 不参与排空的路径（健康检查、排空接口本身）：始终放行且不计入进行中请求
+    :param retry_after: 排空期间拒绝新请求时建议的重试等待秒数
+    """
+
+    def __init__(self, exempt_paths: Iterable[str] = ("/health",), retry_after: int = 5):
+        self.exempt_paths = set(exempt_paths)
+        self.retry_after = retry_after
+        self.draining = False
+        self.drain_started_at: Optional[float] = None
+        self.last_drain: Dict[str, Any] = {}
+        self._ids = itertools.count()
+        self._in_flight: Dict[int, _InFlight] = {}
+        self._idle: Optional[asyncio.Event] = None
+        self._drain_task: Optional[asyncio.Task] = None
+        self._cancelled = deque(maxlen=50)  # 最近被强制取消的请求
+        self.cancelled = 0
+        self.rejected = 0
+
+    # ==================== 请求跟踪（由中间件调用）====================
+    def _enter(self, path: str) -> int:
+        request_id = next(self._ids)
+        self._in_flight[request_id] = _InFlight(path)
+        if self._idle is not None:
+            self._idle.clear()
+        return request_id
+
+    def _exit(self, request_id: int):
+        self._in_flight.pop(request_id, None)
+        if not self._in_flight and self._idle is not None:
+            self._idle.set()
+
+    def _cancel(self, request_id: int):
+        item = self._in_flight.get(request_id)
+        if item is not None:
+            self.cancelled += 1
+            self._cancelled.append({"path": item.path, "streaming": item.streaming,
+                                    "age_seconds": round(time.monotonic() - item.started_at, 1)})
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def in_flight_streams(self) -> int:
+        return sum(1 for item in self._in_flight.values() if item.streaming)
+
+    # ==================== 排空 ====================
+    async def _drain(self, grace_period: float) -> Dict[str, Any]:
+        start = time.monotonic()
+        initial, initial_streams = self.in_flight, self.in_flight_streams
+        logger.info(f"开始排空 - 进行中请求: {initial}（流式: {initial_streams}），宽限期: {grace_period}s")
+        self._idle = asyncio.Event()
+        if not self._in_flight:
+            self._idle.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=grace_period)
+        except asyncio.TimeoutError:
+            pass
+        now = time.monotonic()
+        abandoned: List[Dict[str, Any]] = list(self._cancelled) + [
+            {"path": item.path, "streaming": item.streaming, "age_seconds": round(now - item.started_at, 1)}
+            for item in self._in_flight.values()
+        ]
+        self.last_drain = {
+            "initial_in_flight": initial,
+            "initial_streams": initial_streams,
+            "duration_ms": round((now - start) * 1000, 1),
+            "completed": max(0, initial - len(self._in_flight)),
+            "abandoned": len(abandoned),
+            "abandoned_streams": sum(1 for item in abandoned if item["streaming"]),
+            "abandoned_requests": abandoned[:50],
+            "rejected_during_drain": self.rejected
+        }
+        if abandoned:
+            logger.warning(f"排空超时 - 耗时: {self.last_drain['duration_ms']}ms, 放弃请求: {len(abandoned)}"
+                           f"（流式: {self.last_drain['abandoned_streams']}），路径: {[a['path'] for a in abandoned[:10]]}")
+        else:
+            logger.info(f"排空完成 - 耗时: {self.last_drain['duration_ms']}ms, 完成请求: {initial}")
+        return self.last_drain
+
+    async def drain(self, grace_period: float) -> Dict[str, Any]:
+        """
+        进入排空状态并等待进行中的请求完成（重复调用共享同一次排空）
+        :return: 排空统计（耗时、完成数、放弃数及放弃的流式请求数）
+        """
+        if not self.draining:
+            self.draining = True
+            self.drain_started_at = time.monotonic()
+            self._drain_task = asyncio.ensure_future(self._drain(grace_period))
+        return await asyncio.shield(self._drain_task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "in_flight_streams": self.in_flight_streams,
+            "cancelled": self.cancelled,
+            "rejected_during_drain": self.rejected,
+            "last_drain": self.last_drain or None
+        }
+
+
+class DrainMiddleware:
+    """
+    排空ASGI中间件（应注册为最外层）
+    用法：app.add_middleware(DrainMiddleware, controller=controller)
+    """
+
+    def __init__(self, app, controller: DrainController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        controller = self.controller
+        if path in controller.exempt_paths:
+            # 豁免路径不计入进行中请求（否则排空接口会等待它自己）
+            await self.app(scope, receive, send)
+            return
+        if controller.draining:
+            controller.rejected += 1
+            await self._reject(send, controller.retry_after)
+            return
+
+        request_id = controller._enter(path)
+        entry = controller._in_flight[request_id]
+
+        async def tracking_send(message):
+            if message["type"] == "http.response.start":
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type" and value.startswith(STREAM_CONTENT_TYPES):
+                        entry.streaming = True
+                        break
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracking_send)
+        except asyncio.CancelledError:
+            controller._cancel(request_id)
+            raise
+        finally:
+            controller._exit(request_id)
+
+    @staticmethod
+    async def _reject(send, retry_after: int):
+        """返回503并要求客户端关闭连接（格式与全局异常处理器一致）"""
+        body = json.dumps({
+            "error": "服务正在停机，请重试",
+            "status_code": 503,
+            "message": "节点正在排空，新请求请发往其他节点",
+            "timestamp": datetime.now().isoformat()
+        }, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                (b"connection", b"close")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
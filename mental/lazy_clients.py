@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+上游客户端的延迟构建与并行预热
+核心功能：
+- 工厂函数在首次使用时才执行（含耗时的模块导入，如 cozepy 约0.3秒），服务启动不再被客户端构建阻塞
+- warm()：启动后立即在线程中并行构建全部客户端，通常在首个请求到达前已就绪
+- get()：请求到来时客户端尚未就绪则等待同一次构建（不会重复构建）；构建失败记录错误，下次请求重试
+- 构建完成的客户端写入 app_state，现有的 app_state.get(...) 用法保持不变
+- 统计：各客户端状态（pending/building/ready/failed）、构建耗时与错误，供 /readyz 查看
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("lazy_clients")
+
+
+class LazyClients:
+    """
+    延迟构建的客户端集合
+    :param factories: {名称: 无参工厂函数}（阻塞函数，在线程中执行）
+    :param target: 构建完成后写入的字典（通常为 app_state）
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]], target: Dict[str, Any]):
+        self.factories = dict(factories)
+        self.target = target
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self._init_ms: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+
+    def _build(self, name: str) -> Any:
+        start = time.perf_counter()
+        client = self.factories[name]()
+        self._init_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+        return client
+
+    def _start(self, name: str) -> asyncio.Future:
+        task = self._tasks.get(name)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self._build, name))
+            task.add_done_callback(lambda t, n=name: self._on_built(n, t))
+            self._tasks[name] = task
+        return task
+
+    def _on_built(self, name: str, task: asyncio.Future):
+        if task.cancelled():
+            self._tasks.pop(name, None)
+            return
+        error = task.exception()
+        if error is None:
+            self.target[name] = task.result()
+            self._errors.pop(name, None)
+            logger.info(f"客户端就绪 - {name}，构建耗时: {self._init_ms.get(name)}ms")
+        else:
+            # 丢弃失败的任务，下次 get() 时重试
+            self._tasks.pop(name, None)
+            self._errors[name] = str(error)
+            logger.error(f"客户端构建失败 - {name}: {error}")
+
+    def warm(self, names: Optional[Iterable[str]] = None):
+        """在后台并行构建客户端（不等待）"""
+        for name in names or self.factories:
+            if name not in self.target:
+                self._start(name)
+
+    async def wait(self, names: Optional[Iterable[str]] = None):
+        """并行构建并等待完成（失败时抛出第一个错误）"""
+        names = list(names or self.factories)
+        self.warm(names)
+        await asyncio.gather(*(self._tasks[name] for name in names if name in self._tasks))
+
+    async def get(self, name: str) -> Optional[Any]:
+        """获取客户端（未就绪时等待构建完成；构建失败返回None）"""
+        client = self.target.get(name)
+        if client is not None or name not in self.factories:
+            return client
+        try:
+            return await asyncio.shield(self._start(name))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+    @property
+    def ready(self) -> bool:
+        return all(self.target.get(name) is not None for name in self.factories)
+
+    def stats(self) -> Dict[str, Any]:
+        clients = {}
+        for name in self.factories:
+            if self.target.get(name) is not None:
+                state = "ready"
+            elif name in self._tasks:
+                state = "building"
+            elif name in self._errors:
+                state = "failed"
+            else:
+                state = "pending"
+            clients[name] = {"state": state, "init_ms": self._init_ms.get(name), "error": self._errors.get(name)}
+        return {"ready": self.ready, "clients": clients}
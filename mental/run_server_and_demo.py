@@ -34,8 +34,8 @@ TEST_VOICE_ID = "7426725529681657907"  # 替换为Coze有效音色ID
 MAX_WAIT_SECONDS = 30  # 延长至30秒
 # 接口调用超时时间（秒）
 API_TIMEOUT = 60  # 延长至60秒
-# 健康检查轮询间隔（秒）
-HEALTH_CHECK_INTERVAL = 2
+# 就绪检查轮询间隔（秒）：服务通常1秒内就绪，短间隔轮询可尽早开始示例
+HEALTH_CHECK_INTERVAL = 0.2
 
 # ==================== 工具类/函数 ====================
 @dataclass
@@ -177,14 +177,15 @@ def start_api_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, debug:
     
     # 步骤2：等待服务就绪（延长时间+多次轮询）
     print(f"\n{Fore.YELLOW}[ℹ️  等待服务启动...（最多等待{MAX_WAIT_SECONDS}秒，每{HEALTH_CHECK_INTERVAL}秒检查一次）]{Style.RESET_ALL}")
-    for _ in range(MAX_WAIT_SECONDS // HEALTH_CHECK_INTERVAL):
+    wait_start = time.monotonic()
+    for attempt in range(int(MAX_WAIT_SECONDS / HEALTH_CHECK_INTERVAL)):
         time.sleep(HEALTH_CHECK_INTERVAL)
-        # 健康检查：调用/health接口
-        health_response = send_request("GET", f"{API_BASE_URL}/health")
+        # 就绪检查：调用/readyz接口（上游客户端全部构建完成才返回200）
+        health_response = send_request("GET", f"{API_BASE_URL}/readyz")
         if health_response.success:
-            print(f"{Fore.GREEN}[✅ API服务启动成功！访问 {API_BASE_URL}/docs 查看接口文档]{Style.RESET_ALL}")
+            print(f"{Fore.GREEN}[✅ API服务启动成功（耗时{time.monotonic() - wait_start:.1f}秒）！访问 {API_BASE_URL}/docs 查看接口文档]{Style.RESET_ALL}")
             return (True, proc)  # 始终返回元组
-        else:
+        elif attempt % 10 == 9:  # 约每2秒提示一次
             print(f"{Fore.YELLOW}[ℹ️  服务尚未就绪：{health_response.error_msg[:50]}...]{Style.RESET_ALL}")
     
     # 服务启动超时
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+会话亲和路由：多节点部署时让同一会话的请求尽量落在同一个 api_server 节点
+核心功能：
+- HashRing：一致性哈希环（虚拟节点），节点增减时只有约 1/N 的会话换节点
+- AffinityRouter：按 session_id / conversation_id 选节点，连续失败的节点暂时摘除（到期自动恢复）
+- 可选前置代理模式：python session_affinity.py 启动一个轻量代理，把请求转发到环上对应节点（含SSE流式响应）
+说明：
+- 会话状态仍以共享存储（SESSION_BACKEND=redis）为准，亲和只是让热连接、本地读缓存更容易命中
+- 摘除节点时不重建环：查找时沿环跳过被摘除节点，只有该节点上的会话临时迁移，恢复后回到原节点
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:  # 仅前置代理模式需要
+    aiohttp = web = None
+
+from config import AFFINITY_CONFIG
+
+logger = logging.getLogger("session_affinity")
+
+
+def _hash64(key: str) -> int:
+    """稳定的64位哈希（取md5前8字节；内置hash()每个进程加盐，不能跨节点使用）"""
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    一致性哈希环
+    :param nodes: 初始节点（如 http://10.0.0.1:6001）
+    :param vnodes: 每个节点的虚拟节点数（越多分布越均匀，环越大）
+    """
+
+    def __init__(self, nodes: Optional[Iterable[str]] = None, vnodes: int = 160):
+        self.vnodes = max(1, vnodes)
+        self._nodes: List[str] = []
+        self._points: List[int] = []  # 有序的虚拟节点哈希值
+        self._owners: List[str] = []  # 与 _points 一一对应的真实节点
+        for node in nodes or ():
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def _rebuild(self):
+        ring = sorted((_hash64(f"{node}#{i}"), node) for node in self._nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+    def add_node(self, node: str):
+        """加入节点（已存在则忽略）"""
+        if node not in self._nodes:
+            self._nodes.append(node)
+            self._rebuild()
+
+    def remove_node(self, node: str):
+        """移除节点（不存在则忽略）"""
+        if node in self._nodes:
+            self._nodes.remove(node)
+            self._rebuild()
+
+    def get_node(self, key: str) -> Optional[str]:
+        """返回key归属的节点（环为空时返回None）"""
+        if not self._points:
+            return None
+        index = bisect_right(self._points, _hash64(key)) % len(self._points)
+        return self._owners[index]
+
+    def iter_nodes(self, key: str) -> Iterable[str]:
+        """从key的位置开始沿环顺时针依次给出不重复的节点（首个即归属节点，其余为故障转移顺序）"""
+        if not self._points:
+            return
+        start = bisect_right(self._points, _hash64(key))
+        seen = set()
+        for offset in range(len(self._points)):
+            node = self._owners[(start + offset) % len(self._points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self._nodes):
+                    return
+
+
+class AffinityRouter:
+    """
+    带健康摘除的会话亲和路由
+    :param nodes: 节点列表
+    :param vnodes: 每个节点的虚拟节点数
+    :param fail_threshold: 连续失败多少次后摘除节点
+    :param eject_seconds: 摘除时长（秒），到期后自动放回
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 160, fail_threshold: int = 3, eject_seconds: float = 30.0):
+        self.ring = HashRing(nodes, vnodes)
+        self.fail_threshold = max(1, fail_threshold)
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._failures: Dict[str, int] = {}
+        self._ejected_until: Dict[str, float] = {}
+        self.ejections = 0
+
+    def _is_ejected(self, node: str, now: float) -> bool:
+        until = self._ejected_until.get(node)
+        if until is None:
+            return False
+        if until <= now:
+            # 摘除到期：放回环上，失败计数清零后重新观察
+            del self._ejected_until[node]
+            self._failures.pop(node, None)
+            logger.info(f"节点恢复 - {node}")
+            return False
+        return True
+
+    def candidates(self, key: Optional[str]) -> List[str]:
+        """
+        故障转移顺序：从key的位置沿环依次给出健康节点，被摘除的节点排在最后（宁可尝试也不直接拒绝）
+        - key为空时按随机位置分散到环上
+        """
+        now = time.monotonic()
+        nodes = list(self.ring.iter_nodes(key or str(time.monotonic_ns())))
+        with self._lock:
+            ejected = [node for node in nodes if self._is_ejected(node, now)]
+        return [node for node in nodes if node not in ejected] + ejected
+
+    def route(self, key: Optional[str]) -> Optional[str]:
+        """
+        选择节点：key为空时按随机位置分散到环上
+        - 归属节点被摘除时沿环找下一个健康节点；全部被摘除时仍返回归属节点（宁可尝试也不直接拒绝）
+        """
+        candidates = self.candidates(key)
+        return candidates[0] if candidates else None
+
+    def mark_success(self, node: str):
+        with self._lock:
+            self._failures.pop(node, None)
+
+    def mark_failure(self, node: str):
+        """记录一次失败（连接错误、5xx、健康检查失败），达到阈值后摘除"""
+        with self._lock:
+            count = self._failures.get(node, 0) + 1
+            self._failures[node] = count
+            if count >= self.fail_threshold and node not in self._ejected_until:
+                self._ejected_until[node] = time.monotonic() + self.eject_seconds
+                self.ejections += 1
+                logger.warning(f"节点摘除 - {node}, 连续失败: {count}, 摘除时长: {self.eject_seconds}s")
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "nodes": self.ring.nodes,
+                "vnodes": self.ring.vnodes,
+                "ejected": {node: round(until - now, 1) for node, until in self._ejected_until.items() if until > now},
+                "failures": dict(self._failures),
+                "ejections": self.ejections
+            }
+
+
+def routing_key(session_id: Optional[str] = None, conversation_id: Optional[str] = None) -> Optional[str]:
+    """路由键：优先session_id（请求体中总是携带），否则用conversation_id"""
+    if session_id:
+        return f"s:{session_id}"
+    if conversation_id:
+        return f"c:{conversation_id}"
+    return None
+
+
+def extract_routing_key(path: str, query_string: str, body: bytes) -> Optional[str]:
+    """
+    从请求中提取路由键
+    - 路径：/session/{session_id}/... 与 /conversation/{conversation_id}/...
+    - 查询参数：session_id / conversation_id
+    - JSON请求体：session_id / conversation_id 字段
+    """
+    parts = [p for p in path.split("/") if p]
+    if len(parts) >= 2 and parts[0] == "session":
+        return routing_key(session_id=parts[1])
+    if len(parts) >= 2 and parts[0] == "conversation":
+        return routing_key(conversation_id=parts[1])
+    query = parse_qs(query_string)
+    if query.get("session_id") or query.get("conversation_id"):
+        return routing_key((query.get("session_id") or [None])[0], (query.get("conversation_id") or [None])[0])
+    if body:
+        try:
+            data = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if isinstance(data, dict):
+            return routing_key(data.get("session_id"), data.get("conversation_id"))
+    return None
+
+
+# ==================== 前置代理模式 ====================
+# 逐跳头部不转发（RFC 7230 6.1）
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                      "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length"}
+ADMIN_PATH_PREFIX = "/admin/"
+
+
+class AffinityProxy:
+    """
+    会话亲和前置代理（aiohttp实现）
+    - 按路由键转发到环上节点，响应体流式透传（SSE/音频流不缓冲）
+    - 连接失败时标记节点失败，沿环转发到下一个未尝试的节点；后台定期探测 /health
+    - 管理接口（/admin/*）不转发，只能在节点本机调用
+    """
+
+    def __init__(self, router: AffinityRouter, health_interval: float = 5.0, upstream_timeout: float = 300.0):
+        if aiohttp is None:
+            raise ValueError("❌ 前置代理模式需要安装aiohttp：pip install aiohttp")
+        self.router = router
+        self.health_interval = health_interval
+        self.upstream_timeout = upstream_timeout
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def _on_startup(self, app):
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=self.upstream_timeout),
+            auto_decompress=False
+        )
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _on_cleanup(self, app):
+        if self._health_task:
+            self._health_task.cancel()
+        if self._session:
+            await self._session.close()
+
+    async def _health_loop(self):
+        """定期探测所有节点，失败计入摘除阈值，成功清零"""
+        while True:
+            for node in self.router.ring.nodes:
+                try:
+                    async with self._session.get(f"{node}/health", timeout=aiohttp.ClientTimeout(total=3)) as resp:
+                        if resp.status < 500:
+                            self.router.mark_success(node)
+                        else:
+                            self.router.mark_failure(node)
+                except Exception:
+                    self.router.mark_failure(node)
+            await asyncio.sleep(self.health_interval)
+
+    async def handle(self, request):
+        """转发单个请求"""
+        if request.path == "/_affinity/stats":
+            return web.json_response(self.router.stats())
+        if request.path.startswith(ADMIN_PATH_PREFIX):
+            return web.json_response({"error": "管理接口不经代理转发", "status_code": 403}, status=403)
+        body = await request.read()
+        key = extract_routing_key(request.path, request.query_string, body)
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        headers["X-Forwarded-For"] = request.remote or ""
+
+        # 故障转移顺序在请求开始时确定一次（key为空时随机位置也只取一次），每个节点最多尝试一次
+        for node in self.router.candidates(key):
+            try:
+                upstream = await self._session.request(
+                    request.method, f"{node}{request.path_qs}", headers=headers, data=body, allow_redirects=False
+                )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # 连接阶段失败：请求尚未被处理，可安全转发到下一个节点
+                logger.warning(f"转发失败 - node: {node}, path: {request.path}, error: {str(e)}")
+                self.router.mark_failure(node)
+                continue
+            try:
+                if upstream.status >= 500:
+                    self.router.mark_failure(node)
+                else:
+                    self.router.mark_success(node)
+                response = web.StreamResponse(status=upstream.status, headers={
+                    k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS
+                })
+                response.headers["X-Upstream-Node"] = node
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_any():
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+            finally:
+                upstream.release()
+        return web.json_response(
+            {"error": "没有可用的后端节点", "status_code": 502}, status=502
+        )
+
+    def build_app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def create_router(config: Dict = AFFINITY_CONFIG, nodes: Optional[List[str]] = None) -> AffinityRouter:
+    """根据配置创建路由器"""
+    return AffinityRouter(
+        nodes if nodes is not None else config["nodes"],
+        vnodes=config["vnodes"],
+        fail_threshold=config["fail_threshold"],
+        eject_seconds=config["eject_seconds"]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="会话亲和前置代理")
+    parser.add_argument("--nodes", default=",".join(AFFINITY_CONFIG["nodes"]),
+                        help="后端节点，逗号分隔（如 http://127.0.0.1:6001,http://127.0.0.1:6002）")
+    parser.add_argument("--host", default=AFFINITY_CONFIG["proxy_host"])
+    parser.add_argument("--port", type=int, default=AFFINITY_CONFIG["proxy_port"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    node_list = [n.strip().rstrip("/") for n in args.nodes.split(",") if n.strip()]
+    if not node_list:
+        raise SystemExit("❌ 请通过 --nodes 或 AFFINITY_NODES 指定后端节点")
+    if aiohttp is None:
+        raise SystemExit("❌ 前置代理模式需要安装aiohttp：pip install aiohttp")
+
+    proxy = AffinityProxy(create_router(nodes=node_list), health_interval=AFFINITY_CONFIG["health_interval"])
+    logger.info(f"会话亲和代理启动 - 监听: {args.host}:{args.port}, 节点: {node_list}")
+    web.run_app(proxy.build_app(), host=args.host, port=args.port)
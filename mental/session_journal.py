@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+会话日志（write-behind journal）+ 快照：服务重启后快速恢复 session_id <-> conversation_id 绑定
+核心功能：
+- 请求路径只把变更追加到内存队列（O(1)），后台线程批量写入日志文件
+- fsync 节流：每批写入后 flush，但最多每 fsync_interval 秒 fsync 一次
+- 定期生成紧凑快照（仅包含存活会话），随后删除旧日志分段
+- 启动时加载「快照 + 快照之后的日志尾部」，耗时与存活会话数成正比，而非历史变更总数
+文件布局（journal_dir 下）：
+- snapshot.jsonl            首行为头信息 {"version", "generation", "created_at"}，其余每行一条会话
+- journal.{generation}.log  每行一条变更：["b", session_id, user_id, conversation_id, 墙上时间] / ["r", session_id]
+说明：LRU淘汰与TTL过期不写日志——重放时按墙上时间跳过已过期会话，容量上限由存储自身保证
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from session_store import SessionStore, _WALL_CLOCK_OFFSET
+
+logger = logging.getLogger("session_journal")
+
+SNAPSHOT_FILE = "snapshot.jsonl"
+JOURNAL_PREFIX = "journal."
+JOURNAL_SUFFIX = ".log"
+SNAPSHOT_VERSION = 1
+
+
+class SessionJournal:
+    """
+    会话变更日志
+    :param journal_dir: 日志与快照目录
+    :param flush_interval: 后台线程批量写入间隔（秒）
+    :param fsync_interval: 两次 fsync 的最小间隔（秒），即掉电时最多丢失的变更时间窗口
+    :param snapshot_interval: 定期快照间隔（秒）
+    :param snapshot_max_ops: 距上次快照的变更数超过该值时提前快照
+    """
+
+    def __init__(self, journal_dir: str, flush_interval: float = 0.05, fsync_interval: float = 1.0,
+                 snapshot_interval: float = 300.0, snapshot_max_ops: int = 50000):
+        self.journal_dir = str(journal_dir)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_max_ops = snapshot_max_ops
+        os.makedirs(self.journal_dir, exist_ok=True)
+
+        self._pending: deque = deque()  # 待写入的变更（deque.append / popleft 线程安全）
+        self._store: Optional[SessionStore] = None
+        self._file = None
+        self._generation = 0
+        self._ops_since_snapshot = 0
+        self._last_fsync = time.monotonic()
+        self._last_snapshot = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计信息
+        self.written_ops = 0
+        self.snapshots = 0
+        self.last_restore: Dict[str, float] = {}
+
+    # ==================== 请求路径（由 SessionStore 在锁内调用）====================
+    def on_bind(self, session_id: str, user_id: str, conversation_id: Optional[str], last_activity: float):
+        """记录绑定变更（last_activity为monotonic时间戳，落盘时换算为墙上时间以便跨进程恢复）"""
+        self._pending.append(("b", session_id, user_id, conversation_id, round(last_activity + _WALL_CLOCK_OFFSET, 3)))
+
+    def on_remove(self, session_id: str):
+        """记录删除变更"""
+        self._pending.append(("r", session_id))
+
+    # ==================== 文件工具 ====================
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.journal_dir, f"{JOURNAL_PREFIX}{generation:08d}{JOURNAL_SUFFIX}")
+
+    def _journal_generations(self) -> List[int]:
+        """目录下已有的日志分段编号（升序）"""
+        generations = []
+        for name in os.listdir(self.journal_dir):
+            if name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX):
+                try:
+                    generations.append(int(name[len(JOURNAL_PREFIX):-len(JOURNAL_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(generations)
+
+    def _drain(self) -> List[tuple]:
+        """取出当前所有待写变更"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._pending.popleft())
+            except IndexError:
+                return batch
+
+    def _write_batch(self, batch: List[tuple], force_fsync: bool = False):
+        """批量写入一批变更：一次write + flush，fsync按间隔节流"""
+        if batch:
+            self._file.write("".join(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n" for op in batch))
+            self._file.flush()
+            self.written_ops += len(batch)
+            self._ops_since_snapshot += len(batch)
+        now = time.monotonic()
+        if (batch or force_fsync) and (force_fsync or now - self._last_fsync >= self.fsync_interval):
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    # ==================== 恢复 ====================
+    def load(self, store: SessionStore) -> Dict[str, float]:
+        """
+        从快照 + 日志尾部重建会话存储（须在挂载日志前调用，重放过程不会产生新的日志）
+        :return: 恢复统计（会话数、重放变更数、耗时）
+        """
+        start = time.perf_counter()
+        now_wall = time.time()
+        ttl = store.idle_ttl
+        snapshot_generation, snapshot_records, replayed_ops = 0, 0, 0
+
+        snapshot_path = os.path.join(self.journal_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                snapshot_generation = int(header.get("generation", 0))
+                for line in f:
+                    session_id, user_id, conversation_id, wall_ts = json.loads(line)
+                    if ttl > 0 and wall_ts + ttl <= now_wall:
+                        continue
+                    store.bind(session_id, user_id, conversation_id, last_activity=wall_ts - _WALL_CLOCK_OFFSET)
+                    snapshot_records += 1
+
+        for generation in self._journal_generations():
+            if generation < snapshot_generation:
+                continue
+            with open(self._journal_path(generation), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # 崩溃时写了一半的末行，之后的内容不可信
+                    replayed_ops += 1
+                    if op[0] == "b":
+                        _, session_id, user_id, conversation_id, wall_ts = op
+                        if ttl > 0 and wall_ts + ttl <= now_wall:
+                            continue
+                        store.bind(session_id, user_id, conversation_id, last_activity=wall_ts - _WALL_CLOCK_OFFSET)
+                    elif op[0] == "r":
+                        store.remove(op[1])
+
+        self.last_restore = {
+            "sessions": len(store),
+            "snapshot_records": snapshot_records,
+            "replayed_ops": replayed_ops,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+        return self.last_restore
+
+    # ==================== 快照 ====================
+    def snapshot(self):
+        """
+        生成快照并切换到新的日志分段
+        - 在存储锁内取出待写变更并复制存活会话，保证快照与日志的切分点一致
+        - 快照先写临时文件、fsync后原子替换，最后删除旧分段
+        """
+        store = self._store
+        if store is None:
+            return
+        new_generation = self._generation + 1
+        with store.lock:
+            batch = self._drain()
+            records = store.export_records()
+
+        # 切分点之前的变更写入旧分段并落盘
+        self._write_batch(batch, force_fsync=True)
+        self._file.close()
+        self._generation = new_generation
+        self._file = open(self._journal_path(new_generation), "a", encoding="utf-8")
+
+        tmp_path = os.path.join(self.journal_dir, SNAPSHOT_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": SNAPSHOT_VERSION, "generation": new_generation, "created_at": time.time()}) + "\n")
+            f.writelines(
+                json.dumps([session_id, user_id, conversation_id, round(last_activity + _WALL_CLOCK_OFFSET, 3)],
+                           ensure_ascii=False, separators=(",", ":")) + "\n"
+                for session_id, user_id, conversation_id, last_activity in records
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.journal_dir, SNAPSHOT_FILE))
+
+        for generation in self._journal_generations():
+            if generation < new_generation:
+                os.remove(self._journal_path(generation))
+
+        self._ops_since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        self.snapshots += 1
+        logger.info(f"会话快照完成 - 会话数: {len(records)}, 日志分段: {new_generation}")
+
+    # ==================== 后台线程 ====================
+    def start(self, store: SessionStore):
+        """挂载到会话存储并启动后台写入线程（应在 load() 之后调用）"""
+        self._store = store
+        existing = self._journal_generations()
+        self._generation = existing[-1] if existing else 0
+        self._file = open(self._journal_path(self._generation), "a", encoding="utf-8")
+        store.attach_journal(self)
+        # 启动时立即压缩：恢复后的状态写入新快照，旧日志不再参与下次恢复
+        self.snapshot()
+        self._thread = threading.Thread(target=self._run, name="session-journal", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """后台写入循环"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._write_batch(self._drain())
+                if self._ops_since_snapshot and (
+                        self._ops_since_snapshot >= self.snapshot_max_ops
+                        or time.monotonic() - self._last_snapshot >= self.snapshot_interval):
+                    self.snapshot()
+            except Exception as e:
+                logger.error(f"会话日志写入失败: {str(e)}", exc_info=True)
+
+    def close(self, final_snapshot: bool = True):
+        """停止后台线程，写入剩余变更（可选生成最终快照）"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._store is not None:
+            self._store.attach_journal(None)
+        if self._file is None:
+            return
+        if final_snapshot:
+            self.snapshot()
+        else:
+            self._write_batch(self._drain(), force_fsync=True)
+        self._file.close()
+        self._file = None
+
+    def stats(self) -> Dict[str, object]:
+        """日志统计信息（用于健康检查）"""
+        return {
+            "generation": self._generation,
+            "pending_ops": len(self._pending),
+            "written_ops": self.written_ops,
+            "ops_since_snapshot": self._ops_since_snapshot,
+            "snapshots": self.snapshots,
+            "last_restore": self.last_restore
+        }
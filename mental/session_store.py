@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+会话存储：session_id <-> conversation_id 双向映射
+核心功能：
+- SessionRecord 使用 __slots__，单条会话内存占用远小于 dict
+- 时间戳使用 time.monotonic()（不受系统时间回拨影响），对外展示时再换算为ISO时间
+- 最大容量 + LRU淘汰（按最后活动时间排序）
+- 空闲TTL过期由时间轮（hashed timing wheel）驱动：每个tick只处理一个槽，无需全量扫描
+- 正向索引（session_id -> 记录）与反向索引（conversation_id -> session_id）在同一把锁内原子更新
+- 二级索引：user_id -> 会话集合；按最后活动时间有序的活动索引（支持游标分页，无需全量遍历）
+- SessionBackend 为可插拔后端接口：memory（本模块 SessionStore）/ redis（session_store_redis.RedisSessionStore，支持多worker）
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# monotonic时钟与墙上时钟的差值（进程启动时确定，用于把monotonic时间戳换算为展示用时间）
+_WALL_CLOCK_OFFSET = time.time() - time.monotonic()
+
+
+def monotonic_to_iso(timestamp: float) -> str:
+    """将monotonic时间戳换算为ISO格式的本地时间"""
+    return datetime.fromtimestamp(timestamp + _WALL_CLOCK_OFFSET).isoformat()
+
+
+class SessionRecord:
+    """单个会话记录（__slots__：无实例__dict__，节省内存）"""
+    __slots__ = ("session_id", "user_id", "conversation_id", "last_activity", "wheel_tick", "seq")
+
+    def __init__(self, session_id: str, user_id: str, conversation_id: Optional[str], last_activity: float):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.last_activity = last_activity  # monotonic时间戳
+        self.wheel_tick = -1  # 到期tick（所在槽为 wheel_tick % wheel_slots，可能在若干圈之后；-1表示未入轮）
+        self.seq = 0  # 活动序号（每次活动递增，用作分页游标；0表示已删除）
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """转换为接口返回格式（与原session_map的字段保持一致）"""
+        return {
+            "user_id": self.user_id,
+            "conversation_id": self.conversation_id,
+            "last_activity": monotonic_to_iso(self.last_activity)
+        }
+
+
+class SessionBackend:
+    """
+    会话存储后端接口（api_server 仅依赖以下方法）
+    - bind：绑定/更新会话，需原子更新正向与反向索引
+    - get / get_conversation_id / get_session_id：正向、反向查找
+    - remove / query / expire / stats：删除、游标分页查询、过期清理与统计
+    - blocking：方法是否有网络往返（True 时 api_server 在会话舱壁线程中调用，不阻塞事件循环）
+    """
+    backend_name = "abstract"
+    blocking = False
+
+    def bind(self, session_id: str, user_id: str, conversation_id: Optional[str]) -> SessionRecord:
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        raise NotImplementedError
+
+    def get_conversation_id(self, session_id: str) -> Optional[str]:
+        """通过session_id获取绑定的conversation_id"""
+        record = self.get(session_id)
+        return record.conversation_id if record else None
+
+    def get_session_id(self, conversation_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def remove(self, session_id: str) -> Optional[SessionRecord]:
+        raise NotImplementedError
+
+    def expire(self) -> int:
+        return 0
+
+    def query(self, user_id: Optional[str] = None, active_since: Optional[float] = None,
+              has_conversation: Optional[bool] = None, cursor: Optional[str] = None,
+              limit: int = 10, descending: bool = True) -> Tuple[List[SessionRecord], Optional[str]]:
+        """
+        按最后活动时间排序的游标分页查询
+        :param user_id: 仅返回该用户的会话
+        :param active_since: 仅返回该时间（墙上时间戳，秒）之后有过活动的会话
+        :param has_conversation: True/False 仅返回已/未绑定conversation_id的会话
+        :param cursor: 上一页返回的 next_cursor（不透明字符串）
+        :param descending: True 按最近活动在前
+        :return: (记录列表, 下一页游标；None表示没有更多)
+        """
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def conversation_count(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self):
+        """释放后端资源（连接池等）"""
+
+
+class SessionStore(SessionBackend):
+    """
+    有界会话存储（线程安全）
+    :param max_sessions: 最大会话数，超出时淘汰最久未活动的会话（LRU）
+    :param idle_ttl: 空闲过期时间（秒），<=0 表示不过期
+    :param wheel_tick: 时间轮单槽时长（秒），即过期精度
+    :param wheel_slots: 时间轮槽数；TTL超过一圈的会话留在槽内，每转一圈检查一次，到期tick时才处理
+    """
+    backend_name = "memory"
+
+    def __init__(self, max_sessions: int = 100000, idle_ttl: float = 86400.0,
+                 wheel_tick: float = 10.0, wheel_slots: int = 512):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.wheel_tick = wheel_tick
+        self.wheel_slots = wheel_slots
+
+        self._lock = threading.RLock()
+        self._sessions: "OrderedDict[str, SessionRecord]" = OrderedDict()  # 按最后活动时间升序（LRU）
+        self._conv_index: Dict[str, str] = {}  # conversation_id -> session_id
+        self._wheel: List[List[str]] = [[] for _ in range(wheel_slots)]  # 槽内为列表（比set省内存），失效条目惰性跳过
+        self._current_tick = self._tick_of(time.monotonic())
+        # 二级索引：user_id -> session_id集合；活动索引为按序号递增的并行数组（失效条目惰性跳过，超量时压缩）
+        self._user_index: Dict[str, Set[str]] = {}
+        self._seq = 0
+        self._activity_seqs = array("q")
+        self._activity_times = array("d")
+        self._activity_records: List[SessionRecord] = []
+        self._journal = None  # 可选的变更日志（session_journal.SessionJournal），在锁内接收变更
+
+        # 统计信息
+        self.evicted_lru = 0
+        self.expired_ttl = 0
+
+    # ==================== 内部工具 ====================
+    def _tick_of(self, timestamp: float) -> int:
+        """时间戳所在的tick编号"""
+        return int(timestamp // self.wheel_tick)
+
+    def _schedule(self, record: SessionRecord):
+        """按记录的过期时间放入时间轮（必须在锁内调用）"""
+        if self.idle_ttl <= 0:
+            return
+        tick = max(self._tick_of(record.last_activity + self.idle_ttl), self._current_tick + 1)
+        record.wheel_tick = tick
+        self._wheel[tick % self.wheel_slots].append(record.session_id)
+
+    def _unschedule(self, record: SessionRecord):
+        """从时间轮移除记录：仅标记失效，槽内的旧条目在处理该槽时跳过（必须在锁内调用）"""
+        record.wheel_tick = -1
+
+    def _drop(self, session_id: str) -> Optional[SessionRecord]:
+        """同时删除正向、反向索引及时间轮条目（必须在锁内调用）"""
+        record = self._sessions.pop(session_id, None)
+        if record is None:
+            return None
+        if record.conversation_id and self._conv_index.get(record.conversation_id) == session_id:
+            del self._conv_index[record.conversation_id]
+        self._unschedule(record)
+        self._unindex_user(record)
+        record.seq = 0
+        return record
+
+    def _index_user(self, record: SessionRecord):
+        self._user_index.setdefault(record.user_id, set()).add(record.session_id)
+
+    def _unindex_user(self, record: SessionRecord):
+        sessions = self._user_index.get(record.user_id)
+        if sessions is not None:
+            sessions.discard(record.session_id)
+            if not sessions:
+                del self._user_index[record.user_id]
+
+    def _index_activity(self, record: SessionRecord):
+        """为本次活动分配新序号并追加到活动索引（必须在锁内调用）"""
+        self._seq += 1
+        record.seq = self._seq
+        self._activity_seqs.append(record.seq)
+        self._activity_times.append(record.last_activity)
+        self._activity_records.append(record)
+        if len(self._activity_records) > 2 * len(self._sessions) + 1024:
+            self._compact_activity()
+
+    def _compact_activity(self):
+        """重建活动索引，丢弃失效条目（LRU顺序即序号顺序）"""
+        records = list(self._sessions.values())
+        self._activity_records = records
+        self._activity_seqs = array("q", (r.seq for r in records))
+        self._activity_times = array("d", (r.last_activity for r in records))
+
+    def _advance(self, now: float):
+        """
+        推进时间轮到当前时间：逐槽处理到期记录（必须在锁内调用）
+        - 到期tick在之后若干圈的记录留在槽内，等转到该圈时再处理
+        - 槽内记录若在入轮后有过活动（未真正到期），按新的过期时间重新入轮
+        - 长时间无请求时最多处理一整圈（每个槽处理一次，到期tick已过的记录一并处理），避免空转
+        """
+        if self.idle_ttl <= 0:
+            return
+        target_tick = self._tick_of(now)
+        if target_tick <= self._current_tick:
+            return
+        start_tick = max(self._current_tick + 1, target_tick - self.wheel_slots + 1)
+        self._current_tick = target_tick
+        for tick in range(start_tick, target_tick + 1):
+            slot_ids = self._wheel[tick % self.wheel_slots]
+            if not slot_ids:
+                continue
+            due, seen = [], set()
+            slot = tick % self.wheel_slots
+            self._wheel[slot] = []
+            for session_id in slot_ids:
+                record = self._sessions.get(session_id)
+                if record is None or record.wheel_tick < 0 or record.wheel_tick % self.wheel_slots != slot \
+                        or session_id in seen:
+                    continue  # 已删除、已重新入轮到其他槽，或同一记录的重复条目
+                seen.add(session_id)
+                if record.wheel_tick > tick:
+                    self._wheel[slot].append(session_id)  # 到期tick在之后的圈：留在本槽
+                    continue
+                record.wheel_tick = -1
+                if record.last_activity + self.idle_ttl <= now:
+                    due.append(session_id)
+                else:
+                    self._schedule(record)
+            for session_id in due:
+                self._drop(session_id)
+                self.expired_ttl += 1
+
+    def _evict_overflow(self):
+        """超出容量时按LRU淘汰（必须在锁内调用）"""
+        while len(self._sessions) > self.max_sessions:
+            oldest_id = next(iter(self._sessions))
+            self._drop(oldest_id)
+            self.evicted_lru += 1
+
+    # ==================== 对外接口 ====================
+    @property
+    def lock(self) -> threading.RLock:
+        """存储锁（日志快照时用于确定一致的切分点）"""
+        return self._lock
+
+    def attach_journal(self, journal):
+        """挂载/卸载变更日志（None表示卸载）"""
+        with self._lock:
+            self._journal = journal
+
+    def export_records(self) -> List[Tuple[str, str, Optional[str], float]]:
+        """按最后活动时间升序导出全部存活会话 (session_id, user_id, conversation_id, last_activity)"""
+        with self._lock:
+            return [(r.session_id, r.user_id, r.conversation_id, r.last_activity) for r in self._sessions.values()]
+
+    def bind(self, session_id: str, user_id: str, conversation_id: Optional[str],
+             last_activity: Optional[float] = None) -> SessionRecord:
+        """
+        绑定/更新会话（原子更新正向与反向索引）
+        - conversation_id 已绑定到其他 session 时，移除旧 session（与原逻辑一致）
+        - session 之前绑定的旧 conversation_id 的反向映射一并清除
+        - last_activity 仅在从日志恢复时传入（monotonic时间戳），默认取当前时间
+        """
+        now = time.monotonic() if last_activity is None else last_activity
+        with self._lock:
+            self._advance(now)
+            if conversation_id:
+                old_session_id = self._conv_index.get(conversation_id)
+                if old_session_id and old_session_id != session_id:
+                    self._drop(old_session_id)
+
+            record = self._sessions.get(session_id)
+            if record is None:
+                record = SessionRecord(session_id, user_id, conversation_id, now)
+                self._sessions[session_id] = record
+                self._schedule(record)
+                self._index_user(record)
+            else:
+                if record.conversation_id and record.conversation_id != conversation_id \
+                        and self._conv_index.get(record.conversation_id) == session_id:
+                    del self._conv_index[record.conversation_id]
+                if record.user_id != user_id:
+                    self._unindex_user(record)
+                    record.user_id = user_id
+                    self._index_user(record)
+                record.conversation_id = conversation_id
+                record.last_activity = now  # 时间轮条目惰性更新，到槽时再按新时间重新入轮
+                self._sessions.move_to_end(session_id)
+
+            if conversation_id:
+                self._conv_index[conversation_id] = session_id
+            self._index_activity(record)
+            self._evict_overflow()
+            if self._journal is not None:
+                self._journal.on_bind(session_id, user_id, conversation_id, now)
+            return record
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        """获取会话记录（不更新活动时间）"""
+        with self._lock:
+            self._advance(time.monotonic())
+            return self._sessions.get(session_id)
+
+    def get_session_id(self, conversation_id: str) -> Optional[str]:
+        """通过conversation_id反向查找session_id"""
+        with self._lock:
+            self._advance(time.monotonic())
+            return self._conv_index.get(conversation_id)
+
+    def remove(self, session_id: str) -> Optional[SessionRecord]:
+        """删除会话（同时清除反向映射），返回被删除的记录"""
+        with self._lock:
+            record = self._drop(session_id)
+            if record is not None and self._journal is not None:
+                self._journal.on_remove(session_id)
+            return record
+
+    def expire(self) -> int:
+        """主动推进时间轮，返回本次过期的会话数（可由后台定时任务调用）"""
+        with self._lock:
+            before = self.expired_ttl
+            self._advance(time.monotonic())
+            return self.expired_ttl - before
+
+    def query(self, user_id: Optional[str] = None, active_since: Optional[float] = None,
+              has_conversation: Optional[bool] = None, cursor: Optional[str] = None,
+              limit: int = 10, descending: bool = True) -> Tuple[List[SessionRecord], Optional[str]]:
+        """
+        游标分页查询（游标为活动序号）
+        - 指定user_id时只遍历该用户的会话
+        - 否则在活动索引上二分定位游标/起始时间，仅遍历返回页附近的条目
+        """
+        try:
+            cursor_seq = int(cursor) if cursor else None
+        except ValueError:
+            raise ValueError(f"无效的分页游标：{cursor}")
+        since = active_since - _WALL_CLOCK_OFFSET if active_since is not None else None
+
+        def matches(record: SessionRecord) -> bool:
+            if has_conversation is not None and bool(record.conversation_id) != has_conversation:
+                return False
+            return since is None or record.last_activity >= since
+
+        with self._lock:
+            self._advance(time.monotonic())
+            results: List[SessionRecord] = []
+            if user_id is not None:
+                candidates = [self._sessions[sid] for sid in self._user_index.get(user_id, ())]
+                candidates.sort(key=lambda r: r.seq, reverse=descending)
+                for record in candidates:
+                    if cursor_seq is not None and (record.seq >= cursor_seq if descending else record.seq <= cursor_seq):
+                        continue
+                    if matches(record):
+                        results.append(record)
+                        if len(results) >= limit:
+                            break
+            else:
+                seqs, times, records = self._activity_seqs, self._activity_times, self._activity_records
+                if descending:
+                    index = (bisect_left(seqs, cursor_seq) if cursor_seq is not None else len(seqs)) - 1
+                    while index >= 0 and len(results) < limit:
+                        if since is not None and times[index] < since:
+                            break  # 活动索引按时间递增，之后的条目都更早
+                        record = records[index]
+                        if record.seq == seqs[index] and matches(record):
+                            results.append(record)
+                        index -= 1
+                else:
+                    index = bisect_right(seqs, cursor_seq) if cursor_seq is not None else 0
+                    if since is not None:
+                        index = max(index, bisect_left(times, since))
+                    while index < len(seqs) and len(results) < limit:
+                        record = records[index]
+                        if record.seq == seqs[index] and matches(record):
+                            results.append(record)
+                        index += 1
+            next_cursor = str(results[-1].seq) if len(results) >= limit else None
+            return results, next_cursor
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._sessions))
+
+    @property
+    def conversation_count(self) -> int:
+        """已绑定conversation_id的会话数"""
+        return len(self._conv_index)
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计信息（用于健康检查）"""
+        return {
+            "backend": self.backend_name,
+            "sessions": len(self._sessions),
+            "conversations": len(self._conv_index),
+            "users": len(self._user_index),
+            "activity_index_size": len(self._activity_records),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted_lru": self.evicted_lru,
+            "expired_ttl": self.expired_ttl
+        }
+
+
+def create_session_store(config: Dict[str, Any]) -> SessionBackend:
+    """
+    按配置创建会话存储后端
+    - backend=memory：进程内 SessionStore（单worker）
+    - backend=redis：RedisSessionStore（多worker/多节点共享会话）
+    """
+    backend = config.get("backend", "memory")
+    if backend == "redis":
+        from session_store_redis import RedisSessionStore  # 延迟导入：仅redis后端依赖redis包
+        return RedisSessionStore(
+            redis_url=config["redis_url"],
+            idle_ttl=config["idle_ttl"],
+            key_prefix=config.get("redis_key_prefix", "health_agent:session:"),
+            local_cache_size=config.get("redis_local_cache_size", 0),
+            local_cache_ttl=config.get("redis_local_cache_ttl", 2.0)
+        )
+    if backend != "memory":
+        raise ValueError(f"❌ 不支持的会话存储后端：{backend}（可选：memory / redis）")
+    return SessionStore(
+        max_sessions=config["max_sessions"],
+        idle_ttl=config["idle_ttl"],
+        wheel_tick=config["wheel_tick"],
+        wheel_slots=config["wheel_slots"]
+    )
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Redis会话存储后端：多个uvicorn worker / 多节点共享 session_id <-> conversation_id 映射
+数据结构（key_prefix 默认 health_agent:session:）：
+- {prefix}s:{session_id}        HASH  user_id / conversation_id / last_activity（墙上时间戳）
+- {prefix}c:{conversation_id}   STRING  -> session_id（反向索引）
+- {prefix}activity              ZSET  session_id -> last_activity（分页与计数）
+- {prefix}bound                 ZSET  已绑定conversation的session_id -> last_activity
+- {prefix}u:{user_id}           ZSET  该用户的session_id -> last_activity（按用户查询）
+说明：
+- 绑定时 WATCH 会话键与反向索引键后读取旧映射，再以 MULTI 事务写入正向+反向索引；
+  读取后被其他worker修改时事务放弃并重试（乐观锁），不会基于过期的读取结果写入
+- 分页查询使用 ZREVRANGEBYSCORE + (分数, session_id) 复合游标：同一分数的成员按 session_id 排序，
+  游标记录上一页最后一条的分数与成员，活动时间相同的会话不会在翻页时被跳过
+- 会话键与反向索引键均设置空闲TTL，每次活动刷新；ZSET中的过期成员在写入时顺带清理
+- 可选本地读缓存（小容量LRU + 短TTL），降低续传场景的读往返；本进程写入时同步失效；
+  不缓存"不存在"（新会话刚由其他worker创建时不会被误判为不存在）
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import redis
+    from redis.exceptions import WatchError
+except ImportError:  # 仅在选择redis后端时需要
+    redis = None
+    WatchError = None
+
+from session_store import SessionBackend, SessionRecord, _WALL_CLOCK_OFFSET
+
+BIND_MAX_ATTEMPTS = 16  # 绑定事务因并发修改被放弃时的最大尝试次数
+
+
+class RedisSessionStore(SessionBackend):
+    """
+    Redis会话存储
+    :param redis_url: Redis连接地址（如 redis://localhost:6379/0）
+    :param idle_ttl: 空闲过期时间（秒）
+    :param key_prefix: 键前缀（多个环境共用一个Redis时区分）
+    :param local_cache_size: 本地读缓存容量（0表示关闭）
+    :param local_cache_ttl: 本地读缓存有效期（秒），决定跨worker可见的最大延迟
+    :param client: 直接传入redis客户端（测试时可传入fakeredis）
+    """
+    backend_name = "redis"
+    blocking = True  # 每次调用都有Redis往返（绑定还可能重试），由调用方放到线程中执行
+
+    def __init__(self, redis_url: str = "redis://localhost:6379/0", idle_ttl: float = 7 * 24 * 3600,
+                 key_prefix: str = "health_agent:session:", local_cache_size: int = 0,
+                 local_cache_ttl: float = 2.0, client: Any = None):
+        if client is None:
+            if redis is None:
+                raise ValueError("❌ 使用redis会话后端需要安装redis包：pip install redis")
+            client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.redis = client
+        self.idle_ttl = int(idle_ttl) if idle_ttl > 0 else 0
+        self.prefix = key_prefix
+        self.activity_key = f"{key_prefix}activity"
+        self.bound_key = f"{key_prefix}bound"
+
+        # 本地读缓存：session_id -> (记录, 缓存截止时间)
+        self.local_cache_size = local_cache_size
+        self.local_cache_ttl = local_cache_ttl
+        self._cache: "OrderedDict[str, Tuple[SessionRecord, float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bind_retries = 0
+
+    # ==================== 内部工具 ====================
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.prefix}s:{session_id}"
+
+    def _conv_key(self, conversation_id: str) -> str:
+        return f"{self.prefix}c:{conversation_id}"
+
+    def _user_key(self, user_id: str) -> str:
+        return f"{self.prefix}u:{user_id}"
+
+    @staticmethod
+    def _to_record(session_id: str, data: Dict[str, str]) -> Optional[SessionRecord]:
+        """Redis HASH -> SessionRecord（墙上时间换算为monotonic，便于与内存后端统一展示）"""
+        if not data:
+            return None
+        return SessionRecord(
+            session_id,
+            data.get("user_id", ""),
+            data.get("conversation_id") or None,
+            float(data.get("last_activity", time.time())) - _WALL_CLOCK_OFFSET
+        )
+
+    def _cache_get(self, session_id: str) -> Tuple[bool, Optional[SessionRecord]]:
+        """查询本地缓存，返回 (是否命中, 记录)"""
+        if not self.local_cache_size:
+            return False, None
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.cache_misses += 1
+                return False, None
+            self._cache.move_to_end(session_id)
+            self.cache_hits += 1
+            return True, entry[0]
+
+    def _cache_put(self, session_id: str, record: Optional[SessionRecord]):
+        """缓存存在的记录（不存在的结果不缓存）"""
+        if not self.local_cache_size or record is None:
+            return
+        with self._cache_lock:
+            self._cache[session_id] = (record, time.monotonic() + self.local_cache_ttl)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.local_cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_invalidate(self, *session_ids: Optional[str]):
+        if not self.local_cache_size:
+            return
+        with self._cache_lock:
+            for session_id in session_ids:
+                if session_id:
+                    self._cache.pop(session_id, None)
+
+    def _trim_indexes(self, pipe, now: float):
+        """从ZSET索引中清除已过期成员（会话键已由Redis TTL删除）"""
+        if self.idle_ttl:
+            pipe.zremrangebyscore(self.activity_key, "-inf", now - self.idle_ttl)
+            pipe.zremrangebyscore(self.bound_key, "-inf", now - self.idle_ttl)
+
+    # ==================== 对外接口 ====================
+    def bind(self, session_id: str, user_id: str, conversation_id: Optional[str]) -> SessionRecord:
+        """绑定/更新会话：WATCH后读取旧映射，MULTI事务写入正向+反向索引（并发修改时重试）"""
+        session_key = self._session_key(session_id)
+        conv_key = self._conv_key(conversation_id) if conversation_id else None
+        watch_keys = [session_key, conv_key] if conv_key else [session_key]
+
+        with self.redis.pipeline(transaction=True) as pipe:
+            for attempt in range(BIND_MAX_ATTEMPTS):
+                try:
+                    # 1. 监视并读取：conversation当前归属的session、session当前绑定的conversation与用户
+                    pipe.watch(*watch_keys)
+                    old_conv_id, old_user_id = pipe.hmget(session_key, "conversation_id", "user_id")
+                    owner_session_id = pipe.get(conv_key) if conv_key else None
+                    owner_user_id = None
+                    if owner_session_id and owner_session_id != session_id:
+                        # 旧归属session的用户（移除时同时清理其用户索引），同样在监视下读取
+                        owner_key = self._session_key(owner_session_id)
+                        pipe.watch(owner_key)
+                        owner_user_id = pipe.hget(owner_key, "user_id")
+
+                    # 2. 事务写入（监视的键在读取后被修改时 execute 抛出 WatchError）
+                    now = time.time()
+                    pipe.multi()
+                    self._write_binding(pipe, session_id, user_id, conversation_id, now,
+                                        old_conv_id, old_user_id, owner_session_id, owner_user_id)
+                    pipe.execute()
+                    break
+                except WatchError:
+                    self.bind_retries += 1
+                    pipe.reset()
+            else:
+                raise RuntimeError(f"会话绑定冲突重试{BIND_MAX_ATTEMPTS}次仍未成功：{session_id}")
+
+        record = SessionRecord(session_id, user_id, conversation_id, now - _WALL_CLOCK_OFFSET)
+        self._cache_invalidate(owner_session_id)
+        self._cache_put(session_id, record)
+        return record
+
+    def _write_binding(self, write, session_id: str, user_id: str, conversation_id: Optional[str], now: float,
+                       old_conv_id: Optional[str], old_user_id: Optional[str], owner_session_id: Optional[str],
+                       owner_user_id: Optional[str] = None):
+        """在事务中写入绑定（正向、反向与二级索引）"""
+        session_key = self._session_key(session_id)
+        if owner_session_id and owner_session_id != session_id:
+            # conversation已绑定到其他session：移除旧session（与内存后端语义一致）
+            write.delete(self._session_key(owner_session_id))
+            write.zrem(self.activity_key, owner_session_id)
+            write.zrem(self.bound_key, owner_session_id)
+            if owner_user_id:
+                write.zrem(self._user_key(owner_user_id), owner_session_id)
+        if old_conv_id and old_conv_id != conversation_id:
+            write.delete(self._conv_key(old_conv_id))
+        if old_user_id and old_user_id != user_id:
+            write.zrem(self._user_key(old_user_id), session_id)
+
+        write.hset(session_key, mapping={
+            "user_id": user_id,
+            "conversation_id": conversation_id or "",
+            "last_activity": repr(now)
+        })
+        write.zadd(self.activity_key, {session_id: now})
+        write.zadd(self._user_key(user_id), {session_id: now})
+        if conversation_id:
+            write.set(self._conv_key(conversation_id), session_id)
+            write.zadd(self.bound_key, {session_id: now})
+        else:
+            write.zrem(self.bound_key, session_id)
+        if self.idle_ttl:
+            write.expire(session_key, self.idle_ttl)
+            write.expire(self._user_key(user_id), self.idle_ttl)
+            write.zremrangebyscore(self._user_key(user_id), "-inf", now - self.idle_ttl)
+            if conversation_id:
+                write.expire(self._conv_key(conversation_id), self.idle_ttl)
+        self._trim_indexes(write, now)
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        """获取会话记录（优先本地缓存；不存在的结果不缓存）"""
+        hit, record = self._cache_get(session_id)
+        if hit:
+            return record
+        record = self._to_record(session_id, self.redis.hgetall(self._session_key(session_id)))
+        self._cache_put(session_id, record)
+        return record
+
+    def get_session_id(self, conversation_id: str) -> Optional[str]:
+        """通过conversation_id反向查找session_id"""
+        return self.redis.get(self._conv_key(conversation_id))
+
+    def remove(self, session_id: str) -> Optional[SessionRecord]:
+        """删除会话（同时清除反向映射）"""
+        session_key = self._session_key(session_id)
+        record = self._to_record(session_id, self.redis.hgetall(session_key))
+        write = self.redis.pipeline(transaction=True)
+        write.delete(session_key)
+        write.zrem(self.activity_key, session_id)
+        write.zrem(self.bound_key, session_id)
+        if record and record.conversation_id:
+            write.delete(self._conv_key(record.conversation_id))
+        if record and record.user_id:
+            write.zrem(self._user_key(record.user_id), session_id)
+        write.execute()
+        self._cache_invalidate(session_id)
+        return record
+
+    def expire(self) -> int:
+        """清理ZSET索引中的过期成员，返回清理数量"""
+        pipe = self.redis.pipeline(transaction=False)
+        self._trim_indexes(pipe, time.time())
+        results = pipe.execute()
+        return int(results[0]) if results else 0
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+        """解析游标 "分数:session_id"（兼容旧版只含分数的游标，按排他区间处理）"""
+        if not cursor:
+            return None, None
+        score, _, member = cursor.partition(":")
+        try:
+            return float(score), member or None
+        except ValueError:
+            raise ValueError(f"无效的分页游标：{cursor}")
+
+    def query(self, user_id: Optional[str] = None, active_since: Optional[float] = None,
+              has_conversation: Optional[bool] = None, cursor: Optional[str] = None,
+              limit: int = 10, descending: bool = True) -> Tuple[List[SessionRecord], Optional[str]]:
+        """
+        游标分页查询（游标为上一页最后一条的 "分数:session_id"）
+        - 按用户查询走 {prefix}u:{user_id}，仅查已绑定conversation的会话走 bound 索引
+        - 每批按分数区间取ID，再管道批量HGETALL；过滤后不足一页时继续取下一批
+        - 分数区间包含游标分数，同分成员按 session_id 跳过已返回的部分（ZSET同分按成员字典序排列）
+        """
+        cursor_score, cursor_member = self._parse_cursor(cursor)
+        if user_id is not None:
+            index_key = self._user_key(user_id)
+        elif has_conversation:
+            index_key = self.bound_key
+        else:
+            index_key = self.activity_key
+
+        lower = repr(float(active_since)) if active_since is not None else "-inf"
+        if self.idle_ttl:
+            floor = time.time() - self.idle_ttl
+            lower = repr(max(float(lower), floor)) if lower != "-inf" else repr(floor)
+        if cursor_score is None:
+            bound = None
+        elif cursor_member is None:
+            bound = f"({cursor_score!r}"  # 旧版游标：排他区间
+        else:
+            bound = repr(cursor_score)
+        batch_size = max(limit * 2, 50)
+
+        def seen(score: float, session_id: str) -> bool:
+            """是否已在之前的页返回（与游标同分且成员在游标之前）"""
+            if cursor_member is None or score != cursor_score:
+                return False
+            return session_id >= cursor_member if descending else session_id <= cursor_member
+
+        results: List[SessionRecord] = []
+        result_score = result_member = None
+        start = 0  # 同一分数边界内已读取的成员数（同分成员超过一批时按偏移继续）
+        while len(results) < limit:
+            if descending:
+                batch = self.redis.zrevrangebyscore(index_key, bound or "+inf", lower,
+                                                    start=start, num=batch_size, withscores=True)
+            else:
+                batch = self.redis.zrangebyscore(index_key, bound or lower, "+inf",
+                                                 start=start, num=batch_size, withscores=True)
+            if not batch:
+                break
+            candidates = [(session_id, score) for session_id, score in batch if not seen(score, session_id)]
+            pipe = self.redis.pipeline(transaction=False)
+            for session_id, _ in candidates:
+                pipe.hgetall(self._session_key(session_id))
+            for (session_id, score), data in zip(candidates, pipe.execute() if candidates else []):
+                record = self._to_record(session_id, data)
+                if record is None:
+                    continue  # 会话键已过期，索引成员稍后清理
+                if has_conversation is not None and bool(record.conversation_id) != has_conversation:
+                    continue
+                results.append(record)
+                result_score, result_member = score, session_id
+                if len(results) >= limit:
+                    break
+            if len(batch) < batch_size:
+                break
+            # 下一批从本批最后的分数开始（含该分数），跳过本批中已读取的同分成员
+            last_score = batch[-1][1]
+            same_score = sum(1 for _, score in batch if score == last_score)
+            if bound == repr(last_score):
+                start += same_score
+            else:
+                bound, start = repr(last_score), same_score
+        if len(results) >= limit:
+            return results, f"{result_score!r}:{result_member}"
+        return results, None
+
+    def __len__(self) -> int:
+        return int(self.redis.zcard(self.activity_key))
+
+    @property
+    def conversation_count(self) -> int:
+        """已绑定conversation_id的会话数"""
+        return int(self.redis.zcard(self.bound_key))
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计信息（用于健康检查）"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcard(self.activity_key)
+        pipe.zcard(self.bound_key)
+        sessions, conversations = pipe.execute()
+        return {
+            "backend": self.backend_name,
+            "sessions": int(sessions),
+            "conversations": int(conversations),
+            "idle_ttl_seconds": self.idle_ttl,
+            "local_cache_size": len(self._cache),
+            "local_cache_hits": self.cache_hits,
+            "local_cache_misses": self.cache_misses,
+            "bind_retries": self.bind_retries
+        }
+
+    def close(self):
+        """关闭连接池"""
+        self.redis.close()
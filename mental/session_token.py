@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+无状态会话令牌：把 session_id / user_id / conversation_id 签名后交给客户端保存
+核心功能：
+- 签发：HMAC-SHA256 签名的紧凑令牌，客户端下次请求原样带回即可续传，服务端无需查会话存储
+- 校验：常数时间比较签名 + 过期时间检查，纯CPU计算（微秒级），不涉及任何IO
+- 密钥轮换：配置多把密钥，第一把用于签发，全部用于校验（按kid选择），旧令牌在过期前仍然有效
+令牌格式：v1.{kid}.{base64url(载荷JSON)}.{base64url(签名)}，签名覆盖前三段
+说明：令牌只防篡改不加密，载荷中的ID对客户端可见（与响应体中返回的内容相同）
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_VERSION = "v1"
+
+
+class SessionTokenError(ValueError):
+    """令牌无效（格式错误、签名不匹配、密钥未知或已过期）"""
+
+
+@dataclass
+class SessionClaims:
+    """令牌中携带的会话信息"""
+    session_id: str
+    user_id: str
+    conversation_id: Optional[str]
+    issued_at: int
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def parse_keys(spec: str) -> List[Tuple[str, str]]:
+    """解析密钥配置 "kid1:secret1,kid2:secret2"（第一把为当前签发密钥）"""
+    keys = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kid, sep, secret = item.partition(":")
+        if not sep or not kid or not secret:
+            raise ValueError(f"❌ 会话令牌密钥格式错误（应为 kid:secret）：{kid or item[:8]}...")
+        keys.append((kid, secret))
+    return keys
+
+
+class SessionTokenCodec:
+    """
+    会话令牌签发/校验
+    :param keys: [(kid, secret), ...]，第一把用于签发
+    :param ttl: 令牌有效期（秒）
+    """
+
+    def __init__(self, keys: List[Tuple[str, str]], ttl: float = 7 * 24 * 3600):
+        if not keys:
+            raise ValueError("❌ 启用会话令牌需要配置至少一把密钥（SESSION_TOKEN_KEYS）")
+        self.ttl = int(ttl)
+        self.signing_kid = keys[0][0]
+        self._keys: Dict[str, bytes] = {kid: secret.encode("utf-8") for kid, secret in keys}
+
+    def _sign(self, kid: str, signing_input: str) -> bytes:
+        return hmac.new(self._keys[kid], signing_input.encode("ascii"), hashlib.sha256).digest()
+
+    def issue(self, session_id: str, user_id: str, conversation_id: Optional[str] = None) -> str:
+        """签发令牌"""
+        now = int(time.time())
+        payload = {"s": session_id, "u": user_id, "c": conversation_id, "iat": now, "exp": now + self.ttl}
+        body = _b64encode(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        signing_input = f"{TOKEN_VERSION}.{self.signing_kid}.{body}"
+        return f"{signing_input}.{_b64encode(self._sign(self.signing_kid, signing_input))}"
+
+    def verify(self, token: str) -> SessionClaims:
+        """校验令牌并返回会话信息（失败抛出 SessionTokenError）"""
+        parts = token.split(".")
+        if len(parts) != 4 or parts[0] != TOKEN_VERSION:
+            raise SessionTokenError("会话令牌格式错误")
+        _, kid, body, signature = parts
+        if kid not in self._keys:
+            raise SessionTokenError("会话令牌密钥未知（可能已轮换下线）")
+        try:
+            valid = hmac.compare_digest(self._sign(kid, token[:-len(signature) - 1]), _b64decode(signature))
+        except (ValueError, UnicodeEncodeError):
+            valid = False
+        if not valid:
+            raise SessionTokenError("会话令牌签名无效")
+        try:
+            payload = json.loads(_b64decode(body))
+            claims = SessionClaims(
+                session_id=payload["s"],
+                user_id=payload["u"],
+                conversation_id=payload.get("c"),
+                issued_at=int(payload["iat"]),
+                expires_at=int(payload["exp"])
+            )
+        except (ValueError, KeyError, TypeError):
+            raise SessionTokenError("会话令牌载荷无效")
+        if claims.expires_at <= time.time():
+            raise SessionTokenError("会话令牌已过期")
+        return claims
+
+
+def create_token_codec(config: Dict) -> Optional[SessionTokenCodec]:
+    """根据 SESSION_TOKEN_CONFIG 创建令牌编解码器（未启用时返回None）"""
+    if not config.get("enabled"):
+        return None
+    return SessionTokenCodec(parse_keys(config.get("keys", "")), ttl=config.get("ttl", 7 * 24 * 3600))
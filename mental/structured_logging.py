@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+非阻塞结构化日志
+核心功能：
+- 队列日志：请求线程只把日志记录放入内存队列（O(1)，不做格式化和IO），由后台线程格式化并写入stdout/文件；
+  队列满时丢弃并计数，不阻塞请求
+- 延迟格式化：%-风格参数的插值、JSON序列化、时间戳格式化都在后台线程完成
+- 结构化JSON：每条记录包含时间、级别、logger、消息、请求ID、路由，以及通过 extra 传入的字段
+- 按路由采样：每个请求进入时按路由采样率决定是否保留其 INFO 及以下日志；WARNING 及以上始终保留，
+  访问日志在状态码 >= 400 时也始终保留
+- 日志文件轮转：按大小（LOG_MAX_BYTES）或按时间（LOG_ROTATE_WHEN，如 midnight）
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# 当前请求的上下文（由 AccessLogMiddleware 设置；线程池中执行的代码不继承，视为非请求日志全部保留）
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("route", default=None)
+_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("sampled", default=True)
+
+# LogRecord 自带的属性（其余属性视为 extra 字段输出）
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "route"}
+
+
+class JsonFormatter(logging.Formatter):
+    """单行JSON格式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+            data["route"] = record.route
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式（与原有格式一致，带请求ID时追加在末尾）"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{text} [{request_id}]" if request_id else text
+
+
+class SamplingFilter(logging.Filter):
+    """丢弃未被采样请求的 INFO 及以下日志（WARNING 及以上始终保留）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not _sampled.get():
+            return False
+        # 在请求线程中捕获请求上下文（后台线程中contextvars已不可用）
+        record.request_id = _request_id.get()
+        record.route = _route.get()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    不在请求线程中格式化的队列处理器
+    标准 QueueHandler.prepare 会在调用方线程中格式化消息，这里只固定异常堆栈（对象可能随后被修改），
+    消息插值与格式化全部交给后台线程
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析采样率配置 "/health=0,/chat/stream=0.1"（路径=保留比例）"""
+    rates = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if item:
+            path, _, rate = item.partition("=")
+            rates[path.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class LoggingRuntime:
+    """日志运行时（队列处理器 + 后台写入线程），setup_logging() 的返回值"""
+
+    def __init__(self, handler: NonBlockingQueueHandler, listener: logging.handlers.QueueListener,
+                 sample_rates: Dict[str, float], default_rate: float):
+        self.handler = handler
+        self.listener = listener
+        self.sample_rates = sample_rates
+        self.default_rate = default_rate
+        self._stopped = False
+
+    def sample(self, path: str) -> bool:
+        rate = self.sample_rates.get(path, self.default_rate)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def stop(self):
+        """写完队列中剩余的日志并停止后台线程（可重复调用）"""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self.handler.queue.qsize(), "dropped": self.handler.dropped}
+
+
+def _file_handler(config: Dict[str, Any]) -> logging.Handler:
+    if config.get("rotate_when"):
+        return logging.handlers.TimedRotatingFileHandler(
+            config["file"], when=config["rotate_when"], backupCount=config["backup_count"], encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(
+        config["file"], maxBytes=config["max_bytes"], backupCount=config["backup_count"], encoding="utf-8")
+
+
+def setup_logging(config: Dict[str, Any]) -> LoggingRuntime:
+    """根据 LOG_CONFIG 配置根logger：队列处理器 + 后台线程写入 stdout/轮转文件"""
+    formatter = JsonFormatter() if config.get("format") == "json" else TextFormatter()
+    outputs = [logging.StreamHandler(sys.stdout)]
+    if config.get("file"):
+        outputs.append(_file_handler(config))
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=config.get("queue_size", 10000))
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+    listener = logging.handlers.QueueListener(log_queue, *outputs, respect_handler_level=False)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(config.get("level", "INFO"))
+    listener.start()
+
+    runtime = LoggingRuntime(handler, listener, parse_sample_rates(config.get("sample_rates", "")),
+                             config.get("sample_default", 1.0))
+    atexit.register(runtime.stop)
+    return runtime
+
+
+class AccessLogMiddleware:
+    """
+    访问日志ASGI中间件（应注册为最外层）：设置请求上下文、按路由采样，每个请求输出一条结构化访问日志
+    用法：app.add_middleware(AccessLogMiddleware, runtime=runtime)
+    """
+
+    def __init__(self, app, runtime: LoggingRuntime, logger_name: str = "access"):
+        self.app = app
+        self.runtime = runtime
+        self.logger = logging.getLogger(logger_name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        sampled = self.runtime.sample(path)
+        tokens = (_request_id.set(uuid.uuid4().hex[:12]), _route.set(path), _sampled.set(sampled))
+        status = 500
+        start = time.perf_counter()
+
+        async def logging_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, logging_send)
+        finally:
+            if sampled or status >= 400:
+                level = logging.WARNING if status >= 500 else logging.INFO
+                elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+                _sampled.set(True)  # 错误请求的访问日志不受采样影响
+                self.logger.log(level, "%s %s %s %sms", scope.get("method"), path, status, elapsed_ms,
+                                extra={"method": scope.get("method"), "status": status, "duration_ms": elapsed_ms})
+            for var, token in zip((_request_id, _route, _sampled), tokens):
+                var.reset(token)
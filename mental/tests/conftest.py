@@ -0,0 +1,6 @@
+"""测试公共配置：模块均为 mental/ 下的平铺模块，测试从 mental/ 导入"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+"""音频HTTP响应（audio_http）：Range 解析与条件请求"""
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from audio_http import audio_response, parse_single_range
+from tts_cache import content_etag
+
+AUDIO = bytes(range(100))
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=10-19", (10, 19)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=95-200", (95, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+])
+def test_valid_range(header, expected):
+    assert parse_single_range(header, len(AUDIO)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=5-3", "bytes=abc", "bytes=", "bytes=-", "bytes=1-x", "bytes=+1-2",
+                                    "bytes=5", "items=0-1", "bytes=0-1,5-6"])
+def test_invalid_or_unsupported_range_is_ignored(header):
+    assert parse_single_range(header, len(AUDIO)) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_single_range(header, len(AUDIO))
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/audio")
+    async def audio(request: Request):
+        return audio_response(request.headers, content_etag(AUDIO), data=AUDIO)
+
+    return TestClient(app)
+
+
+def test_invalid_range_serves_full_content(client):
+    for header in ("bytes=5-3", "bytes=abc"):
+        response = client.get("/audio", headers={"Range": header})
+        assert response.status_code == 200
+        assert response.content == AUDIO
+
+
+def test_range_past_end_is_416(client):
+    response = client.get("/audio", headers={"Range": "bytes=100-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(AUDIO)}"
+
+
+def test_range_and_if_range(client):
+    response = client.get("/audio", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == AUDIO[90:]
+    assert response.headers["content-range"] == f"bytes 90-99/{len(AUDIO)}"
+    stale = client.get("/audio", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == AUDIO
+    assert client.get("/audio", headers={"If-None-Match": content_etag(AUDIO)}).status_code == 304
@@ -0,0 +1,85 @@
+"""舱壁（bulkhead）：流式迭代提前结束时关闭源生成器"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from bulkhead import Bulkhead, BulkheadTimeout
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def source(closed: threading.Event, delays=(0, 0, 0)):
+    try:
+        for index, delay in enumerate(delays):
+            time.sleep(delay)
+            yield index
+    finally:
+        closed.set()
+
+
+def test_aclose_closes_source_generator():
+    bulkhead = Bulkhead("test", 2, 2, 5)
+    closed = threading.Event()
+    iterator = source(closed)
+
+    async def scenario():
+        stream = bulkhead.iterate(iterator)
+        assert await stream.__anext__() == 0
+        await stream.aclose()
+
+    run(scenario())
+    assert closed.is_set()
+    assert iterator.gi_frame is None
+    bulkhead.shutdown()
+
+
+def test_item_timeout_closes_source_after_in_flight_next_returns():
+    bulkhead = Bulkhead("test", 1, 2, 5)
+    closed = threading.Event()
+
+    async def scenario():
+        async for _ in bulkhead.iterate(source(closed, delays=(0, 0.3)), item_timeout=0.05):
+            pass
+
+    with pytest.raises(BulkheadTimeout):
+        run(scenario())
+    assert not closed.is_set()  # 进行中的 next 返回前不关闭，也不阻塞调用方
+    assert closed.wait(2)
+    bulkhead.shutdown()
+
+
+def test_cancelled_consumer_closes_source():
+    bulkhead = Bulkhead("test", 2, 2, 5)
+    closed = threading.Event()
+    iterator = source(closed)  # 保持引用：不依赖垃圾回收关闭
+
+    async def scenario():
+        async def consume():
+            async for _ in bulkhead.iterate(iterator):
+                await asyncio.sleep(10)  # 客户端断开时任务在此被取消
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    run(scenario())
+    assert closed.wait(2)  # 关闭在舱壁线程中执行，可能在事件循环结束后才完成
+    bulkhead.shutdown()
+
+
+def test_exhausted_source_finishes_normally():
+    bulkhead = Bulkhead("test", 2, 2, 5)
+    closed = threading.Event()
+
+    async def scenario():
+        return [item async for item in bulkhead.iterate(source(closed))]
+
+    assert run(scenario()) == [0, 1, 2]
+    assert closed.is_set()
+    bulkhead.shutdown()
@@ -0,0 +1,39 @@
+"""情绪标签 -> TTS情感参数映射（coze_tts_client.emotion_tag_to_tts）"""
+
+import pytest
+
+from coze_tts_client import emotion_tag_to_tts
+
+
+@pytest.mark.parametrize("tag, expected", [
+    ("开心", ("happy", 4.0)),
+    ("非常开心", ("happy", 5.0)),
+    ("happy", ("happy", 4.0)),
+    ("有点焦虑", ("neutral", 1.0)),
+    ("sad", ("sad", 2.0)),
+    ("", ("neutral", 3.0)),
+    (None, ("neutral", 3.0)),
+    ("无法识别", ("neutral", 3.0)),
+])
+def test_plain_tags(tag, expected):
+    assert emotion_tag_to_tts(tag) == expected
+
+
+@pytest.mark.parametrize("tag", ["不开心", "不高兴", "没那么高兴", "不太开心", "不是很开心", "unhappy", "not happy", "isn't happy"])
+def test_negated_happy_maps_to_sad(tag):
+    assert emotion_tag_to_tts(tag) == ("sad", 2.0)
+
+
+def test_negation_keeps_intensity_outside_negation():
+    assert emotion_tag_to_tts("有点不开心") == ("sad", 1.0)
+
+
+@pytest.mark.parametrize("tag", ["不难过", "not sad", "不害怕"])
+def test_negated_negative_emotion_is_neutral(tag):
+    assert emotion_tag_to_tts(tag) == ("neutral", 3.0)
+
+
+def test_keyword_starting_with_negation_char_is_not_negated():
+    # "不安"本身是情绪关键词，不应视为对"安"的否定
+    assert emotion_tag_to_tts("不安") == ("neutral", 2.0)
+    assert emotion_tag_to_tts("有些不安") == ("neutral", 2.0)
@@ -0,0 +1,106 @@
+"""会话亲和路由（session_affinity）的故障转移"""
+
+import asyncio
+import json
+import socket
+
+import pytest
+
+from session_affinity import AffinityProxy, AffinityRouter, routing_key
+
+NODES = ["http://10.0.0.1:6001", "http://10.0.0.2:6001", "http://10.0.0.3:6001"]
+
+
+def key_owned_by(router: AffinityRouter, node: str) -> str:
+    for index in range(1000):
+        key = routing_key(session_id=f"session_{index}")
+        if router.ring.get_node(key) == node:
+            return key
+    raise AssertionError(f"找不到归属 {node} 的会话")
+
+
+def test_candidates_walk_ring_successors():
+    router = AffinityRouter(NODES, vnodes=64)
+    key = key_owned_by(router, NODES[0])
+    candidates = router.candidates(key)
+    assert candidates[0] == NODES[0]
+    assert sorted(candidates) == sorted(NODES)
+    assert candidates == list(router.ring.iter_nodes(key))
+
+
+def test_ejected_primary_moves_to_end():
+    router = AffinityRouter(NODES, vnodes=64, fail_threshold=2)
+    key = key_owned_by(router, NODES[0])
+    ring_order = list(router.ring.iter_nodes(key))
+    router.mark_failure(NODES[0])
+    assert router.route(key) == NODES[0]  # 未达阈值不摘除
+    router.mark_failure(NODES[0])
+    assert router.candidates(key) == ring_order[1:] + [NODES[0]]
+    assert router.route(key) == ring_order[1]
+
+
+def test_all_ejected_still_returns_primary():
+    router = AffinityRouter(NODES, vnodes=64, fail_threshold=1)
+    key = key_owned_by(router, NODES[1])
+    for node in NODES:
+        router.mark_failure(node)
+    assert router.route(key) == NODES[1]
+    assert len(router.candidates(key)) == len(NODES)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_proxy_fails_over_when_primary_node_is_down():
+    aiohttp = pytest.importorskip("aiohttp")
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+
+    async def scenario():
+        async def backend_handler(request):
+            return web.json_response({"node": "up"})
+
+        backend_app = web.Application()
+        backend_app.router.add_route("*", "/{tail:.*}", backend_handler)
+        backend = TestServer(backend_app, host="127.0.0.1")
+        await backend.start_server()
+        up_node = str(backend.make_url("")).rstrip("/")
+        down_node = f"http://127.0.0.1:{_free_port()}"  # 没有进程监听：连接被拒绝
+
+        router = AffinityRouter([down_node, up_node], vnodes=64, fail_threshold=5)
+        key = key_owned_by(router, down_node)
+        proxy = AffinityProxy(router, health_interval=3600)
+        client = TestClient(TestServer(proxy.build_app()))
+        await client.start_server()
+        try:
+            response = await client.post("/chat", data=json.dumps({"session_id": key[2:], "message": "x"}))
+            assert response.status == 200
+            assert response.headers["X-Upstream-Node"] == up_node
+            assert await response.json() == {"node": "up"}
+            assert router.stats()["failures"].get(down_node, 0) >= 1
+        finally:
+            await client.close()
+            await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_proxy_does_not_forward_admin_paths():
+    pytest.importorskip("aiohttp")
+    from aiohttp.test_utils import TestClient, TestServer
+
+    async def scenario():
+        router = AffinityRouter(["http://127.0.0.1:9"], vnodes=8)
+        client = TestClient(TestServer(AffinityProxy(router, health_interval=3600).build_app()))
+        await client.start_server()
+        try:
+            response = await client.post("/admin/drain", headers={"X-Admin-Token": "secret"})
+            assert response.status == 403
+            assert "X-Upstream-Node" not in response.headers  # 没有转发到后端
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
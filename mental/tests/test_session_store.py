@@ -0,0 +1,70 @@
+"""内存会话存储（session_store.SessionStore）的时间轮过期"""
+
+import pytest
+
+import session_store
+from session_store import SessionStore
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(session_store.time, "monotonic", fake)
+    return fake
+
+
+def make_store(clock, idle_ttl=20.0):
+    # 一圈 = 8个tick × 1秒，TTL为2.5圈
+    return SessionStore(max_sessions=100, idle_ttl=idle_ttl, wheel_tick=1.0, wheel_slots=8)
+
+
+def test_ttl_longer_than_one_rotation_expires(clock):
+    store = make_store(clock)
+    store.bind("s1", "u1", "conv_1234567890")
+    for step in range(1, 20):
+        clock.now = 1000.0 + step
+        assert "s1" in store, f"{step}秒时不应过期"
+    clock.now = 1021.0
+    assert store.expire() == 1
+    assert "s1" not in store
+    assert store.get_session_id("conv_1234567890") is None
+
+
+def test_ttl_expires_after_idle_gap_longer_than_rotation(clock):
+    store = make_store(clock)
+    store.bind("s1", "u1", None)
+    clock.now = 1100.0  # 期间没有任何请求，时间轮一次推进超过一圈
+    assert store.expire() == 1
+    assert len(store) == 0
+
+
+def test_activity_extends_long_ttl(clock):
+    store = make_store(clock)
+    store.bind("s1", "u1", None)
+    clock.now = 1015.0
+    store.bind("s1", "u1", None)
+    clock.now = 1025.0
+    assert store.expire() == 0
+    assert "s1" in store
+    clock.now = 1036.0
+    assert store.expire() == 1
+
+
+def test_rebound_session_has_single_wheel_entry(clock):
+    store = make_store(clock, idle_ttl=16.0)
+    store.bind("s1", "u1", None)
+    store.remove("s1")
+    store.bind("s1", "u1", None)  # 到期tick与旧条目同槽
+    clock.now = 1009.0
+    store.expire()
+    assert sum(slot.count("s1") for slot in store._wheel) == 1
+    clock.now = 1017.0
+    assert store.expire() == 1
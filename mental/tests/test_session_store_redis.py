@@ -0,0 +1,164 @@
+"""Redis会话存储（session_store_redis.RedisSessionStore），使用fakeredis"""
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from session_store_redis import RedisSessionStore
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_store(server, **kwargs):
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    return RedisSessionStore(idle_ttl=3600, client=client, **kwargs)
+
+
+def test_bind_updates_forward_and_reverse_index(server):
+    store = make_store(server)
+    store.bind("s1", "u1", "conv_aaaaaaaaaa")
+    assert store.get("s1").conversation_id == "conv_aaaaaaaaaa"
+    assert store.get_session_id("conv_aaaaaaaaaa") == "s1"
+
+    store.bind("s1", "u1", "conv_bbbbbbbbbb")
+    assert store.get_session_id("conv_aaaaaaaaaa") is None
+    assert store.get_session_id("conv_bbbbbbbbbb") == "s1"
+
+
+def test_conversation_moves_to_new_session(server):
+    store = make_store(server)
+    store.bind("s1", "u1", "conv_aaaaaaaaaa")
+    store.bind("s2", "u1", "conv_aaaaaaaaaa")
+    assert store.get("s1") is None
+    assert store.get_session_id("conv_aaaaaaaaaa") == "s2"
+    assert len(store) == 1
+    assert store.conversation_count == 1
+
+
+def test_conversation_move_cleans_previous_owner_user_index(server):
+    store = make_store(server)
+    store.bind("s1", "u1", "conv_aaaaaaaaaa")
+    store.bind("s2", "u2", "conv_aaaaaaaaaa")
+    assert store.query(user_id="u1") == ([], None)
+    assert [record.session_id for record in store.query(user_id="u2")[0]] == ["s2"]
+    assert not store.redis.exists(store._user_key("u1"))  # 旧用户索引中的成员已移除
+
+
+def test_bind_retries_when_watched_key_changes(server):
+    store = make_store(server)
+    other = make_store(server)
+    write_binding = store._write_binding
+    calls = []
+
+    def racing_write(*args):
+        if not calls:
+            # 读取旧映射之后、事务提交之前，另一个worker把该conversation绑定给了s2
+            other.bind("s2", "u2", "conv_aaaaaaaaaa")
+        calls.append(args)
+        write_binding(*args)
+
+    store._write_binding = racing_write
+    store.bind("s1", "u1", "conv_aaaaaaaaaa")
+
+    assert store.bind_retries == 1
+    assert len(calls) == 2
+    assert calls[1][-2:] == ("s2", "u2")  # 重试时读到了新的归属session及其用户
+    assert store.get_session_id("conv_aaaaaaaaaa") == "s1"
+    assert other.get("s2") is None
+    assert len(store) == 1
+
+
+def test_local_cache_does_not_cache_misses(server):
+    store = make_store(server, local_cache_size=16, local_cache_ttl=60)
+    other = make_store(server)
+    assert store.get("s1") is None
+    other.bind("s1", "u1", "conv_aaaaaaaaaa")
+    record = store.get("s1")
+    assert record is not None and record.conversation_id == "conv_aaaaaaaaaa"
+
+
+def test_remove_clears_reverse_index(server):
+    store = make_store(server)
+    store.bind("s1", "u1", "conv_aaaaaaaaaa")
+    assert store.remove("s1").session_id == "s1"
+    assert store.get("s1") is None
+    assert store.get_session_id("conv_aaaaaaaaaa") is None
+    assert len(store) == 0
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_query_pages_through_equal_scores(server, monkeypatch, descending):
+    store = make_store(server)
+    monkeypatch.setattr("session_store_redis.time.time", lambda: 1_700_000_000.0)
+    for index in range(7):
+        store.bind(f"s{index}", "u1", None)  # 活动时间完全相同
+
+    seen, cursor = [], None
+    while True:
+        records, cursor = store.query(limit=3, cursor=cursor, descending=descending)
+        seen.extend(record.session_id for record in records)
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"s{index}" for index in range(7)]
+    assert len(seen) == 7
+
+
+def test_query_pages_through_equal_score_run_longer_than_batch(server, monkeypatch):
+    store = make_store(server)
+    monkeypatch.setattr("session_store_redis.time.time", lambda: 1_700_000_000.0)
+    for index in range(120):
+        store.bind(f"s{index:03d}", "u1", "conv_%010d" % index if index % 2 else None)
+
+    seen, cursor = [], None
+    while True:
+        records, cursor = store.query(has_conversation=False, limit=20, cursor=cursor)
+        seen.extend(record.session_id for record in records)
+        if cursor is None:
+            break
+    assert seen == [f"s{index:03d}" for index in range(118, -1, -2)]
+
+
+def test_query_rejects_invalid_cursor(server):
+    with pytest.raises(ValueError):
+        make_store(server).query(cursor="not-a-cursor")
+
+
+def test_slow_bind_does_not_block_event_loop(server, monkeypatch):
+    import asyncio
+    import time
+
+    import api_server
+    from bulkhead import Bulkhead
+
+    store = make_store(server)
+    write_binding = store._write_binding
+
+    def slow_write(*args):
+        time.sleep(0.3)  # 模拟一次缓慢的Redis往返
+        write_binding(*args)
+
+    store._write_binding = slow_write
+    monkeypatch.setitem(api_server.app_state, "session_store", store)
+    monkeypatch.setitem(api_server.app_state, "bulkheads", {"session": Bulkhead("session", 2, 4, 5)})
+
+    async def scenario():
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        await api_server._update_session_mapping("s1", "u1", "conv_aaaaaaaaaa")
+        ticking.cancel()
+        return ticks
+
+    ticks = asyncio.run(scenario())
+    assert store.get_session_id("conv_aaaaaaaaaa") == "s1"
+    assert len(ticks) >= 10
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.2
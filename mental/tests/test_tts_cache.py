@@ -0,0 +1,81 @@
+"""TTS音频缓存（tts_cache）与音频HTTP响应（audio_http）的磁盘命中"""
+
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from audio_http import audio_response
+from tts_cache import TTSAudioCache, cache_key, content_etag
+
+AUDIO = bytes(range(256)) * 40
+
+
+def disk_only_cache(tmp_path, **kwargs) -> TTSAudioCache:
+    # 内存层不收任何条目，命中只能来自磁盘层
+    return TTSAudioCache(memory_max_bytes=0, memory_max_item_bytes=0, disk_dir=str(tmp_path), **kwargs)
+
+
+def test_opened_file_survives_eviction(tmp_path):
+    cache = disk_only_cache(tmp_path, disk_max_bytes=len(AUDIO))
+    key = cache_key("你好", "voice")
+    cache.put(key, AUDIO)
+    data, path = cache.lookup(key)
+    assert data is None and path
+    handle = cache.open(key, path)
+
+    cache.put(cache_key("再见", "voice"), AUDIO)  # 超出磁盘容量，淘汰并删除上一条文件
+    assert not os.path.exists(path)
+    with handle:
+        assert handle.read() == AUDIO
+
+
+def test_open_after_eviction_is_a_miss(tmp_path):
+    cache = disk_only_cache(tmp_path)
+    key = cache_key("你好", "voice")
+    cache.put(key, AUDIO)
+    _, path = cache.lookup(key)
+    os.remove(path)
+    assert cache.open(key, path) is None
+    assert cache.lookup(key) == (None, None)
+    assert cache.stats()["disk_bytes"] == 0
+
+
+@pytest.fixture
+def served(tmp_path):
+    cache = disk_only_cache(tmp_path)
+    key = cache_key("你好", "voice")
+    cache.put(key, AUDIO)
+    app = FastAPI()
+
+    @app.get("/audio")
+    async def audio(request: Request):
+        _, path = cache.lookup(key)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:  # 恢复上一次请求中删除的文件
+                f.write(AUDIO)
+        handle = cache.open(key, path)
+        os.remove(path)  # 打开之后文件被删除：本次响应仍完整
+        return audio_response(request.headers, cache.etag(key), file=handle)
+
+    return TestClient(app)
+
+
+def test_file_response_full_and_range(served):
+    response = served.get("/audio")
+    assert response.status_code == 200
+    assert response.content == AUDIO
+    assert response.headers["content-length"] == str(len(AUDIO))
+
+
+def test_file_response_range(served):
+    response = served.get("/audio", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == AUDIO[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(AUDIO)}"
+
+
+def test_file_response_not_modified_and_unsatisfiable(served):
+    assert served.get("/audio", headers={"If-None-Match": content_etag(AUDIO)}).status_code == 304
+    assert served.get("/audio", headers={"Range": f"bytes={len(AUDIO)}-"}).status_code == 416
@@ -0,0 +1,172 @@
+"""异步TTS任务（tts_jobs）：回调地址校验与任务音频保留"""
+
+import asyncio
+import socket
+
+import pytest
+
+import tts_jobs
+from tts_jobs import CallbackRejected, TTSJob, TTSJobQueue, check_callback_url
+
+
+def resolve_to(monkeypatch, *addresses):
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET6 if ":" in a else socket.AF_INET, socket.SOCK_STREAM, 6, "", (a, port))
+                for a in addresses]
+    monkeypatch.setattr(tts_jobs.socket, "getaddrinfo", getaddrinfo)
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.0.0.5", "192.168.1.2", "169.254.169.254", "100.64.0.1",
+                                     "0.0.0.0", "::1", "fe80::1", "::ffff:127.0.0.1", "224.0.0.1"])
+def test_callback_to_internal_address_is_rejected(monkeypatch, address):
+    resolve_to(monkeypatch, address)
+    with pytest.raises(CallbackRejected):
+        check_callback_url("http://hooks.example.com/done")
+
+
+def test_callback_rejected_if_any_resolved_address_is_internal(monkeypatch):
+    resolve_to(monkeypatch, "93.184.216.34", "10.0.0.5")
+    with pytest.raises(CallbackRejected):
+        check_callback_url("https://hooks.example.com/done")
+
+
+def test_public_callback_is_allowed(monkeypatch):
+    resolve_to(monkeypatch, "93.184.216.34")
+    check_callback_url("https://hooks.example.com/done")
+
+
+def test_allowlist(monkeypatch):
+    resolve_to(monkeypatch, "93.184.216.34")
+    allowed = tts_jobs.parse_allowed_hosts("api.partner.com, .example.com")
+    check_callback_url("https://api.partner.com/done", allowed)
+    check_callback_url("https://hooks.example.com/done", allowed)
+    with pytest.raises(CallbackRejected):
+        check_callback_url("https://evil.com/done", allowed)
+    with pytest.raises(CallbackRejected):
+        check_callback_url("https://evilexample.com/done", allowed)
+
+
+@pytest.mark.parametrize("url", ["ftp://hooks.example.com/", "http:///path", "http://hooks.example.com:99999/"])
+def test_malformed_callback_is_rejected(url):
+    with pytest.raises(CallbackRejected):
+        check_callback_url(url)
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.is_redirect = 300 <= status_code < 400
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise tts_jobs.requests.HTTPError(str(self.status_code))
+
+
+def run_job(monkeypatch, callback_status=200, addresses=("93.184.216.34",)):
+    posts = []
+
+    def post(url, **kwargs):
+        posts.append(kwargs)
+        return FakeResponse(callback_status)
+
+    async def synthesize(job):
+        return b"audio", "miss"
+
+    async def main():
+        queue = TTSJobQueue(synthesize, workers=1)
+        queue.start()
+        job = queue.submit(TTSJob(task_id="t1", input="hi", voice_id="v", cache_key="k",
+                                  callback_url="https://hooks.example.com/done"))
+        await queue._queue.join()
+        await asyncio.sleep(0.05)  # 等待回调完成
+        await queue.stop(0)
+        return queue, job
+
+    resolve_to(monkeypatch, *addresses)
+    monkeypatch.setattr(tts_jobs.requests, "post", post)
+    queue, job = asyncio.run(main())
+    return queue, job, posts
+
+
+def test_job_keeps_audio_even_when_cached(monkeypatch):
+    queue, job, posts = run_job(monkeypatch)
+    assert job.status == "done"
+    assert job.audio == b"audio"
+    assert posts and posts[0]["allow_redirects"] is False
+
+
+def test_callback_redirect_is_not_followed(monkeypatch):
+    queue, job, posts = run_job(monkeypatch, callback_status=302)
+    assert len(posts) == 1
+    assert queue.callbacks_failed == 1
+
+
+def test_callback_rechecked_before_sending(monkeypatch):
+    queue, job, posts = run_job(monkeypatch, addresses=("127.0.0.1",))
+    assert posts == []
+    assert queue.callbacks_rejected == 1
+
+
+def test_retained_audio_is_capped_by_releasing_oldest():
+    async def synthesize(job):
+        return b"x" * 40, "miss"
+
+    async def main():
+        queue = TTSJobQueue(synthesize, workers=1, max_result_bytes=100)
+        queue.start()
+        jobs = [queue.submit(TTSJob(task_id=f"t{i}", input="hi", voice_id="v", cache_key=f"k{i}")) for i in range(3)]
+        await queue._queue.join()
+        await queue.stop(0)
+        return queue, jobs
+
+    queue, jobs = asyncio.run(main())
+    assert [job.status for job in jobs] == ["done"] * 3
+    assert jobs[0].audio is None  # 最早完成的任务的音频被释放，任务记录仍保留
+    assert jobs[1].audio == jobs[2].audio == b"x" * 40
+    assert queue.get("t0") is jobs[0]
+    assert queue.stats()["result_bytes"] == 80
+    assert queue.stats()["audio_released"] == 1
+
+
+def test_expired_jobs_purged_behind_a_running_job():
+    async def main():
+        gate = asyncio.Event()
+
+        async def synthesize(job):
+            if job.task_id == "slow":
+                await gate.wait()
+            return b"audio", "miss"
+
+        queue = TTSJobQueue(synthesize, workers=2, result_ttl=0.05)
+        queue.start()
+        queue.submit(TTSJob(task_id="slow", input="hi", voice_id="v", cache_key="k0"))
+        queue.submit(TTSJob(task_id="fast", input="hi", voice_id="v", cache_key="k1"))
+        await asyncio.sleep(0.2)
+        queue._purge()
+        tracked = set(queue._jobs)
+        result_bytes = queue.stats()["result_bytes"]
+        gate.set()
+        await queue.stop(1)
+        return tracked, result_bytes
+
+    tracked, result_bytes = asyncio.run(main())
+    assert tracked == {"slow"}  # 先提交的任务仍在执行，不阻塞清理之后已过期的任务
+    assert result_bytes == 0
+
+
+def test_finished_job_records_are_capped():
+    async def synthesize(job):
+        return b"audio", "miss"
+
+    async def main():
+        queue = TTSJobQueue(synthesize, workers=1, max_finished_jobs=2)
+        queue.start()
+        for i in range(4):
+            queue.submit(TTSJob(task_id=f"t{i}", input="hi", voice_id="v", cache_key=f"k{i}"))
+        await queue._queue.join()
+        await queue.stop(0)
+        return queue
+
+    queue = asyncio.run(main())
+    assert set(queue._jobs) == {"t2", "t3"}
+    assert queue.stats()["result_bytes"] == len(b"audio") * 2
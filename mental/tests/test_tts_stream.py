@@ -0,0 +1,98 @@
+"""TTS音频异步直通（tts_stream）：自适应缓冲的按时发送"""
+
+import asyncio
+import time
+
+import pytest
+
+from tts_stream import AsyncTTSStreamer, TTSAudioStream
+
+
+def stream_chunks(parts, flush_interval=0.05):
+    """上游按 (数据, 之后暂停秒数) 发送，返回 [(收到时间, 数据)]"""
+    pytest.importorskip("aiohttp")
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    async def scenario():
+        async def handler(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for data, pause in parts:
+                await response.write(data)
+                await asyncio.sleep(pause)
+            await response.write_eof()
+            return response
+
+        app = web.Application()
+        app.router.add_post("/speech", handler)
+        server = TestServer(app, host="127.0.0.1")
+        await server.start_server()
+        streamer = AsyncTTSStreamer(flush_interval=flush_interval)
+        await streamer.start()
+        received = []
+        try:
+            started = time.monotonic()
+            async for chunk in TTSAudioStream(streamer, str(server.make_url("/speech")), {}, {}):
+                received.append((time.monotonic() - started, chunk))
+        finally:
+            await streamer.close()
+            await server.close()
+        return streamer, received
+
+    return asyncio.run(scenario())
+
+
+def test_buffered_data_is_flushed_while_upstream_pauses():
+    streamer, received = stream_chunks([(b"a" * 100, 0.01), (b"b" * 100, 0.5), (b"c" * 100, 0)], flush_interval=0.1)
+    assert [chunk for _, chunk in received] == [b"a" * 100, b"b" * 100, b"c" * 100]
+    # 第二块在上游暂停期间按 flush_interval 发出，不等到第三块到达
+    assert received[1][0] < 0.4
+    assert received[2][0] >= 0.5
+    assert streamer.stats()["failed"] == 0
+
+
+def test_small_chunks_within_interval_are_coalesced():
+    streamer, received = stream_chunks([(b"a", 0.02)] + [(b"b", 0.001)] * 5, flush_interval=1.0)
+    assert [chunk for _, chunk in received] == [b"a", b"bbbbb"]
+
+
+def test_cancelled_consumer_counts_as_aborted():
+    pytest.importorskip("aiohttp")
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    async def scenario():
+        async def handler(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b"a" * 100)
+            await asyncio.sleep(5)  # 上游暂停：消费任务在等待数据时被取消
+            return response
+
+        app = web.Application()
+        app.router.add_post("/speech", handler)
+        server = TestServer(app, host="127.0.0.1")
+        await server.start_server()
+        streamer = AsyncTTSStreamer()
+        await streamer.start()
+        stream = TTSAudioStream(streamer, str(server.make_url("/speech")), {}, {})
+
+        async def consume():
+            async for _ in stream:
+                pass
+
+        try:
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return streamer.stats()
+        finally:
+            await streamer.close()
+            await server.close()
+
+    stats = asyncio.run(scenario())
+    assert stats["aborted"] == 1
+    assert stats["failed"] == 0
+    assert stats["active"] == 0
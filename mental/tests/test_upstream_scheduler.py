@@ -0,0 +1,175 @@
+"""上游调度（upstream_scheduler）：排队、取消与每用户上限"""
+
+import asyncio
+
+import pytest
+
+from upstream_scheduler import PRIORITY_BATCH, PRIORITY_STREAM, PRIORITY_SYNC, UpstreamScheduler, UserQueueFull
+
+WEIGHTS = {PRIORITY_STREAM: 4, PRIORITY_SYNC: 2, PRIORITY_BATCH: 1}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        scheduler = UpstreamScheduler(1, WEIGHTS, user_max_queue=2)
+        await scheduler.acquire(PRIORITY_SYNC, "holder")
+        waiters = [asyncio.create_task(scheduler.acquire(PRIORITY_SYNC, "alice")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(UserQueueFull):
+            await scheduler.acquire(PRIORITY_SYNC, "alice")
+
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        lane = scheduler.stats()["lanes"][PRIORITY_SYNC]
+        assert lane["waiting"] == 0
+        assert lane["waiting_users"] == 0
+
+        # 取消的请求不再占用排队名额
+        queued = [asyncio.create_task(scheduler.acquire(PRIORITY_SYNC, "alice")) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["lanes"][PRIORITY_SYNC]["waiting"] == 2
+        scheduler.release(PRIORITY_SYNC, "holder")
+        await queued[0]
+        scheduler.release(PRIORITY_SYNC, "alice")
+        await queued[1]
+        scheduler.release(PRIORITY_SYNC, "alice")
+        assert scheduler.in_flight == 0
+
+    run(scenario())
+
+
+def test_cancelled_head_waiter_is_skipped():
+    async def scenario():
+        scheduler = UpstreamScheduler(1, WEIGHTS)
+        await scheduler.acquire(PRIORITY_SYNC, "holder")
+        first = asyncio.create_task(scheduler.acquire(PRIORITY_SYNC, "alice"))
+        second = asyncio.create_task(scheduler.acquire(PRIORITY_SYNC, "bob"))
+        await asyncio.sleep(0)
+        first.cancel()
+        scheduler.release(PRIORITY_SYNC, "holder")  # 在取消处理完成之前分配名额
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, 1)
+        assert scheduler.in_flight == 1
+        assert scheduler.stats()["lanes"][PRIORITY_SYNC]["waiting"] == 0
+
+    run(scenario())
+
+
+def test_capped_user_does_not_block_other_users():
+    async def scenario():
+        scheduler = UpstreamScheduler(2, WEIGHTS, user_max_concurrency=1)
+        await scheduler.acquire(PRIORITY_SYNC, "alice")
+        alice = asyncio.create_task(scheduler.acquire(PRIORITY_SYNC, "alice"))
+        await asyncio.sleep(0)
+        assert not alice.done()  # 已达单用户并发上限
+        assert await asyncio.wait_for(scheduler.acquire(PRIORITY_SYNC, "bob"), 1) == 0.0
+
+        scheduler.release(PRIORITY_SYNC, "bob")
+        await asyncio.sleep(0)
+        assert not alice.done()
+        scheduler.release(PRIORITY_SYNC, "alice")
+        await asyncio.wait_for(alice, 1)
+        assert scheduler.stats()["lanes"][PRIORITY_SYNC]["waiting_users"] == 0
+
+    run(scenario())
+
+
+def test_users_share_slots_round_robin():
+    async def scenario():
+        scheduler = UpstreamScheduler(1, WEIGHTS)
+        await scheduler.acquire(PRIORITY_SYNC, "holder")
+        order = []
+
+        async def request(user):
+            await scheduler.acquire(PRIORITY_SYNC, user)
+            order.append(user)
+            scheduler.release(PRIORITY_SYNC, user)
+
+        tasks = [asyncio.create_task(request("noisy")) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("quiet")))
+        await asyncio.sleep(0)
+        scheduler.release(PRIORITY_SYNC, "holder")
+        await asyncio.gather(*tasks)
+        assert order.index("quiet") <= 1
+
+    run(scenario())
+
+
+def test_default_routes_schedule_batch_tts():
+    from config import PRIORITY_CONFIG
+    from upstream_scheduler import PriorityMiddleware, priority_routes
+
+    routes = priority_routes({"routes": PRIORITY_CONFIG["routes"]})
+    middleware = PriorityMiddleware(None, UpstreamScheduler(1, WEIGHTS), routes)
+    assert middleware.classify({"path": "/text-to-speech/batch", "headers": []}) == PRIORITY_BATCH
+    assert middleware.classify({"path": "/chat/stream", "headers": []}) == PRIORITY_STREAM
+    assert middleware.classify({"path": "/health", "headers": []}) is None
+
+
+def test_priority_header_can_only_lower_the_route_lane():
+    from upstream_scheduler import PriorityMiddleware
+
+    routes = {"/text-to-speech/batch": PRIORITY_BATCH, "/chat": PRIORITY_SYNC}
+    middleware = PriorityMiddleware(None, UpstreamScheduler(1, WEIGHTS), routes)
+
+    def classify(path, *headers):
+        return middleware.classify({"path": path, "headers": list(headers)})
+
+    assert classify("/text-to-speech/batch", (b"x-priority", b"interactive_stream")) == PRIORITY_BATCH
+    assert classify("/text-to-speech/batch", (b"x-priority", b"interactive_sync"),
+                    (b"x-priority-token", b"guess")) == PRIORITY_BATCH
+    assert classify("/chat", (b"x-priority", b"batch")) == PRIORITY_BATCH
+    assert classify("/chat", (b"x-priority", b"bogus")) == PRIORITY_SYNC
+
+
+def test_priority_raise_requires_configured_token():
+    from upstream_scheduler import PriorityMiddleware
+
+    middleware = PriorityMiddleware(None, UpstreamScheduler(1, WEIGHTS), {"/text-to-speech": PRIORITY_BATCH},
+                                    raise_token="s3cret")
+    scope = {"path": "/text-to-speech", "headers": [(b"x-priority", b"interactive_sync"), (b"x-priority-token", b"s3cret")]}
+    assert middleware.classify(scope) == PRIORITY_SYNC
+    scope["headers"][1] = (b"x-priority-token", b"wrong")
+    assert middleware.classify(scope) == PRIORITY_BATCH
+
+
+def test_user_id_lookup_reads_a_bounded_body_prefix():
+    from upstream_scheduler import USER_ID_BODY_LIMIT, PriorityMiddleware
+
+    middleware = PriorityMiddleware(None, UpstreamScheduler(1, WEIGHTS), {})
+    chunk = b"x" * (16 * 1024)
+
+    async def identify(body_chunks):
+        sent = [{"type": "http.request", "body": data, "more_body": i < len(body_chunks) - 1}
+                for i, data in enumerate(body_chunks)]
+        received = []
+
+        async def receive():
+            message = sent.pop(0)
+            received.append(message)
+            return message
+
+        user, replay = await middleware._identify_user({"headers": [], "client": ("10.0.0.1", 1)}, receive)
+        read_before_app = len(received)
+        body = b""
+        while True:
+            message = await replay()
+            body += message["body"]
+            if not message["more_body"]:
+                break
+        return user, read_before_app, body
+
+    small = b'{"user_id": "u1"}'
+    assert run(identify([small]))[0] == "u1"
+
+    chunks = [b'{"user_id": "u1", "pad": "'] + [chunk] * 10 + [b'"}']
+    user, read_before_app, body = run(identify(chunks))
+    assert user == "ip:10.0.0.1"
+    assert read_before_app <= USER_ID_BODY_LIMIT // len(chunk) + 2 < len(chunks)  # 超过上限后不再读取
+    assert body == b"".join(chunks)  # 下游仍能读到完整请求体
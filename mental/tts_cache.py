@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+TTS音频缓存（内容寻址，两级：内存LRU + 磁盘）
+核心功能：
+- 缓存键：规范化后的 (文本, voice_id, emotion, emotion_scale) 的 SHA-256，相同请求命中同一条音频
+- 内存层：按字节数限制的LRU，保存高频短音频（问候语、打卡提示）
+- 磁盘层：按总字节数限制的LRU目录（{key[:2]}/{key}.{扩展名}），原子写入，重启后扫描目录恢复索引；
+  命中时返回文件路径，调用方用 open() 立即打开后按句柄发送（之后被淘汰删除也不影响已打开的句柄；
+  文件在打开前已被删除时按未命中处理）
+- 磁盘命中的小文件提升到内存层
+- 固定条目（pin）：预合成的常用短语不参与内存层LRU淘汰，并写入磁盘层
+- 内容ETag：写入时计算音频内容的SHA-256，供 GET /audio/{key} 的条件请求与范围请求使用
+- 统计：内存/磁盘命中数、未命中数、命中率、节省的上游音频字节数，供 /metrics 查看
+"""
+
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+CACHE_KEY_VERSION = 1
+DEFAULT_EMOTION_SCALE = 4.0  # 与TTS客户端未传 emotion_scale 时的默认值一致
+DEFAULT_FORMAT = "mp3"
+AUDIO_EXTS = ("mp3", "ogg", "wav", "pcm")  # 磁盘层文件扩展名（与 coze_tts_client.AUDIO_FORMATS 对应）
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：NFC + 去掉首尾空白 + 连续空白合并为一个空格"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_etag(data: bytes) -> str:
+    """音频内容的强ETag（带引号）"""
+    return f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+
+
+def cache_key(text: str, voice_id: str, emotion: Optional[str] = None, emotion_scale: Optional[float] = None,
+              response_format: Optional[str] = None, sample_rate: Optional[int] = None) -> str:
+    """计算TTS请求的缓存键（默认输出格式 mp3 + 上游默认采样率时不计入格式，与早期写入的键一致）"""
+    payload = [
+        CACHE_KEY_VERSION,
+        normalize_text(text),
+        (voice_id or "").strip(),
+        (emotion or "").strip().lower(),
+        round(float(DEFAULT_EMOTION_SCALE if emotion_scale is None else emotion_scale), 2)
+    ]
+    if (response_format or DEFAULT_FORMAT) != DEFAULT_FORMAT or sample_rate:
+        payload += [response_format or DEFAULT_FORMAT, int(sample_rate or 0)]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """
+    两级TTS音频缓存（线程安全，可在舱壁线程中读写）
+    :param memory_max_bytes: 内存层总字节上限
+    :param memory_max_item_bytes: 可进入内存层的单条音频上限
+    :param disk_dir: 磁盘层目录（为空则不使用磁盘层）
+    :param disk_max_bytes: 磁盘层总字节上限
+    :param max_item_bytes: 可缓存的单条音频上限（更大的音频不缓存）
+    """
+
+    def __init__(self, memory_max_bytes: int = 64 * 1024 * 1024, memory_max_item_bytes: int = 1024 * 1024,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = 2 * 1024 * 1024 * 1024,
+                 max_item_bytes: int = 8 * 1024 * 1024):
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_max_item_bytes = memory_max_item_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.max_item_bytes = max_item_bytes
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小（按访问顺序）
+        self._disk_bytes = 0
+        self._pinned: Dict[str, bytes] = {}  # 固定条目（不计入内存层容量，不被淘汰）
+        self._etags: Dict[str, str] = {}  # key -> 内容ETag（写入时计算，磁盘恢复的条目首次使用时计算）
+        self._exts: Dict[str, str] = {}  # key -> 文件扩展名（仅记录非mp3的条目）
+
+        # 统计信息
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.stores = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # ==================== 磁盘层 ====================
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.{self._exts.get(key, DEFAULT_FORMAT)}")
+
+    def _forget(self, key: str):
+        """条目已从两层中移除：清理ETag与扩展名记录（需持有锁）"""
+        if key not in self._memory and key not in self._pinned and key not in self._disk:
+            self._etags.pop(key, None)
+            self._exts.pop(key, None)
+
+    def _load_disk_index(self):
+        """扫描磁盘目录恢复索引（按修改时间排序，最旧的先淘汰）"""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)  # 上次写入中断留下的临时文件
+                    continue
+                key, _, ext = name.rpartition(".")
+                if ext in AUDIO_EXTS:
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, key, stat.st_size))
+                    if ext != DEFAULT_FORMAT:
+                        self._exts[key] = ext
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            path = self._path(key)
+            self._forget(key)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _store_disk(self, key: str, data: bytes):
+        """写入磁盘文件并登记到索引（超出总大小时淘汰最久未用的文件）"""
+        self._write_disk(key, data)
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+                self._evict_disk()
+
+    # ==================== 内存层 ====================
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_max_item_bytes or key in self._memory or key in self._pinned:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._forget(evicted_key)
+
+    # ==================== 对外接口 ====================
+    def lookup(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        查找缓存：返回 (内存中的音频, 磁盘文件路径)，均为None表示未命中
+        磁盘命中时不读取文件内容，由调用方直接发送文件
+        """
+        with self._lock:
+            data = self._pinned.get(key)
+            if data is None:
+                data = self._memory.get(key)
+                if data is not None:
+                    self._memory.move_to_end(key)
+            if data is not None:
+                self.memory_hits += 1
+                self.bytes_saved += len(data)
+                return data, None
+            size = self._disk.get(key)
+            if size is not None:
+                self._disk.move_to_end(key)
+                self.disk_hits += 1
+                self.bytes_saved += size
+                return None, self._path(key)
+            self.misses += 1
+            return None, None
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """查找缓存并返回音频字节（磁盘命中时读取文件并提升到内存层；阻塞调用）"""
+        data, path = self.lookup(key)
+        if data is not None or path is None:
+            return data
+        return self.read(key, path)
+
+    def read(self, key: str, path: str) -> Optional[bytes]:
+        """读取 lookup() 返回的磁盘文件并提升到内存层（文件已被删除时返回None；阻塞调用）"""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._lost(key)
+            return None
+        with self._lock:
+            self._put_memory(key, data)
+        return data
+
+    def open(self, key: str, path: str) -> Optional[BinaryIO]:
+        """
+        打开 lookup() 返回的磁盘文件（阻塞调用）
+        返回的句柄在文件随后被淘汰删除时仍可读；文件已被删除时返回None（调用方按未命中处理）
+        """
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:
+            self._lost(key)
+            return None
+
+    def _lost(self, key: str):
+        """磁盘文件已不存在（被并发淘汰或外部删除）：从索引移除"""
+        with self._lock:
+            size = self._disk.pop(key, None)
+            if size is not None:
+                self._disk_bytes -= size
+
+    def promote(self, key: str, path: str):
+        """磁盘命中的小文件提升到内存层（阻塞调用）"""
+        try:
+            if os.path.getsize(path) > self.memory_max_item_bytes:
+                return
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        with self._lock:
+            self._put_memory(key, data)
+
+    def _remember(self, key: str, data: bytes, ext: str):
+        """记录条目的ETag与扩展名（需持有锁）"""
+        self._etags[key] = content_etag(data)
+        if ext != DEFAULT_FORMAT:
+            self._exts[key] = ext
+
+    def put(self, key: str, data: bytes, ext: str = DEFAULT_FORMAT):
+        """写入缓存（内存层 + 磁盘层；ext 为音频文件扩展名；阻塞调用，应在线程中执行）"""
+        if not data or len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            self._remember(key, data, ext)
+            self._put_memory(key, data)
+            self.stores += 1
+            known = key in self._disk
+        if self.disk_dir and not known:
+            self._store_disk(key, data)
+
+    def pin(self, key: str, data: bytes, ext: str = DEFAULT_FORMAT):
+        """固定条目：常驻内存、不参与LRU淘汰，同时写入磁盘层（重启后无需重新合成；阻塞调用）"""
+        if not data:
+            return
+        with self._lock:
+            self._remember(key, data, ext)
+            evicted = self._memory.pop(key, None)
+            if evicted is not None:
+                self._memory_bytes -= len(evicted)
+            self._pinned[key] = data
+            known = key in self._disk
+        if self.disk_dir and not known:
+            self._store_disk(key, data)
+
+    def etag(self, key: str) -> Optional[str]:
+        """条目内容的ETag（条目不存在时返回None；磁盘恢复的条目首次调用时读取文件计算，阻塞调用）"""
+        with self._lock:
+            etag = self._etags.get(key)
+            if etag:
+                return etag
+            data = self._pinned.get(key) or self._memory.get(key)
+            on_disk = key in self._disk
+        if data is None:
+            if not on_disk:
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+        etag = content_etag(data)
+        with self._lock:
+            self._etags[key] = etag
+        return etag
+
+    def ext(self, key: str) -> str:
+        """条目的音频文件扩展名（mp3 / ogg / wav / pcm）"""
+        return self._exts.get(key, DEFAULT_FORMAT)
+
+    def unpin(self, key: str):
+        """取消固定（条目不再常驻内存，磁盘层文件保留并按LRU淘汰）"""
+        with self._lock:
+            self._pinned.pop(key, None)
+            self._forget(key)
+
+    def is_pinned(self, key: str) -> bool:
+        return key in self._pinned
+
+    def pinned_keys(self) -> List[str]:
+        with self._lock:
+            return list(self._pinned)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "stores": self.stores,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "pinned_entries": len(self._pinned),
+                "pinned_bytes": sum(len(data) for data in self._pinned.values()),
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes
+            }
+
+
+def create_tts_cache(config: Dict[str, Any]) -> Optional[TTSAudioCache]:
+    """根据 TTS_CACHE_CONFIG 创建缓存（未启用时返回None）"""
+    if not config.get("enabled"):
+        return None
+    return TTSAudioCache(
+        memory_max_bytes=config["memory_max_bytes"],
+        memory_max_item_bytes=config["memory_max_item_bytes"],
+        disk_dir=config.get("disk_dir") or None,
+        disk_max_bytes=config["disk_max_bytes"],
+        max_item_bytes=config["max_item_bytes"]
+    )
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+异步TTS任务队列
+核心功能：
+- submit() 立即返回任务（task_id 沿用 /text-to-speech 生成的任务ID），合成由固定数量的后台协程完成
+- 队列有界：排队任务数达到上限时拒绝提交（JobQueueFull），由调用方返回503
+- 合成结果同时写入TTS音频缓存（供同步请求复用）并保存在任务记录中；任务记录中保留的音频总量受 max_result_bytes 限制，
+  超出时释放最早完成的任务的音频（之后从缓存读取，缓存也已淘汰时下载返回410）
+- 任务记录在完成后保留 result_ttl 秒（最多 max_finished_jobs 条，超出时删除最早完成的），过期后查询返回不存在；
+  按完成顺序清理，不受仍在执行的早期任务阻塞，并由后台定时执行
+- 可选回调：任务完成或失败后向 callback_url POST 任务状态（JSON）
+- 回调地址防SSRF：可配置主机白名单；提交时与回调前都解析主机，解析结果含回环/私有/链路本地等非公网地址时拒绝；
+  回调不跟随重定向
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+    status_code = 503
+
+
+class CallbackRejected(ValueError):
+    """回调地址不允许（由调用方按参数错误返回400）"""
+    status_code = 400
+
+
+def parse_allowed_hosts(value: str) -> Tuple[str, ...]:
+    """解析回调主机白名单（逗号分隔；以 . 开头的项匹配该域名的所有子域名）"""
+    return tuple(host.strip().lower().rstrip(".") for host in value.split(",") if host.strip())
+
+
+def _host_allowed(host: str, allowed_hosts: Tuple[str, ...]) -> bool:
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in allowed_hosts)
+
+
+def check_callback_url(url: str, allowed_hosts: Tuple[str, ...] = ()):
+    """
+    校验回调地址（阻塞调用：会解析DNS），不允许时抛出 CallbackRejected
+    - 只允许 http/https；配置了白名单时主机必须在白名单内
+    - 主机解析出的任一地址不是公网地址（回环、私有、链路本地、保留、组播等）时拒绝
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise CallbackRejected("callback_url 格式错误")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CallbackRejected("callback_url 必须是 http/https 地址")
+    host = parts.hostname.lower().rstrip(".")
+    if allowed_hosts and not _host_allowed(host, allowed_hosts):
+        raise CallbackRejected(f"callback_url 主机不在白名单内：{host}")
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise CallbackRejected(f"callback_url 主机无法解析：{host}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        mapped = getattr(address, "ipv4_mapped", None)
+        if mapped is not None:
+            address = mapped
+        if not address.is_global or address.is_multicast:
+            raise CallbackRejected(f"callback_url 不允许指向内网或保留地址：{host}")
+
+
+@dataclass
+class TTSJob:
+    """异步TTS任务"""
+    task_id: str
+    input: str
+    voice_id: str
+    emotion: Optional[str] = None
+    emotion_scale: Optional[float] = None
+    response_format: str = "mp3"
+    sample_rate: Optional[int] = None
+    cache_key: Optional[str] = None  # 结果写入的缓存键（未启用缓存时为None）
+    callback_url: Optional[str] = None
+    status: str = "queued"  # queued / running / done / failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cache: Optional[str] = None  # 合成时的缓存状态（hit-memory / hit-disk / miss）
+    bytes: int = 0
+    audio: Optional[bytes] = None  # 合成结果（保留到任务记录过期）
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    status_code: Optional[int] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self, audio_url: Optional[str] = None) -> Dict[str, Any]:
+        """任务状态（不含音频内容）"""
+        data = {
+            "task_id": self.task_id,
+            "status": self.status,
+            "voice_id": self.voice_id,
+            "response_format": self.response_format,
+            "text_length": len(self.input.encode("utf-8")),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == "done":
+            data.update(audio_url=audio_url, bytes=self.bytes, cache=self.cache)
+        elif self.status == "failed":
+            data.update(error=self.error, error_type=self.error_type, status_code=self.status_code)
+        return data
+
+
+class TTSJobQueue:
+    """
+    有界异步TTS任务队列
+    :param run: 执行合成的协程函数，返回 (音频字节, 缓存状态)
+    :param workers: 后台合成协程数（同时进行的任务数）
+    :param queue_size: 最多排队的任务数
+    :param result_ttl: 任务完成后记录保留的秒数
+    :param callback_timeout: 回调请求超时（秒）
+    :param callback_allowed_hosts: 回调主机白名单（逗号分隔，为空不限主机，但仍拒绝非公网地址）
+    :param max_result_bytes: 任务记录中保留的音频总字节数上限
+    :param max_finished_jobs: 保留的已完成任务记录数上限
+    :param audio_url: 由 task_id 生成音频下载地址的函数（用于状态与回调）
+    """
+
+    def __init__(self, run: Callable[[TTSJob], Awaitable[Tuple[bytes, str]]], workers: int = 4,
+                 queue_size: int = 1000, result_ttl: float = 3600, callback_timeout: float = 5.0,
+                 callback_allowed_hosts: str = "", max_result_bytes: int = 256 * 1024 * 1024,
+                 max_finished_jobs: int = 10000,
+                 audio_url: Callable[[str], str] = lambda task_id: f"/text-to-speech/{task_id}/audio"):
+        self._run = run
+        self.workers = max(1, workers)
+        self.result_ttl = result_ttl
+        self.callback_timeout = callback_timeout
+        self.callback_allowed_hosts = parse_allowed_hosts(callback_allowed_hosts)
+        self.max_result_bytes = max(0, max_result_bytes)
+        self.max_finished_jobs = max(1, max_finished_jobs)
+        self.audio_url = audio_url
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._jobs: Dict[str, TTSJob] = {}
+        self._finished: "OrderedDict[str, TTSJob]" = OrderedDict()  # 已完成的任务，按完成顺序
+        self._with_audio: "OrderedDict[str, TTSJob]" = OrderedDict()  # 仍保留音频的任务，按完成顺序
+        self._result_bytes = 0
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._stopping = False
+
+        # 统计信息
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.callbacks_failed = 0
+        self.callbacks_rejected = 0
+        self.audio_released = 0
+
+    def start(self):
+        """启动后台合成协程与定时清理（需在事件循环中调用）"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(60.0, self.result_ttl / 2)))
+            self._purge()
+
+    def _release_audio(self, job: TTSJob):
+        if self._with_audio.pop(job.task_id, None) is not None:
+            self._result_bytes -= len(job.audio)
+            job.audio = None
+
+    def _finish(self, job: TTSJob):
+        """记录任务完成：保留音频（超出总量上限时释放最早完成的任务的音频）与完成顺序"""
+        job.finished_at = time.time()
+        self._finished[job.task_id] = job
+        if job.audio is not None:
+            self._with_audio[job.task_id] = job
+            self._result_bytes += len(job.audio)
+        while self._result_bytes > self.max_result_bytes and self._with_audio:
+            oldest = next(iter(self._with_audio.values()))
+            self._release_audio(oldest)
+            self.audio_released += 1
+        self._purge()
+
+    def _purge(self):
+        """删除已过期或超出数量上限的已完成任务记录（按完成顺序，与仍在执行的任务无关）"""
+        now = time.time()
+        while self._finished:
+            job = next(iter(self._finished.values()))
+            if now - job.finished_at < self.result_ttl and len(self._finished) <= self.max_finished_jobs:
+                break
+            self._finished.popitem(last=False)
+            self._release_audio(job)
+            self._jobs.pop(job.task_id, None)
+
+    def submit(self, job: TTSJob) -> TTSJob:
+        """提交任务（队列满时抛出 JobQueueFull）"""
+        self._purge()
+        if self._stopping:
+            raise JobQueueFull("服务正在停机，不再接受TTS任务")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"TTS任务队列已满（{self._queue.maxsize}），请稍后重试")
+        self._jobs[job.task_id] = job
+        self.submitted += 1
+        return job
+
+    def check_callback(self, url: str):
+        """按白名单与地址规则校验回调地址（阻塞调用；不允许时抛出 CallbackRejected）"""
+        check_callback_url(url, self.callback_allowed_hosts)
+
+    def get(self, task_id: str) -> Optional[TTSJob]:
+        self._purge()
+        return self._jobs.get(task_id)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if self._stopping:
+                self._fail(job, "服务停机，任务未执行", "cancelled", 503)
+                self._finish(job)
+                self._queue.task_done()
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            self._running += 1
+            try:
+                audio, cache_state = await self._run(job)
+                job.bytes, job.cache, job.audio = len(audio), cache_state, audio
+                job.status = "done"
+                self.completed += 1
+            except asyncio.CancelledError:
+                self._fail(job, "服务停机，任务已取消", "cancelled", 503)
+                raise
+            except Exception as e:
+                self._fail(job, str(e), getattr(e, "kind", type(e).__name__),
+                           getattr(e, "status_code", 400 if isinstance(e, ValueError) else 500))
+                logger.warning(f"TTS任务失败 - task_id: {job.task_id}, error: {str(e)}")
+            finally:
+                self._running -= 1
+                self._finish(job)
+                self._queue.task_done()
+            if job.callback_url:
+                await self._notify(job)
+
+    def _fail(self, job: TTSJob, error: str, error_type: str, status_code: int):
+        job.status = "failed"
+        job.error, job.error_type, job.status_code = error, error_type, status_code
+        self.failed += 1
+
+    def _post_callback(self, job: TTSJob):
+        # 发送前重新解析校验（提交后DNS记录可能已改变）；不跟随重定向，3xx按失败处理
+        self.check_callback(job.callback_url)
+        response = requests.post(job.callback_url, json=job.to_dict(self.audio_url(job.task_id)),
+                                 timeout=self.callback_timeout, allow_redirects=False)
+        if response.is_redirect:
+            raise requests.HTTPError(f"回调返回重定向（{response.status_code}），不跟随", response=response)
+        response.raise_for_status()
+
+    async def _notify(self, job: TTSJob):
+        """回调通知（失败只记录日志，不重试）"""
+        try:
+            await asyncio.to_thread(self._post_callback, job)
+        except CallbackRejected as e:
+            self.callbacks_rejected += 1
+            logger.warning(f"TTS任务回调被拒绝 - task_id: {job.task_id}, error: {str(e)}")
+        except Exception as e:
+            self.callbacks_failed += 1
+            logger.warning(f"TTS任务回调失败 - task_id: {job.task_id}, error: {type(e).__name__}")
+
+    async def stop(self, timeout: float = 10.0):
+        """停止接受新任务：等待进行中的任务最多 timeout 秒，其余（含排队中的）标记为失败"""
+        self._stopping = True
+        if self._running:
+            deadline = time.monotonic() + timeout
+            while self._running and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._fail(job, "服务停机，任务未执行", "cancelled", 503)
+            self._finish(job)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "running": self._running,
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "callbacks_failed": self.callbacks_failed,
+            "callbacks_rejected": self.callbacks_rejected,
+            "tracked": len(self._jobs),
+            "result_bytes": self._result_bytes,
+            "audio_released": self.audio_released
+        }
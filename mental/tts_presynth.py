@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+常用短语TTS预合成
+核心功能：
+- 从短语清单（JSON）读取固定文本（问候语、打卡提示、兜底回复），展开为 文本 x 音色 x 情感 组合
+- 每条文本同时展开为 /chat/voice 语音流水线的切句结果（首句提前切分与整句切分，对应 VOICE_EAGER_FIRST 开关），
+  使其按句合成时同样命中（/turn 与 /text-to-speech 按整段文本命中）
+- 启动后延迟 delay 秒在后台合成一次，之后每隔 interval 秒重新读取清单并补齐缺失条目
+- 合成结果固定（pin）在TTS音频缓存中：常驻内存、不被LRU淘汰，并写入磁盘层；
+  重启后优先从磁盘层恢复，不再请求上游
+- 从清单中移除的短语会取消固定
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from tts_cache import TTSAudioCache, cache_key
+from voice_pipeline import SentenceSplitter, TTS_MAX_INPUT_BYTES
+
+logger = logging.getLogger(__name__)
+
+# (文本, voice_id, emotion, emotion_scale)
+PhraseSpec = Tuple[str, str, Optional[str], Optional[float]]
+
+
+def _pipeline_segments(text: str, max_bytes: int) -> List[str]:
+    """/chat/voice 语音流水线对整段回复的切句结果（首句提前切分与整句切分两种方式）"""
+    segments: List[str] = []
+    for eager_first in (True, False):
+        splitter = SentenceSplitter(max_bytes=max_bytes, eager_first=eager_first)
+        segments.extend(splitter.feed(text) + splitter.flush())
+    return segments
+
+
+def load_phrase_manifest(path: str, default_voice_id: str, fallback_reply: Optional[str] = None,
+                         segment_bytes: int = TTS_MAX_INPUT_BYTES) -> List[PhraseSpec]:
+    """
+    读取短语清单并展开为去重后的合成条目
+    清单格式：
+    {
+        "voices": ["<voice_id>"],                                  # 默认音色（省略时使用 default_voice_id）
+        "emotions": [{"emotion": null}, {"emotion": "neutral", "emotion_scale": 3.0}],  # 默认情感组合
+        "include_fallback_reply": true,                            # 是否包含聊天兜底回复
+        "phrases": [{"text": "...", "voices": [...], "emotions": [...]}]  # 条目可覆盖默认音色/情感
+    }
+    """
+    if not os.path.exists(path):
+        logger.warning(f"TTS预合成清单不存在: {path}")
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    voices = manifest.get("voices") or [default_voice_id]
+    emotions = manifest.get("emotions") or [{"emotion": None}]
+    phrases = list(manifest.get("phrases", []))
+    if fallback_reply and manifest.get("include_fallback_reply", True):
+        phrases.append({"text": fallback_reply})
+
+    specs: Dict[PhraseSpec, None] = {}  # 保持顺序的去重
+    for phrase in phrases:
+        text = phrase["text"].strip()
+        if not text:
+            continue
+        texts = [text] + [segment for segment in _pipeline_segments(text, segment_bytes) if segment != text]
+        for voice_id in phrase.get("voices") or voices:
+            for option in phrase.get("emotions") or emotions:
+                emotion = option.get("emotion")
+                emotion_scale = option.get("emotion_scale", 4.0)
+                for item in texts:
+                    specs[(item, voice_id, emotion, emotion_scale)] = None
+    return list(specs)
+
+
+class PhrasePresynthesizer:
+    """
+    后台预合成常用短语并固定在音频缓存中
+    :param cache: TTS音频缓存
+    :param synthesize: 合成单条文本的协程函数 (text, voice_id, emotion, emotion_scale) -> 音频字节
+    :param load_specs: 读取（展开后的）短语清单的函数，每轮重新调用以支持修改清单
+    :param delay: 启动后延迟多少秒开始第一轮（避免与启动时的请求争抢上游）
+    :param interval: 两轮之间的间隔（秒，<=0只执行一次）
+    :param concurrency: 同时合成的条目数
+    """
+
+    def __init__(self, cache: TTSAudioCache, synthesize: Callable[[str, str, Optional[str], Optional[float]], Awaitable[bytes]],
+                 load_specs: Callable[[], List[PhraseSpec]], delay: float = 5.0, interval: float = 6 * 3600,
+                 concurrency: int = 2):
+        self.cache = cache
+        self._synthesize = synthesize
+        self._load_specs = load_specs
+        self.delay = delay
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.runs = 0
+        self.phrases = 0
+        self.synthesized = 0
+        self.restored = 0
+        self.failed = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        """启动后台预合成任务（需在事件循环中调用）"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        await asyncio.sleep(self.delay)
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"TTS预合成失败: {str(e)}", exc_info=True)
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def _ensure(self, spec: PhraseSpec, semaphore: asyncio.Semaphore, counts: Dict[str, int]):
+        key = cache_key(*spec)
+        if self.cache.is_pinned(key):
+            counts["pinned"] += 1
+            return
+        async with semaphore:
+            audio = await asyncio.to_thread(self.cache.get_bytes, key)  # 优先从磁盘层恢复
+            if audio is not None:
+                counts["restored"] += 1
+            else:
+                try:
+                    audio = await self._synthesize(*spec)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    counts["failed"] += 1
+                    logger.warning(f"TTS预合成条目失败 - text: {spec[0][:20]}..., voice_id: {spec[1]}, error: {str(e)}")
+                    return
+                counts["synthesized"] += 1
+            await asyncio.to_thread(self.cache.pin, key, audio)
+
+    async def run_once(self) -> Dict[str, Any]:
+        """执行一轮预合成：补齐清单中未固定的条目，取消已移出清单的条目"""
+        start = time.monotonic()
+        specs = await asyncio.to_thread(self._load_specs)
+        wanted = {cache_key(*spec) for spec in specs}
+        for key in self.cache.pinned_keys():
+            if key not in wanted:
+                self.cache.unpin(key)
+
+        counts = {"pinned": 0, "restored": 0, "synthesized": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._ensure(spec, semaphore, counts) for spec in specs))
+
+        self.runs += 1
+        self.phrases = len(specs)
+        self.synthesized += counts["synthesized"]
+        self.restored += counts["restored"]
+        self.failed += counts["failed"]
+        self.last_run = {**counts, "phrases": len(specs), "duration_ms": round((time.monotonic() - start) * 1000, 1),
+                         "finished_at": time.time()}
+        logger.info(f"TTS预合成完成: {self.last_run}")
+        return self.last_run
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "phrases": self.phrases,
+            "synthesized": self.synthesized,
+            "restored": self.restored,
+            "failed": self.failed,
+            "last_run": self.last_run
+        }
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+TTS音频异步直通
+核心功能：
+- 用 aiohttp 在事件循环中直接请求 Coze TTS，音频不经过线程池逐块中转（同步客户端每1KB一次线程切换）
+- 首个数据块收到后立即发出（降低首音延迟）；之后按自适应缓冲合并小块：目标块大小从 min_chunk 起每次发送后翻倍，
+  直到 max_chunk；距上次发送满 flush_interval 时不等凑满也发送（上游暂停发送时按超时发出已缓冲的数据）
+- 单个数据块直接转发 aiohttp 读到的 bytes 对象，只有多块合并时才拷贝一次
+- 统计：首字节延迟（上游）、吞吐（字节/秒）、每个流的发送次数
+- 同时进行的上游流数量受 max_streams 限制（等待名额，不拒绝；入口已有准入控制）
+- 未安装 aiohttp 时不可用（create_tts_streamer 返回None），调用方回退到同步客户端 + TTS舱壁线程池
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖：未安装时使用同步客户端
+    aiohttp = None
+
+from upstream_errors import UpstreamServerError, UpstreamTimeout, classify_status, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+OPERATION = "文本转语音（异步直通）"
+LATENCY_WINDOW = 256  # 计算首字节延迟分位数的最近流数
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class TTSAudioStream:
+    """
+    单次TTS上游音频流（异步迭代得到音频块）
+    首个音频块产出后 first_byte_ms 可用，流结束后 bytes_per_second 可用
+    """
+
+    def __init__(self, streamer: "AsyncTTSStreamer", url: str, headers: Dict[str, str], body: Dict[str, Any]):
+        self._streamer = streamer
+        self._url = url
+        self._headers = headers
+        self._body = body
+        self.started = time.monotonic()
+        self.first_byte_ms: Optional[float] = None
+        self.bytes = 0
+        self.writes = 0
+        self.duration_ms: Optional[float] = None
+
+    @property
+    def bytes_per_second(self) -> Optional[float]:
+        if not self.duration_ms:
+            return None
+        return round(self.bytes / (self.duration_ms / 1000), 1)
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[bytes]:
+        streamer = self._streamer
+        outcome = "failed"
+        async with streamer._slots:
+            streamer.streams += 1
+            streamer.active += 1
+            try:
+                async with streamer.session.post(self._url, headers=self._headers, json=self._body) as response:
+                    if response.status >= 400:
+                        raise classify_status(OPERATION, response.status, self._url,
+                                              retry_after=retry_after_seconds(response.headers))
+                    pending: List[bytes] = []
+                    pending_size = 0
+                    target = streamer.min_chunk
+                    last_flush = time.monotonic()
+                    read: Optional[asyncio.Future] = None
+                    try:
+                        while True:
+                            if read is None:
+                                read = asyncio.ensure_future(response.content.readany())
+                            if pending:
+                                # 有缓冲数据时最多等到距上次发送满 flush_interval：超时先发出已缓冲的数据，读取继续进行
+                                remaining = max(0.0, streamer.flush_interval - (time.monotonic() - last_flush))
+                                try:
+                                    data = await asyncio.wait_for(asyncio.shield(read), remaining)
+                                except asyncio.TimeoutError:
+                                    if not read.done():
+                                        chunk = pending[0] if len(pending) == 1 else b"".join(pending)
+                                        pending, pending_size, last_flush = [], 0, time.monotonic()
+                                        self.bytes += len(chunk)
+                                        self.writes += 1
+                                        yield chunk
+                                        continue
+                                    data = read.result()  # 读取恰好结束（或读取超时）：按读取结果处理
+                            else:
+                                data = await read
+                            read = None
+                            if not data:
+                                break
+                            if self.first_byte_ms is None:
+                                # 首个数据块：不等待缓冲，立即发出
+                                self.first_byte_ms = round((time.monotonic() - self.started) * 1000, 1)
+                                self.bytes += len(data)
+                                self.writes += 1
+                                last_flush = time.monotonic()
+                                yield data
+                                continue
+                            pending.append(data)
+                            pending_size += len(data)
+                            now = time.monotonic()
+                            if pending_size >= target or now - last_flush >= streamer.flush_interval:
+                                chunk = pending[0] if len(pending) == 1 else b"".join(pending)
+                                pending, pending_size, last_flush = [], 0, now
+                                target = min(streamer.max_chunk, target * 2)
+                                self.bytes += len(chunk)
+                                self.writes += 1
+                                yield chunk
+                    finally:
+                        if read is not None and not read.done():
+                            read.cancel()
+                    if pending:
+                        chunk = pending[0] if len(pending) == 1 else b"".join(pending)
+                        self.bytes += len(chunk)
+                        self.writes += 1
+                        yield chunk
+                outcome = "completed"
+            except (GeneratorExit, asyncio.CancelledError):
+                outcome = "aborted"  # 客户端断开（生成器被关闭，或消费任务在等待上游数据时被取消）
+                raise
+            except asyncio.TimeoutError as e:
+                raise UpstreamTimeout(OPERATION, "上游响应超时", self._url) from e
+            except aiohttp.ClientError as e:
+                raise UpstreamServerError(OPERATION, f"无法连接上游（{type(e).__name__}）", self._url) from e
+            finally:
+                self.duration_ms = round((time.monotonic() - self.started) * 1000, 1)
+                streamer._record(self, outcome)
+
+
+class AsyncTTSStreamer:
+    """
+    Coze TTS 异步直通客户端（共享一个 aiohttp 会话与连接池）
+    :param max_streams: 同时进行的上游流数量
+    :param min_chunk: 首块之后的初始目标块大小（字节）
+    :param max_chunk: 目标块大小上限（字节）
+    :param flush_interval: 缓冲最长等待时间（秒）
+    :param connect_timeout: 建立连接超时（秒）
+    :param read_timeout: 两次读取之间的超时（秒）
+    """
+
+    def __init__(self, max_streams: int = 16, min_chunk: int = 16 * 1024, max_chunk: int = 128 * 1024,
+                 flush_interval: float = 0.05, connect_timeout: float = 5.0, read_timeout: float = 30.0):
+        self.max_streams = max(1, max_streams)
+        self.min_chunk = max(1024, min_chunk)
+        self.max_chunk = max(self.min_chunk, max_chunk)
+        self.flush_interval = flush_interval
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session: Optional["aiohttp.ClientSession"] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # 统计信息
+        self.streams = 0
+        self.active = 0
+        self.failed = 0
+        self.aborted = 0
+        self.bytes = 0
+        self.writes = 0
+        self._first_byte_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._bytes_per_second: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self):
+        """创建 aiohttp 会话（需在事件循环中调用）"""
+        self._slots = asyncio.Semaphore(self.max_streams)
+        self.session = aiohttp.ClientSession(
+            # 与同步客户端一致：开发环境不校验证书（见 coze_tts_client.TLSAdapter）
+            connector=aiohttp.TCPConnector(limit=self.max_streams, ssl=False),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            auto_decompress=False
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    def open(self, coze_tts_client, input: str, voice_id: str, emotion: Optional[str] = None,
+             emotion_scale: Optional[float] = None, response_format: Optional[str] = None,
+             sample_rate: Optional[int] = None) -> TTSAudioStream:
+        """校验参数并创建音频流（参数错误立即抛出 ValueError；迭代时才请求上游）"""
+        body = coze_tts_client.build_speech_request(input, voice_id, emotion, emotion_scale, response_format, sample_rate)
+        return TTSAudioStream(self, coze_tts_client.tts_url, coze_tts_client._get_headers(), body)
+
+    def _record(self, stream: TTSAudioStream, outcome: str):
+        self.active -= 1
+        self.bytes += stream.bytes
+        self.writes += stream.writes
+        if stream.first_byte_ms is not None:
+            self._first_byte_ms.append(stream.first_byte_ms)
+        if outcome != "completed":
+            if outcome == "aborted":
+                self.aborted += 1
+            else:
+                self.failed += 1
+            return
+        if stream.bytes_per_second:
+            self._bytes_per_second.append(stream.bytes_per_second)
+
+    def stats(self) -> Dict[str, Any]:
+        first_byte = list(self._first_byte_ms)
+        return {
+            "streams": self.streams,
+            "active": self.active,
+            "failed": self.failed,
+            "aborted": self.aborted,
+            "bytes": self.bytes,
+            "avg_write_bytes": round(self.bytes / self.writes) if self.writes else None,
+            "first_byte_ms_p50": _percentile(first_byte, 0.5),
+            "first_byte_ms_p95": _percentile(first_byte, 0.95),
+            "bytes_per_second_p50": _percentile(list(self._bytes_per_second), 0.5)
+        }
+
+
+def create_tts_streamer(config: Dict[str, Any]) -> Optional[AsyncTTSStreamer]:
+    """根据配置创建异步直通客户端（未启用或未安装 aiohttp 时返回None）"""
+    if not config.get("enabled"):
+        return None
+    if aiohttp is None:
+        logger.warning("未安装aiohttp，TTS音频使用同步客户端（线程池）转发：pip install aiohttp")
+        return None
+    return AsyncTTSStreamer(
+        max_streams=config["max_streams"],
+        min_chunk=config["min_chunk"],
+        max_chunk=config["max_chunk"],
+        flush_interval=config["flush_interval"],
+        connect_timeout=config["connect_timeout"],
+        read_timeout=config["read_timeout"]
+    )
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+上游（Coze API）错误类型
+核心功能：
+- 按失败原因分类：超时 / 限流 / 鉴权失败 / 上游5xx（含连接失败）/ 请求被拒绝（其他4xx）/ 响应无效
+- 每个类型自带建议返回的HTTP状态码，处理函数按类型映射，无需解析错误字符串
+- 异常只保存结构化字段（操作、URL、上游状态码、业务code、响应对象），str() 为一行简短描述；
+  响应体预览只在调用 details(include_body=True) 时才读取且最多 BODY_PREVIEW_LIMIT 个字符，
+  原始异常与堆栈通过异常链（__cause__）保留，仅在记录日志时才格式化
+- 不记录请求头（含Bearer令牌）与请求体
+"""
+
+from typing import Any, Dict, Optional
+
+import requests
+
+BODY_PREVIEW_LIMIT = 500
+
+# Coze业务错误码 -> 错误类型名（其余非0业务码视为响应无效）
+COZE_AUTH_CODES = {4100, 4101}
+COZE_RATE_LIMIT_CODES = {4013}
+
+
+class UpstreamError(Exception):
+    """上游调用失败（status_code 为建议返回的HTTP状态码）"""
+    status_code = 502
+    kind = "upstream"
+
+    def __init__(self, operation: str, message: str, url: str = "", upstream_status: Optional[int] = None,
+                 code: Optional[int] = None, response: Optional[requests.Response] = None,
+                 retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.operation = operation
+        self.message = message
+        self.url = url.split("?", 1)[0]  # 查询参数中可能带会话ID，不记录
+        self.upstream_status = upstream_status
+        self.code = code
+        self.retry_after = retry_after
+        self._response = response
+
+    def __str__(self) -> str:
+        status = f"（上游状态码: {self.upstream_status}）" if self.upstream_status else ""
+        return f"{self.operation}失败：{self.message}{status}"
+
+    def _body_preview(self) -> Optional[str]:
+        response = self._response
+        if response is None:
+            return None
+        try:
+            if response._content_consumed:
+                return response.text[:BODY_PREVIEW_LIMIT]
+            # 流式响应：只读取开头一小段
+            head = next(response.iter_content(BODY_PREVIEW_LIMIT * 4), b"")
+            return head.decode(response.encoding or "utf-8", errors="replace")[:BODY_PREVIEW_LIMIT]
+        except Exception:
+            return None
+
+    def details(self, include_body: bool = False) -> Dict[str, Any]:
+        """结构化详情（用于日志）；include_body=True 时附带有长度上限的响应体预览"""
+        data = {
+            "kind": self.kind,
+            "operation": self.operation,
+            "url": self.url,
+            "upstream_status": self.upstream_status,
+            "code": self.code,
+            "cause": type(self.__cause__).__name__ if self.__cause__ else None
+        }
+        if include_body:
+            data["body"] = self._body_preview()
+        return data
+
+
+class UpstreamTimeout(UpstreamError):
+    """上游响应超时"""
+    status_code = 504
+    kind = "timeout"
+
+
+class UpstreamRateLimited(UpstreamError):
+    """上游限流（429 或限流业务码）"""
+    status_code = 429
+    kind = "rate_limited"
+
+
+class UpstreamAuthError(UpstreamError):
+    """上游鉴权失败（服务端令牌无效或缺少权限，客户端无法自行修复）"""
+    status_code = 502
+    kind = "auth"
+
+
+class UpstreamServerError(UpstreamError):
+    """上游5xx或无法连接"""
+    status_code = 502
+    kind = "upstream_5xx"
+
+
+class UpstreamBadRequest(UpstreamError):
+    """上游拒绝了请求参数（其他4xx，如音色ID无效）"""
+    status_code = 400
+    kind = "bad_request"
+
+
+class UpstreamBadResponse(UpstreamError):
+    """上游响应无法解析、业务码非0或缺少必要字段"""
+    status_code = 502
+    kind = "bad_response"
+
+
+def retry_after_seconds(headers) -> Optional[int]:
+    """解析响应头中的 Retry-After（秒；缺失或为日期格式时返回None）"""
+    try:
+        return max(1, int(float(headers.get("Retry-After", ""))))
+    except ValueError:
+        return None
+
+
+def classify_request_error(operation: str, error: requests.exceptions.RequestException, url: str = "") -> UpstreamError:
+    """把 requests 异常转换为对应的上游错误类型（调用方应使用 raise ... from error 保留原始异常）"""
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.exceptions.Timeout):
+        return UpstreamTimeout(operation, "上游响应超时", url)
+    if isinstance(error, requests.exceptions.JSONDecodeError):
+        return UpstreamBadResponse(operation, "上游响应不是有效的JSON", url,
+                                   response.status_code if response is not None else None, response=response)
+    if response is None:
+        return UpstreamServerError(operation, f"无法连接上游（{type(error).__name__}）", url)
+    return classify_status(operation, response.status_code, url, response=response, retry_after=retry_after_seconds(response.headers))
+
+
+def classify_status(operation: str, status: int, url: str = "", response: Optional[requests.Response] = None,
+                    retry_after: Optional[int] = None) -> UpstreamError:
+    """按上游HTTP错误状态码（>=400）返回对应的上游错误类型（也用于非requests的异步客户端）"""
+    if status == 429:
+        return UpstreamRateLimited(operation, "上游限流", url, status, response=response, retry_after=retry_after)
+    if status in (401, 403):
+        return UpstreamAuthError(operation, "上游鉴权失败（请检查COZE_API_TOKEN及其权限）", url, status, response=response)
+    if status >= 500:
+        return UpstreamServerError(operation, "上游服务异常", url, status, response=response)
+    return UpstreamBadRequest(operation, "上游拒绝了请求参数", url, status, response=response)
+
+
+def check_coze_result(operation: str, result: Dict[str, Any], url: str = ""):
+    """检查Coze响应的业务码，非0时抛出对应类型的错误"""
+    code = result.get("code")
+    if code == 0:
+        return
+    message = f"code={code}, msg={result.get('msg')}"
+    if code in COZE_AUTH_CODES:
+        raise UpstreamAuthError(operation, message, url, code=code)
+    if code in COZE_RATE_LIMIT_CODES:
+        raise UpstreamRateLimited(operation, message, url, code=code)
+    raise UpstreamBadResponse(operation, message, url, code=code)
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+上游调用调度：实时对话优先于批量任务 + 按用户公平分配
+核心功能：
+- 请求按优先级分为三条通道：interactive_stream（流式对话）/ interactive_sync（同步对话）/ batch（批量任务）
+  通道由路由决定；请求头（默认 X-Priority）只能把请求降到更低的通道，
+  提升通道需同时携带与配置一致的 X-Priority-Token（内部调用方使用，防止客户端自行插队）
+- 所有通道共享一组上游名额（upstream_slots），名额空出时按权重在有等待者的通道间平滑轮转分配
+- 防饥饿：任一通道队首等待超过 starvation_timeout 时优先获得下一个名额
+- 批量通道最多占用 batch_max_share 比例的名额，其余名额始终留给实时对话
+- 通道内按用户（租户头 / 用户ID / 客户端IP）做差额轮转（DRR）；请求体只读取前 64KB 查找 user_id，
+  更大的请求体按客户端IP计：每个用户一个子队列，
+  轮到时按请求成本扣减额度，单个用户的大量并发只会让自己排队更久
+- 每用户并发上限与排队上限：超出并发上限的请求在自己的子队列等待，排队也满时返回 429；
+  取消等待（客户端断开）的请求立即移出队列，不占排队名额
+- 达到并发上限的用户移出轮转、放入暂停表，名额归还后再放回；通道另按入队顺序记录等待者，
+  查找最早的可服务请求只看队首，每次获取/分配名额不随用户数线性增长
+说明：按请求粒度占用名额（流式响应在整个流结束后释放），与准入控制中间件配合使用：
+准入控制负责按路由拒绝过载请求，本调度器负责在已准入的请求之间分配上游容量
+"""
+
+import asyncio
+import hmac
+import json
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+PRIORITY_STREAM = "interactive_stream"
+PRIORITY_SYNC = "interactive_sync"
+PRIORITY_BATCH = "batch"
+PRIORITY_CLASSES = (PRIORITY_STREAM, PRIORITY_SYNC, PRIORITY_BATCH)
+
+# 按用户统计时最多跟踪的用户数（超出按LRU淘汰，避免指标无限增长）
+MAX_TRACKED_USERS = 10000
+# 为查找 user_id 最多读取的请求体字节数（超出后不再读取，按客户端IP识别用户）
+USER_ID_BODY_LIMIT = 64 * 1024
+# 提升通道所需的令牌请求头
+PRIORITY_TOKEN_HEADER = b"x-priority-token"
+
+
+class UserQueueFull(Exception):
+    """单个用户的排队数已达上限"""
+
+    def __init__(self, user: str, retry_after: int = 1):
+        super().__init__(user)
+        self.user = user
+        self.retry_after = retry_after
+
+
+class _UserQueue:
+    """通道内单个用户的子队列"""
+    __slots__ = ("waiters", "deficit", "in_turn")
+
+    def __init__(self):
+        self.waiters: Deque[Tuple[asyncio.Future, float, int]] = deque()  # (等待者, 入队时间, 成本)
+        self.deficit = 0  # DRR剩余额度
+        self.in_turn = False  # 是否正处于本轮服务中（本轮额度已发放）
+
+    def prune(self) -> int:
+        """丢弃队首已取消（尚未移出队列）的请求，返回丢弃数"""
+        pruned = 0
+        while self.waiters and self.waiters[0][0].done():
+            self.waiters.popleft()
+            pruned += 1
+        return pruned
+
+
+class _Lane:
+    """单个优先级通道（内部按用户DRR）"""
+
+    def __init__(self, name: str, weight: int, max_slots: int):
+        self.name = name
+        self.weight = max(1, weight)
+        self.max_slots = max(1, max_slots)
+        self.users: "OrderedDict[str, _UserQueue]" = OrderedDict()  # 可服务的有等待者用户，按轮转顺序
+        self.blocked: Dict[str, _UserQueue] = {}  # 有等待者但已达并发上限的用户
+        self.arrivals: Deque[Tuple[asyncio.Future, float, str]] = deque()  # 按入队顺序的等待者（已完成的惰性丢弃）
+        self.waiting = 0
+        self.in_flight = 0
+        self.credit = 0  # 平滑加权轮转的当前权值
+
+        # 统计信息
+        self.granted = 0
+        self.starvation_grants = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def queue_of(self, user: str) -> Optional[_UserQueue]:
+        return self.users.get(user) or self.blocked.get(user)
+
+    def drop_user(self, user: str):
+        """用户队列已空：移出轮转（额度不结转，DRR规则）"""
+        uq = self.users.pop(user, None) or self.blocked.pop(user, None)
+        if uq is not None:
+            uq.deficit, uq.in_turn = 0, False
+
+
+class UpstreamScheduler:
+    """
+    上游名额调度器
+    :param slots: 上游名额总数（同时进行的上游请求上限）
+    :param weights: {通道: 权重}
+    :param starvation_timeout: 队首等待超过该时间（秒）时优先分配
+    :param batch_max_share: 批量通道最多占用的名额比例
+    :param user_max_concurrency: 单个用户同时占用的名额上限（0表示不限）
+    :param user_max_queue: 单个用户的最大排队数（0表示不限，超出返回429）
+    :param quantum: DRR每轮发放的额度（应不小于最大请求成本）
+    """
+
+    def __init__(self, slots: int, weights: Dict[str, int], starvation_timeout: float = 5.0,
+                 batch_max_share: float = 0.5, user_max_concurrency: int = 0, user_max_queue: int = 0,
+                 quantum: int = 1):
+        self.slots = max(1, slots)
+        self.starvation_timeout = starvation_timeout
+        self.user_max_concurrency = user_max_concurrency
+        self.user_max_queue = user_max_queue
+        self.quantum = max(1, quantum)
+        self.in_flight = 0
+        self.lanes: Dict[str, _Lane] = {}
+        for name in PRIORITY_CLASSES:
+            max_slots = max(1, int(self.slots * batch_max_share)) if name == PRIORITY_BATCH else self.slots
+            self.lanes[name] = _Lane(name, weights.get(name, 1), max_slots)
+        self._user_in_flight: Dict[str, int] = {}
+        # 每用户统计：[已分配, 总等待秒数, 最大等待秒数, 被拒绝数]
+        self._user_stats: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    # ==================== 内部工具 ====================
+    def _user_capped(self, user: str) -> bool:
+        return bool(self.user_max_concurrency) and self._user_in_flight.get(user, 0) >= self.user_max_concurrency
+
+    def _user_stat(self, user: str) -> List[float]:
+        stat = self._user_stats.get(user)
+        if stat is None:
+            stat = self._user_stats[user] = [0, 0.0, 0.0, 0]
+            while len(self._user_stats) > MAX_TRACKED_USERS:
+                self._user_stats.popitem(last=False)
+        else:
+            self._user_stats.move_to_end(user)
+        return stat
+
+    def _ready_since(self, lane: _Lane) -> Optional[float]:
+        """通道内可立即服务的最早入队时间（无可服务请求时返回None）"""
+        if lane.in_flight >= lane.max_slots or not lane.users:
+            return None
+        arrivals = lane.arrivals
+        while arrivals and arrivals[0][0].done():
+            arrivals.popleft()  # 已分配或已取消
+        for waiter, enqueued_at, user in arrivals:
+            # 通常第一个即是；只有排在前面的用户都达到并发上限时才继续向后看
+            if user in lane.users and not waiter.done():
+                return enqueued_at
+        return None
+
+    def _pick_lane(self, now: float) -> Optional[_Lane]:
+        """选择下一个获得名额的通道：饥饿的通道优先，否则平滑加权轮转"""
+        ready = [(lane, since) for lane in self.lanes.values()
+                 for since in (self._ready_since(lane),) if since is not None]
+        if not ready:
+            return None
+        starving = [(lane, since) for lane, since in ready if now - since >= self.starvation_timeout]
+        if starving:
+            lane = min(starving, key=lambda item: item[1])[0]
+            lane.starvation_grants += 1
+            return lane
+        candidates = [lane for lane, _ in ready]
+        total = sum(lane.weight for lane in candidates)
+        for lane in candidates:
+            lane.credit += lane.weight
+        lane = max(candidates, key=lambda l: l.credit)
+        lane.credit -= total
+        return lane
+
+    def _pop_fair(self, lane: _Lane) -> Optional[Tuple[str, asyncio.Future, float, int]]:
+        """通道内按DRR取出下一个请求：轮到的用户发放quantum额度，额度够付队首成本则服务，否则轮到下一个用户"""
+        while lane.users:
+            user, uq = next(iter(lane.users.items()))
+            lane.waiting -= uq.prune()
+            if not uq.waiters:
+                lane.drop_user(user)
+                continue
+            if not uq.in_turn:
+                uq.deficit += self.quantum
+                uq.in_turn = True
+            waiter, enqueued_at, cost = uq.waiters[0]
+            if uq.deficit >= cost:
+                uq.waiters.popleft()
+                lane.waiting -= 1
+                uq.deficit -= cost
+                lane.waiting -= uq.prune()
+                if not uq.waiters:
+                    lane.drop_user(user)
+                return user, waiter, enqueued_at, cost
+            # 额度不足：本轮结束，额度结转到下一轮
+            uq.in_turn = False
+            lane.users.move_to_end(user)
+        return None
+
+    def _block_user(self, user: str):
+        """用户达到并发上限：在各通道中移出轮转"""
+        for lane in self.lanes.values():
+            uq = lane.users.pop(user, None)
+            if uq is not None:
+                lane.blocked[user] = uq
+
+    def _unblock_user(self, user: str):
+        """用户回到并发上限以下：放回各通道轮转末尾"""
+        for lane in self.lanes.values():
+            uq = lane.blocked.pop(user, None)
+            if uq is not None:
+                lane.users[user] = uq
+
+    def _discard(self, lane: _Lane, user: str, entry: Tuple[asyncio.Future, float, int]):
+        """移除已取消的等待者（可能已被分配流程跳过并丢弃）"""
+        uq = lane.queue_of(user)
+        if uq is None:
+            return
+        try:
+            uq.waiters.remove(entry)
+        except ValueError:
+            return
+        lane.waiting -= 1
+        if not uq.waiters:
+            lane.drop_user(user)
+
+    def _grant(self, lane: _Lane, user: str, enqueued_at: float, now: float):
+        waited = now - enqueued_at
+        lane.in_flight += 1
+        lane.granted += 1
+        lane.total_wait += waited
+        lane.max_wait = max(lane.max_wait, waited)
+        self.in_flight += 1
+        self._user_in_flight[user] = self._user_in_flight.get(user, 0) + 1
+        if self._user_capped(user):
+            self._block_user(user)
+        stat = self._user_stat(user)
+        stat[0] += 1
+        stat[1] += waited
+        stat[2] = max(stat[2], waited)
+
+    def _dispatch(self):
+        """把空闲名额分配给等待中的请求"""
+        now = time.monotonic()
+        while self.in_flight < self.slots:
+            lane = self._pick_lane(now)
+            if lane is None:
+                return
+            item = self._pop_fair(lane)
+            if item is None:
+                return
+            user, waiter, enqueued_at, _ = item
+            self._grant(lane, user, enqueued_at, now)
+            waiter.set_result(None)
+
+    # ==================== 对外接口 ====================
+    async def acquire(self, priority: str, user: str = "", cost: int = 1) -> float:
+        """获取一个上游名额，返回等待耗时（秒）；用户排队已满时抛出 UserQueueFull"""
+        lane = self.lanes[priority]
+        now = time.monotonic()
+        if self.in_flight < self.slots and not self._user_capped(user) \
+                and all(self._ready_since(l) is None for l in self.lanes.values()) \
+                and lane.in_flight < lane.max_slots:
+            self._grant(lane, user, now, now)
+            return 0.0
+        uq = lane.queue_of(user)
+        if uq is not None:
+            lane.waiting -= uq.prune()
+        if self.user_max_queue and uq is not None and len(uq.waiters) >= self.user_max_queue:
+            self._user_stat(user)[3] += 1
+            raise UserQueueFull(user)
+        if uq is None:
+            uq = _UserQueue()
+            if self._user_capped(user):
+                lane.blocked[user] = uq
+            else:
+                lane.users[user] = uq
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, now, max(1, cost))
+        uq.waiters.append(entry)
+        lane.arrivals.append((waiter, now, user))
+        lane.waiting += 1
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority, user)  # 名额已分配但请求已取消：归还
+            else:
+                self._discard(lane, user, entry)  # 仍在排队：移出队列，不再占排队名额
+            raise
+        return time.monotonic() - now
+
+    def release(self, priority: str, user: str = ""):
+        """归还名额并唤醒下一个等待者"""
+        self.lanes[priority].in_flight -= 1
+        self.in_flight -= 1
+        was_capped = self._user_capped(user)
+        remaining = self._user_in_flight.get(user, 0) - 1
+        if remaining > 0:
+            self._user_in_flight[user] = remaining
+        else:
+            self._user_in_flight.pop(user, None)
+        if was_capped and not self._user_capped(user):
+            self._unblock_user(user)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str, user: str = "", cost: int = 1):
+        """async with scheduler.slot(priority, user): 在名额内执行上游调用"""
+        await self.acquire(priority, user, cost)
+        try:
+            yield
+        finally:
+            self.release(priority, user)
+
+    def user_stats(self, top: int = 20) -> List[Dict[str, Any]]:
+        """按累计排队时间排序的用户统计（用于定位"吵闹"用户）"""
+        ranked = sorted(self._user_stats.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return [{
+            "user": user,
+            "in_flight": self._user_in_flight.get(user, 0),
+            "granted": int(granted),
+            "rejected": int(rejected),
+            "avg_queue_wait_ms": round(total_wait / granted * 1000, 1) if granted else 0.0,
+            "max_queue_wait_ms": round(max_wait * 1000, 1)
+        } for user, (granted, total_wait, max_wait, rejected) in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "in_flight": self.in_flight,
+            "user_max_concurrency": self.user_max_concurrency,
+            "user_max_queue": self.user_max_queue,
+            "lanes": {
+                name: {
+                    "weight": lane.weight,
+                    "max_slots": lane.max_slots,
+                    "in_flight": lane.in_flight,
+                    "waiting": lane.waiting,
+                    "waiting_users": len(lane.users) + len(lane.blocked),
+                    "granted": lane.granted,
+                    "starvation_grants": lane.starvation_grants,
+                    "avg_wait_ms": round(lane.total_wait / lane.granted * 1000, 1) if lane.granted else 0.0,
+                    "max_wait_ms": round(lane.max_wait * 1000, 1)
+                } for name, lane in self.lanes.items()
+            },
+            "users": self.user_stats()
+        }
+
+
+def _parse_mapping(spec: str) -> Dict[str, str]:
+    """解析 "key=value,key=value" 配置"""
+    result = {}
+    for item in spec.split(","):
+        key, sep, value = item.strip().partition("=")
+        if sep and key.strip():
+            result[key.strip()] = value.strip()
+    return result
+
+
+class PriorityMiddleware:
+    """
+    上游调度ASGI中间件：按路由/请求头确定通道、按租户头/用户ID确定公平队列，在整个请求期间占用一个上游名额
+    用法：app.add_middleware(PriorityMiddleware, scheduler=scheduler, routes=..., header=..., user_headers=..., costs=...)
+    """
+
+    def __init__(self, app, scheduler: UpstreamScheduler, routes: Dict[str, str], header: str = "X-Priority",
+                 user_headers: Tuple[str, ...] = ("X-Tenant-Id", "X-User-Id"), costs: Optional[Dict[str, int]] = None,
+                 raise_token: str = ""):
+        self.app = app
+        self.scheduler = scheduler
+        self.routes = routes
+        self.header = header.lower().encode("latin-1")
+        self.raise_token = raise_token.encode("latin-1")
+        self.user_headers = [h.lower().encode("latin-1") for h in user_headers]
+        self.costs = costs or {}
+
+    def classify(self, scope) -> Optional[str]:
+        """
+        确定请求的优先级通道（未纳入调度的路由返回None）
+        请求头只能降低路由的默认通道；提升通道需携带与 raise_token 一致的 X-Priority-Token（未配置时不允许提升）
+        """
+        default = self.routes.get(scope.get("path", ""))
+        if default is None:
+            return None
+        requested, token = None, None
+        for name, value in scope.get("headers", ()):
+            if name == self.header:
+                requested = value.decode("latin-1").strip().lower()
+            elif name == PRIORITY_TOKEN_HEADER:
+                token = value
+        if requested not in PRIORITY_CLASSES:
+            return default
+        if PRIORITY_CLASSES.index(requested) >= PRIORITY_CLASSES.index(default):
+            return requested
+        if self.raise_token and token is not None and hmac.compare_digest(token, self.raise_token):
+            return requested
+        return default
+
+    async def _identify_user(self, scope, receive):
+        """
+        确定公平队列的用户键：租户头/用户头 > JSON请求体中的user_id > 客户端IP
+        读取请求体时会缓存已读消息，并返回可重放的receive供下游使用；
+        请求体超过 USER_ID_BODY_LIMIT 时停止读取（其余部分由下游直接读取），按客户端IP识别
+        """
+        headers = dict(scope.get("headers", ()))
+        for name in self.user_headers:
+            value = headers.get(name)
+            if value:
+                return value.decode("latin-1").strip(), receive
+
+        messages, body, complete = [], b"", False
+        while len(body) <= USER_ID_BODY_LIMIT:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                complete = True
+                break
+
+        async def replay():
+            return messages.pop(0) if messages else await receive()
+
+        user = None
+        if complete and len(body) <= USER_ID_BODY_LIMIT and b"user_id" in body:
+            try:
+                data = json.loads(body)
+                if isinstance(data, dict) and data.get("user_id"):
+                    user = str(data["user_id"])
+            except (ValueError, UnicodeDecodeError):
+                pass
+        if user is None:
+            client = scope.get("client")
+            user = f"ip:{client[0]}" if client else "anonymous"
+        return user, replay
+
+    async def __call__(self, scope, receive, send):
+        priority = self.classify(scope) if scope["type"] == "http" else None
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        user, receive = await self._identify_user(scope, receive)
+        try:
+            await self.scheduler.acquire(priority, user, self.costs.get(scope.get("path", ""), 1))
+        except UserQueueFull as rejected:
+            await self._reject(send, rejected)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.scheduler.release(priority, user)
+
+    @staticmethod
+    async def _reject(send, rejected: UserQueueFull):
+        """返回429（格式与全局异常处理器一致）"""
+        body = json.dumps({
+            "error": "请求过于频繁，请稍后重试",
+            "status_code": 429,
+            "message": "该用户的排队请求数已达上限",
+            "timestamp": datetime.now().isoformat()
+        }, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejected.retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_priority_scheduler(config: Dict[str, Any]) -> Optional[UpstreamScheduler]:
+    """根据 PRIORITY_CONFIG 创建调度器（未启用时返回None）"""
+    if not config.get("enabled"):
+        return None
+    weights = {name: int(value) for name, value in _parse_mapping(config["weights"]).items()}
+    costs = route_costs(config)
+    return UpstreamScheduler(
+        config["upstream_slots"], weights, config["starvation_timeout"], config["batch_max_share"],
+        user_max_concurrency=config["user_max_concurrency"],
+        user_max_queue=config["user_max_queue"],
+        quantum=max([1] + list(costs.values()))
+    )
+
+
+def priority_routes(config: Dict[str, Any]) -> Dict[str, str]:
+    """路由 -> 默认通道映射（忽略未知通道名）"""
+    return {path: lane for path, lane in _parse_mapping(config["routes"]).items() if lane in PRIORITY_CLASSES}
+
+
+def route_costs(config: Dict[str, Any]) -> Dict[str, int]:
+    """路由 -> 公平调度成本（未列出的路由成本为1）"""
+    return {path: max(1, int(cost)) for path, cost in _parse_mapping(config["route_costs"]).items()}
+
+
+def user_headers(config: Dict[str, Any]) -> Tuple[str, ...]:
+    """用于识别用户/租户的请求头（按优先级）"""
+    return tuple(h.strip() for h in config["user_headers"].split(",") if h.strip())
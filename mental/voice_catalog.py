@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+TTS音色目录
+核心功能：
+- 启动后在后台拉取Coze音色列表（分页），之后每隔 refresh_interval 秒刷新；
+  拉取失败时保留当前目录，每隔 retry_interval 秒重试
+- 索引每个音色支持的情感（多情感音色的 support_emotions），validate() 在本地校验 voice_id 与 emotion 组合，
+  只做字典查找，不访问上游；目录尚未加载时不拦截，由上游校验
+- 目录快照写入本地文件，重启后在首次拉取完成前即可用于校验与 /voices
+- /voices 直接返回内存中的目录
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceValidationError(ValueError):
+    """音色不存在或不支持所请求的情感（由调用方按参数错误返回400）"""
+    status_code = 400
+    kind = "invalid_voice"
+
+
+@dataclass(frozen=True)
+class VoiceInfo:
+    """音色信息（字段取自Coze音色列表）"""
+    voice_id: str
+    name: str = ""
+    language_code: str = ""
+    language_name: str = ""
+    is_system_voice: bool = True
+    emotions: Tuple[str, ...] = ()  # 支持的情感（空表示非多情感音色）
+    preview_audio: str = ""
+    preview_text: str = ""
+
+    @classmethod
+    def from_coze(cls, item: Dict[str, Any]) -> "VoiceInfo":
+        """由Coze音色列表中的一项构建（support_emotions 为对象列表或字符串列表）"""
+        emotions = []
+        for option in item.get("support_emotions") or []:
+            emotion = option.get("emotion") if isinstance(option, dict) else option
+            if emotion:
+                emotions.append(str(emotion).strip().lower())
+        return cls(
+            voice_id=str(item["voice_id"]),
+            name=item.get("name") or "",
+            language_code=item.get("language_code") or "",
+            language_name=item.get("language_name") or "",
+            is_system_voice=bool(item.get("is_system_voice", True)),
+            emotions=tuple(emotions),
+            preview_audio=item.get("preview_audio") or "",
+            preview_text=item.get("preview_text") or ""
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["emotions"] = list(self.emotions)
+        return data
+
+
+class VoiceCatalog:
+    """
+    内存中的音色目录（定期从上游刷新）
+    :param fetch: 拉取音色列表的协程函数，返回Coze音色字典列表
+    :param refresh_interval: 刷新间隔（秒，<=0只在启动时拉取）
+    :param retry_interval: 拉取失败后的重试间隔（秒）
+    :param validate: 是否在本地拦截不存在的音色与不支持的情感
+    :param cache_file: 目录快照文件（为空则不持久化）
+    :param default_voice_id: 默认音色（目录中不存在时记录警告）
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[List[Dict[str, Any]]]], refresh_interval: float = 3600,
+                 retry_interval: float = 60, validate: bool = True, cache_file: Optional[str] = None,
+                 default_voice_id: Optional[str] = None):
+        self._fetch = fetch
+        self.refresh_interval = refresh_interval
+        self.retry_interval = max(1.0, retry_interval)
+        self.enforce = validate
+        self.cache_file = cache_file
+        self.default_voice_id = default_voice_id
+        self._voices: Dict[str, VoiceInfo] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.source: Optional[str] = None  # coze / snapshot
+        self.updated_at: Optional[float] = None
+
+        # 统计信息
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._voices)
+
+    def _install(self, voices: List[VoiceInfo], source: str, updated_at: float):
+        # 整体替换字典引用，读取方无需加锁
+        self._voices = {voice.voice_id: voice for voice in voices}
+        self.source = source
+        self.updated_at = updated_at
+        if self.default_voice_id and self.default_voice_id not in self._voices:
+            logger.warning(f"默认音色不在音色目录中: {self.default_voice_id}")
+
+    def load_snapshot(self):
+        """读取目录快照（阻塞调用；文件不存在或损坏时忽略）"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            voices = [VoiceInfo(**{**item, "emotions": tuple(item.get("emotions", ()))}) for item in snapshot["voices"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"音色目录快照无法读取，已忽略: {self.cache_file}, error: {str(e)}")
+            return
+        if voices:
+            self._install(voices, "snapshot", snapshot.get("updated_at") or time.time())
+            logger.info(f"音色目录已从快照恢复: {len(voices)}个音色")
+
+    def _save_snapshot(self):
+        """写入目录快照（先写临时文件再替换，阻塞调用）"""
+        snapshot = {"updated_at": self.updated_at, "voices": [voice.to_dict() for voice in self._voices.values()]}
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_file)
+
+    async def refresh(self) -> int:
+        """从上游拉取音色列表并替换目录，返回音色数"""
+        items = await self._fetch()
+        voices = [VoiceInfo.from_coze(item) for item in items if item.get("voice_id")]
+        if not voices:
+            raise ValueError("上游返回的音色列表为空")
+        self._install(voices, "coze", time.time())
+        self.refreshes += 1
+        self.last_error = None
+        if self.cache_file:
+            try:
+                await asyncio.to_thread(self._save_snapshot)
+            except OSError as e:
+                logger.warning(f"音色目录快照写入失败: {str(e)}")
+        logger.info(f"音色目录已刷新: {len(voices)}个音色，"
+                    f"其中多情感音色{sum(1 for voice in voices if voice.emotions)}个")
+        return len(voices)
+
+    def start(self):
+        """启动后台刷新任务（需在事件循环中调用）"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = self.refresh_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.refresh_failures += 1
+                self.last_error = str(e)
+                logger.warning(f"音色目录刷新失败（{self.retry_interval:.0f}秒后重试）: {str(e)}")
+                delay = self.retry_interval
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def get(self, voice_id: str) -> Optional[VoiceInfo]:
+        return self._voices.get(voice_id)
+
+    def supports(self, voice_id: str, emotion: Optional[str]) -> bool:
+        """音色是否支持该情感（目录未加载或音色未知时返回True，交给上游判断）"""
+        voice = self._voices.get(voice_id)
+        return voice is None or not emotion or emotion.strip().lower() in voice.emotions
+
+    def validate(self, voice_id: str, emotion: Optional[str] = None):
+        """本地校验音色与情感组合（不通过时抛出 VoiceValidationError；目录未加载或未启用校验时不拦截）"""
+        if not self.enforce or not self._voices:
+            return
+        voice = self._voices.get(voice_id)
+        if voice is None:
+            self.rejected += 1
+            raise VoiceValidationError(f"音色不存在：{voice_id}（可用音色见 GET /voices）")
+        if emotion and emotion.strip().lower() not in voice.emotions:
+            self.rejected += 1
+            supported = ", ".join(voice.emotions) or "无（非多情感音色，请省略emotion）"
+            raise VoiceValidationError(f"音色 {voice_id} 不支持情感 {emotion}，支持：{supported}")
+
+    def list(self, emotion: Optional[str] = None, language_code: Optional[str] = None) -> List[VoiceInfo]:
+        """按条件筛选音色（emotion：支持该情感；language_code：语言代码）"""
+        voices = self._voices.values()
+        if emotion:
+            emotion = emotion.strip().lower()
+            voices = [voice for voice in voices if emotion in voice.emotions]
+        if language_code:
+            voices = [voice for voice in voices if voice.language_code == language_code]
+        return list(voices)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "voices": len(self._voices),
+            "emotional_voices": sum(1 for voice in self._voices.values() if voice.emotions),
+            "source": self.source,
+            "updated_at": self.updated_at,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "rejected": self.rejected,
+            "last_error": self.last_error
+        }
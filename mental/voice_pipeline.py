@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+语音流水线工具：边生成回复边合成语音
+核心功能：
+- SentenceSplitter：把流式聊天增量切分为完整句子（兼容中英文标点）
+- OrderedTTSPipeline：按句并发调用TTS（并发数有上限），并严格按句子顺序回调结果
+- split_long_text / iter_ordered_synthesis：长文本一次性切分为多段，并发合成、按顺序逐段产出音频
+说明：TTS单次请求限制为UTF-8编码≤1024字节，超长句会在分句/空白/中文词边界（jieba，可选）处强制切分
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# 句末标点（中英文），遇到即可断句
+SENTENCE_END_CHARS = "。！？!?；;…\n"
+# 英文句点需要后跟空白才算句末（避免把 3.14 / e.g. 切断）
+AMBIGUOUS_END_CHARS = "."
+# 分句标点：仅在首句抢跑或超长强制切分时使用
+CLAUSE_END_CHARS = "，,、：:"
+# 紧跟在句末标点后的闭合符号，应归属上一句
+CLOSING_CHARS = "”’\"'」』）)】》"
+
+# Coze TTS单次请求的最大字节数（官方限制）
+TTS_MAX_INPUT_BYTES = 1024
+
+
+def _utf8_len(text: str) -> int:
+    """计算文本UTF-8字节长度"""
+    return len(text.encode("utf-8"))
+
+
+_jieba = None
+
+
+def _load_jieba():
+    """延迟导入jieba（首次切词时才加载词典；未安装时返回None，退回按字节硬切）"""
+    global _jieba
+    if _jieba is None:
+        try:
+            import jieba
+            jieba.setLogLevel(logging.WARNING)
+            _jieba = jieba
+        except ImportError:
+            _jieba = False
+    return _jieba or None
+
+
+def _word_boundary(text: str, limit: int) -> int:
+    """返回不超过limit（字符数）的最后一个中文词边界，找不到时返回0"""
+    jieba = _load_jieba()
+    if not jieba:
+        return 0
+    end = best = 0
+    for word in jieba.cut(text[:limit + 16]):  # 多取几个字符，避免把边界处的词切断
+        end += len(word)
+        if end > limit:
+            break
+        best = end
+    return best
+
+
+def _cut_by_bytes(text: str, max_bytes: int) -> int:
+    """返回不超过max_bytes字节的最长前缀长度（按字符计）"""
+    size = 0
+    for i, ch in enumerate(text):
+        size += len(ch.encode("utf-8"))
+        if size > max_bytes:
+            return i
+    return len(text)
+
+
+class SentenceSplitter:
+    """
+    流式分句器：逐段喂入增量文本，返回已经完整的句子
+    - 中文句末标点立即断句，英文句点需后跟空白
+    - eager_first=True 时首句在逗号等分句标点处提前切出，缩短首段音频等待时间
+    - 任一缓冲超过 max_bytes 时在分句标点/空白处强制切分，保证满足TTS字节限制
+    """
+
+    def __init__(self, max_bytes: int = TTS_MAX_INPUT_BYTES, eager_first: bool = True, min_chars: int = 2):
+        self.max_bytes = max_bytes
+        self.eager_first = eager_first
+        self.min_chars = min_chars  # 过短的片段（如单个标点）并入下一句
+        self._buffer = ""
+        self._emitted = 0
+
+    def _find_boundary(self, text: str) -> int:
+        """查找第一个断句位置（返回切分后首句的结束下标，-1表示无）"""
+        for i, ch in enumerate(text):
+            is_end = ch in SENTENCE_END_CHARS
+            if not is_end and ch in AMBIGUOUS_END_CHARS:
+                # 英文句点：必须确认下一个字符是空白，否则等待更多输入
+                is_end = i + 1 < len(text) and text[i + 1].isspace()
+            if not is_end and self.eager_first and self._emitted == 0:
+                is_end = ch in CLAUSE_END_CHARS
+            if not is_end:
+                continue
+            end = i + 1
+            while end < len(text) and (text[end] in CLOSING_CHARS or text[end] in SENTENCE_END_CHARS):
+                end += 1
+            if len(text[:end].strip()) >= self.min_chars:
+                return end
+        return -1
+
+    def _force_split(self, text: str) -> int:
+        """超长缓冲的强制切分点：优先分句标点，其次空白，再次中文词边界，最后按字节硬切"""
+        limit = _cut_by_bytes(text, self.max_bytes)
+        head = text[:limit]
+        for chars in (CLAUSE_END_CHARS, None):
+            for i in range(len(head) - 1, 0, -1):
+                if (chars and head[i] in chars) or (chars is None and head[i].isspace()):
+                    return i + 1
+        if limit < len(text):
+            return _word_boundary(text, limit) or max(limit, 1)
+        return max(limit, 1)
+
+    def feed(self, delta: str) -> List[str]:
+        """喂入增量文本，返回本次新产生的完整句子列表"""
+        self._buffer += delta
+        sentences = []
+        while self._buffer:
+            end = self._find_boundary(self._buffer)
+            if end < 0:
+                if _utf8_len(self._buffer) <= self.max_bytes:
+                    break
+                end = self._force_split(self._buffer)
+            elif _utf8_len(self._buffer[:end]) > self.max_bytes:
+                end = self._force_split(self._buffer[:end])
+            sentence = self._buffer[:end].strip()
+            self._buffer = self._buffer[end:]
+            if sentence:
+                sentences.append(sentence)
+                self._emitted += 1
+        return sentences
+
+    def flush(self) -> List[str]:
+        """流结束时调用：返回缓冲区中剩余的文本（按字节限制切分）"""
+        sentences = []
+        while self._buffer.strip():
+            end = len(self._buffer)
+            if _utf8_len(self._buffer) > self.max_bytes:
+                end = self._force_split(self._buffer)
+            sentence = self._buffer[:end].strip()
+            self._buffer = self._buffer[end:]
+            if sentence:
+                sentences.append(sentence)
+                self._emitted += 1
+        self._buffer = ""
+        return sentences
+
+
+@dataclass
+class SynthesizedSegment:
+    """单句语音合成结果"""
+    index: int
+    text: str
+    audio: Optional[bytes] = None
+    error: Optional[str] = None
+
+
+class OrderedTTSPipeline:
+    """
+    有序并发TTS流水线
+    - submit() 立即提交句子，后台按 max_concurrency 限制并发合成
+    - 合成完成后严格按提交顺序调用 on_segment（前一句未完成时后一句会等待）
+    - 单句失败不会中断流水线，以 error 字段回调
+    """
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], Awaitable[bytes]],
+        on_segment: Callable[[SynthesizedSegment], None],
+        max_concurrency: int = 3
+    ):
+        self._synthesize = synthesize
+        self._on_segment = on_segment
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._next_index = 0
+        self._next_emit = 0
+
+    @property
+    def submitted(self) -> int:
+        """已提交的句子数"""
+        return self._next_index
+
+    def submit(self, text: str) -> int:
+        """提交一句文本进行合成，返回句子序号"""
+        index = self._next_index
+        self._next_index += 1
+        task = asyncio.create_task(self._run(index, text))
+        self._tasks[index] = task
+        task.add_done_callback(lambda _task: self._emit_ready())
+        return index
+
+    async def _run(self, index: int, text: str) -> SynthesizedSegment:
+        """在并发上限内执行单句合成（asyncio.Semaphore先到先得，保证靠前的句子先拿到名额）"""
+        async with self._semaphore:
+            try:
+                audio = await self._synthesize(text)
+                return SynthesizedSegment(index=index, text=text, audio=audio)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return SynthesizedSegment(index=index, text=text, error=str(e))
+
+    def _emit_ready(self):
+        """按顺序回调所有已完成的句子"""
+        while self._next_emit in self._tasks and self._tasks[self._next_emit].done():
+            task = self._tasks.pop(self._next_emit)
+            self._next_emit += 1
+            if task.cancelled():
+                continue
+            self._on_segment(task.result())
+
+    async def join(self):
+        """等待所有已提交句子合成完成并回调"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._emit_ready()
+
+    async def aclose(self):
+        """取消尚未完成的合成任务（客户端断开时调用）"""
+        for task in self._tasks.values():
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+
+def split_long_text(text: str, max_bytes: int = TTS_MAX_INPUT_BYTES, target_bytes: Optional[int] = None) -> List[str]:
+    """
+    把任意长度文本切分为满足TTS字节限制的片段
+    - 先按句切分（超长句在分句标点/空白/中文词边界处切开）
+    - 再把相邻短句合并到 target_bytes 以内，减少上游请求数；首句保持独立，尽快产出第一段音频
+    """
+    splitter = SentenceSplitter(max_bytes=max_bytes, eager_first=False)
+    sentences = splitter.feed(text) + splitter.flush()
+    target = min(target_bytes or max_bytes, max_bytes)
+    segments: List[str] = []
+    for sentence in sentences:
+        if len(segments) > 1:
+            last = segments[-1]
+            # 英文片段之间补空格，中文直接拼接
+            joined = f"{last} {sentence}" if last[-1].isascii() and sentence[0].isascii() else last + sentence
+            if _utf8_len(joined) <= target:
+                segments[-1] = joined
+                continue
+        segments.append(sentence)
+    return segments
+
+
+async def iter_ordered_synthesis(
+    segments: List[str],
+    synthesize: Callable[[str], Awaitable[bytes]],
+    max_concurrency: int = 3
+) -> AsyncIterator[bytes]:
+    """
+    并发合成全部片段（并发数有上限），按片段顺序逐段产出音频
+    - 任一片段失败时抛出该片段的原始异常（调用方可按类型映射状态码）
+    - 迭代提前结束（客户端断开/出错）时取消尚未完成的合成
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(segment: str) -> bytes:
+        async with semaphore:
+            return await synthesize(segment)
+
+    # asyncio.Semaphore先到先得：按创建顺序拿到名额，靠前的片段先合成
+    tasks = [asyncio.create_task(run(segment)) for segment in segments]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        # 同时取回已失败片段的异常，避免 "Task exception was never retrieved"
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -28,6 +28,9 @@ BASE_URL = "https://api.coze.cn/open_api/v2/chat"
 # === 🔊 语音合成配置 ===
 VOICE_ID = os.getenv("COZE_VOICE_ID", "7468512265151692827")
 SPEECH_URL = "https://api.coze.cn/v1/audio/speech"
+# 输出格式 -> 文件扩展名（与 mental/coze_tts_client.AUDIO_FORMATS 一致）
+AUDIO_EXTENSIONS = {"mp3": "mp3", "ogg_opus": "ogg", "wav": "wav", "pcm": "pcm"}
+AUDIO_FORMAT = os.getenv("COZE_AUDIO_FORMAT", "mp3")  # 默认输出格式：mp3 / ogg_opus / wav / pcm
 
 # === 2️⃣ HTTP 头 ===
 headers = {
@@ -70,11 +73,26 @@ def _auto_play_audio(file_path: str) -> bool:
     return False
 
 
+def _choose_audio_format(output_file: Optional[str] = None) -> str:
+    """按保存文件的扩展名选择输出格式；未指定文件或扩展名未知时使用 COZE_AUDIO_FORMAT（无效时退回mp3）"""
+    if output_file:
+        extension = os.path.splitext(output_file)[1].lstrip(".").lower()
+        for response_format, format_extension in AUDIO_EXTENSIONS.items():
+            if extension == format_extension:
+                return response_format
+    if AUDIO_FORMAT in AUDIO_EXTENSIONS:
+        return AUDIO_FORMAT
+    print(f"⚠️ 无效的输出格式：{AUDIO_FORMAT}，支持：{', '.join(AUDIO_EXTENSIONS)}，已使用mp3")
+    return "mp3"
+
+
 def synthesize_speech(text: str, output_file: Optional[str] = None) -> None:
     clean_text = text.strip()
     if not clean_text:
         return
 
+    response_format = _choose_audio_format(output_file)
+
     headers_voice = {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json"
@@ -82,7 +100,7 @@ def synthesize_speech(text: str, output_file: Optional[str] = None) -> None:
     body = {
         "input": clean_text,
         "voice_id": VOICE_ID,
-        "response_format": "mp3"
+        "response_format": response_format
     }
 
     try:
@@ -100,7 +118,7 @@ def synthesize_speech(text: str, output_file: Optional[str] = None) -> None:
     try:
         target_path = output_file
         if not target_path:
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f".{AUDIO_EXTENSIONS[response_format]}")
             temp_path = tmp.name
             tmp.close()
             target_path = temp_path